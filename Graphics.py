@@ -1,6 +1,130 @@
+import functools
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import plotly.express as px
 import pandas as pd
 
+import instrumentacion as inst
+import metricas as met
+
+#Puntos máximos que se mandan al navegador por gráfica de líneas (entre todas las series)
+PRESUPUESTO_PUNTOS = 4000
+#Ninguna serie se reduce a menos de estos puntos, aunque haya muchas unidades
+PUNTOS_MIN_SERIE = 20
+#A partir de estos puntos la gráfica se dibuja con WebGL en lugar de SVG
+UMBRAL_WEBGL = 1000
+
+
+# D E C I M A C I Ó N   ( L T T B )
+
+#Largest-Triangle-Three-Buckets: índices de los `n` puntos que mejor conservan la forma
+def _lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    largo = len(x)
+    if n >= largo or n < 3:
+        return np.arange(largo)
+
+    #El primer y el último punto se conservan; el resto se reparte en n - 2 cubetas
+    bordes = np.linspace(1, largo - 1, n - 1).astype(int)
+    elegidos = np.empty(n, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, largo - 1
+    a = 0
+    for i in range(n - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        #Vértice "c" del triángulo: promedio de la cubeta siguiente (o el último punto)
+        if i < n - 3:
+            cx, cy = x[fin:bordes[i + 2]].mean(), y[fin:bordes[i + 2]].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (cy - y[a]))
+        a = ini + int(np.argmax(area))
+        elegidos[i + 1] = a
+    return elegidos
+
+
+def _decimar(df: pd.DataFrame, x: str, y: str, color: str | None = None,
+             presupuesto: int = PRESUPUESTO_PUNTOS) -> pd.DataFrame:
+    """
+    Reduce cada serie (una por `color`) con LTTB para que entre todas no pasen
+    de `presupuesto` puntos. Espera `df` ordenado por `x`; si ya cabe, lo
+    regresa tal cual.
+    """
+    series = [df] if color is None else [g for _, g in df.groupby(color, sort=False, observed=True)]
+    por_serie = max(PUNTOS_MIN_SERIE, presupuesto // max(1, len(series)))
+    if all(len(g) <= por_serie for g in series):
+        return df
+
+    partes = []
+    for g in series:
+        xs = pd.to_datetime(g[x]).to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+        partes.append(g.iloc[_lttb(xs, g[y].to_numpy(dtype=float), por_serie)])
+    return pd.concat(partes)
+
+
+def _modo_render(df: pd.DataFrame) -> str:
+    return 'webgl' if len(df) > UMBRAL_WEBGL else 'svg'
+
+
+# C A C H É   D E   F I G U R A S
+
+#Figuras ya construidas que se conservan (las menos usadas recientemente salen primero)
+MAX_FIGURAS = 64
+
+_figuras = OrderedDict()
+_candado_figuras = threading.Lock()
+
+
+#Huella barata del contenido de un DataFrame (valores, índice, columnas y tipos)
+def _huella(df: pd.DataFrame) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((list(df.columns), [str(t) for t in df.dtypes])).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _llave_parametro(valor):
+    if isinstance(valor, pd.DataFrame):
+        return ('df', _huella(valor))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_llave_parametro(v) for v in valor)
+    return repr(valor)
+
+
+def _memoizar(funcion):
+    """
+    Regresa la figura ya construida si la función se llamó antes con los
+    mismos datos (misma huella) y los mismos parámetros. La figura se comparte:
+    quien la reciba no debe modificarla.
+    """
+    firma = inspect.signature(funcion)
+
+    @functools.wraps(funcion)
+    def envuelta(*args, **kwargs):
+        parametros = firma.bind(*args, **kwargs)
+        parametros.apply_defaults()
+        llave = (funcion.__name__,) + tuple(
+            (nombre, _llave_parametro(valor)) for nombre, valor in parametros.arguments.items()
+        )
+
+        with _candado_figuras:
+            if llave in _figuras:
+                _figuras.move_to_end(llave)
+                met.cache('figuras', hits=1)
+                return _figuras[llave]
+        met.cache('figuras', misses=1)
+
+        resultado = funcion(*args, **kwargs)
+        with _candado_figuras:
+            _figuras[llave] = resultado
+            while len(_figuras) > MAX_FIGURAS:
+                _figuras.popitem(last=False)
+        return resultado
+
+    return envuelta
+
 
 #Importamos datasets prcesados para la construcción del gráfico
 
@@ -8,6 +132,8 @@ import pandas as pd
 # P A S A J E R O S    P O R   U N I D A D    Y   D I A.
 
 #Graficamos PUD (Pasajeros por unidad y día) en Histograma
+@inst.medir("graphics.pasajeros_unidad_dia")
+@_memoizar
 def pasajeros_unidad_dia(   #Argumentos
         df: pd.DataFrame, 
         unidades: list[str],
@@ -35,14 +161,18 @@ def pasajeros_unidad_dia(   #Argumentos
     #Ordenamos los datos
     df_filtrado = df_filtrado.sort_values(['Apertura de puerta','Unidad'])
 
+    #Para la gráfica solo mandamos los puntos que conservan la forma de cada serie
+    df_grafica = _decimar(df_filtrado, 'Apertura de puerta', valor, color='Unidad')
+
     #Grafico de lineas por unidad.
     fig = px.line(
-        df_filtrado,
+        df_grafica,
         x='Apertura de puerta',
         y = valor,
         color = 'Unidad',
         markers = True,
         title = f"{valor} por unidad y día.",
+        render_mode = _modo_render(df_grafica),
     )
 
     fig.update_layout(
@@ -63,6 +193,8 @@ def pasajeros_unidad_dia(   #Argumentos
 
 # K I L O M E T R A J E    P O R    U N I D A D    Y    D I A.
 
+@inst.medir("graphics.kilometros_unidad_dia")
+@_memoizar
 def kilometros_unidad_dia(
         df: pd.DataFrame,
         unidades: list[str],
@@ -118,12 +250,15 @@ def kilometros_unidad_dia(
 
 # P A S A J E R O S  P O R   U N I D A D   D I A   P R O M E D I O
 
+@inst.medir("graphics.pasajeros_por_unidad_dia_promedio")
+@_memoizar
 def pasajeros_por_unidad_dia_promedio(
         df: pd.DataFrame,
         valor: str,
 ):
     #Df organizado:
     df = df.sort_values(['Dia'])
+    df = _decimar(df, 'Dia', valor)
 
     #Configuración de la gráfica
     fig = px.line(
@@ -132,7 +267,8 @@ def pasajeros_por_unidad_dia_promedio(
         y = valor,
         markers=True,
         title = f"{valor} por día.",
-        color_discrete_sequence=["#D73E10"]
+        color_discrete_sequence=["#D73E10"],
+        render_mode = _modo_render(df),
     )
 
     fig.update_layout(
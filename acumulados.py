@@ -0,0 +1,145 @@
+     # A C U M U L A D O S   D I A R I O S
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+import ceiba_client as cbc
+import instrumentacion as inst
+import metricas as met
+import procesed as pcd
+
+#Base SQLite con una fila por (grupo, unidades+umbral, día) ya cerrada
+RUTA = Path(os.environ.get("INSITRA_ACUMULADOS", "datos/acumulados.sqlite"))
+
+#Columnas de salida (las mismas de construir_padp / construir_kipd)
+_COLUMNAS = {
+    "pasajeros": ("Total de ascensos", "unidades_activas"),
+    "kilometraje": ("Kilometraje", "Unidades Activas"),
+}
+
+
+@contextmanager
+def _conectar():
+    #Una conexión por uso: confirma al salir y siempre se cierra
+    RUTA.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(RUTA, timeout=10)
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        for tipo in _COLUMNAS:
+            con.execute(f"""
+                CREATE TABLE IF NOT EXISTS {tipo} (
+                    groupid  TEXT NOT NULL,
+                    huella   TEXT NOT NULL,
+                    dia      TEXT NOT NULL,
+                    total    REAL,
+                    activas  INTEGER,
+                    promedio REAL,
+                    PRIMARY KEY (groupid, huella, dia)
+                )""")
+        yield con
+        con.commit()
+    finally:
+        con.close()
+
+
+#Los acumulados dependen de qué unidades forman el grupo y del umbral de actividad
+def _huella(terids, umbral) -> str:
+    texto = ",".join(sorted(str(t) for t in terids)) + f"|{umbral}"
+    return hashlib.sha1(texto.encode()).hexdigest()
+
+
+def _dias(inicio: date, fin: date):
+    return [inicio + timedelta(days=i) for i in range((fin - inicio).days + 1)]
+
+
+def _guardados(tipo: str, groupid, huella: str, inicio: date, fin: date) -> dict:
+    #Días ya acumulados del rango: {dia: (total, activas, promedio)}
+    with _conectar() as con:
+        filas = con.execute(
+            f"SELECT dia, total, activas, promedio FROM {tipo} "
+            "WHERE groupid = ? AND huella = ? AND dia BETWEEN ? AND ?",
+            (str(groupid), huella, inicio.isoformat(), fin.isoformat()),
+        ).fetchall()
+    return {date.fromisoformat(dia): (total, activas, promedio) for dia, total, activas, promedio in filas}
+
+
+def dias_faltantes(tipo: str, groupid, terids: list, inicio: date, fin: date, umbral: int) -> list:
+    """
+    Días de [inicio, fin] que por_dia tendría que pedir con `cargar`: los que
+    no están acumulados y el día en curso. Sirve para pedirlos con anticipación.
+    """
+    guardados = _guardados(tipo, groupid, _huella(terids, umbral), inicio, fin)
+    hoy = cbc.hoy_ceiba()
+    return [d for d in _dias(inicio, fin) if d >= hoy or d not in guardados]
+
+
+@inst.medir("acumulados.por_dia")
+def por_dia(
+        tipo: str,
+        groupid,
+        terids: list,
+        inicio: date,
+        fin: date,
+        umbral: int,
+        cargar,
+):
+    """
+    Tabla por día de `tipo` ("pasajeros" o "kilometraje") en el formato de
+    construir_padp / construir_kipd, servida desde los acumulados guardados.
+    Solo se recalculan los días que faltan y el día en curso: `cargar(ini, fin)`
+    debe regresar (dataset crudo tipado de ese rango, cerrado_hasta), o None si
+    falló; cerrado_hasta es el último día cuyos datos se pidieron después de
+    que terminó (ver ventanas.datos_y_cierre). Solo esos días se guardan, una
+    sola vez. Retorna None si no se pudo cargar.
+    """
+    huella = _huella(terids, umbral)
+    col_total, col_activas = _COLUMNAS[tipo]
+    hoy = cbc.hoy_ceiba()
+
+    guardados = _guardados(tipo, groupid, huella, inicio, fin)
+
+    faltan = [d for d in _dias(inicio, fin) if d >= hoy or d not in guardados]
+    met.cache("acumulados", hits=len(_dias(inicio, fin)) - len(faltan), misses=len(faltan))
+    if faltan:
+        cargado = cargar(min(faltan), max(faltan))
+        if cargado is None:
+            return None
+        crudo, cerrado_hasta = cargado
+        if tipo == "pasajeros":
+            calculado = pcd.resumir_pasajeros(crudo, umbral).por_dia
+        else:
+            calculado = pcd.resumir_kilometraje(crudo, umbral).por_dia
+        nuevos = {
+            d: (float(t), int(a), float(p))
+            for d, t, a, p in zip(calculado['Dia'], calculado[col_total],
+                                  calculado[col_activas], calculado['Promedio por unidad'])
+        }
+
+        #Días sin datos se guardan con NULL para marcarlos como cerrados
+        for d in faltan:
+            guardados[d] = nuevos.get(d, (None, None, None))
+
+        #Un día que se cargó mientras seguía en curso puede estar incompleto: no se guarda
+        cerrados = [
+            (str(groupid), huella, d.isoformat(), *guardados[d])
+            for d in faltan if d < hoy and d <= cerrado_hasta
+        ]
+        if cerrados:
+            with _conectar() as con:
+                con.executemany(f"INSERT OR REPLACE INTO {tipo} VALUES (?, ?, ?, ?, ?, ?)", cerrados)
+
+    registros = [
+        {"Dia": d, col_total: t, col_activas: a, "Promedio por unidad": p}
+        for d, (t, a, p) in sorted(guardados.items())
+        if t is not None
+    ]
+    tabla = pd.DataFrame(registros, columns=["Dia", col_total, col_activas, "Promedio por unidad"])
+    tabla[col_activas] = tabla[col_activas].astype(int)
+    if tipo == "pasajeros":
+        tabla[col_total] = tabla[col_total].astype(int)
+    return tabla
@@ -0,0 +1,231 @@
+     # A L M A C É N   L O C A L   ( P A R Q U E T )
+import json
+import os
+import threading
+import uuid
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+#Raíz del almacén: {raiz}/{tipo}/grupo={groupid}/dia={AAAA-MM-DD}/parte-*.parquet
+RAIZ = Path(os.environ.get("INSITRA_ALMACEN", "datos/almacen"))
+
+#Partes por día a partir de las cuales se compacta automáticamente
+MAX_PARTES = 8
+
+#Tipo de dato -> endpoint de CEIBA del que sale
+ENDPOINTS = {
+    "pasajeros": "basic/passenger-count/detail",
+    "kilometraje": "basic/mileage/count",
+}
+
+#Esquemas en disco (las fechas se guardan tal como llegan de CEIBA)
+ESQUEMAS = {
+    "pasajeros": pa.schema([
+        ("terid", pa.string()),
+        ("opentime", pa.string()),
+        ("closetime", pa.string()),
+        ("on", pa.int32()),
+        ("off", pa.int32()),
+        ("lat", pa.float32()),
+        ("lng", pa.float32()),
+    ]),
+    "kilometraje": pa.schema([
+        ("terid", pa.string()),
+        ("starttime", pa.string()),
+        ("endtime", pa.string()),
+        ("mileage", pa.float32()),
+    ]),
+}
+
+#Metadato de cada parte con los terids que cubre (aunque no tengan filas ese día)
+_META_TERIDS = b"insitra.terids"
+
+_candado = threading.Lock()
+
+
+def tipo_de_endpoint(endpoint: str):
+    """Regresa el tipo de almacén de un endpoint, o None si no se almacena."""
+    for tipo, ep in ENDPOINTS.items():
+        if ep == endpoint.lstrip("/"):
+            return tipo
+    return None
+
+
+def _dir_grupo(tipo: str, groupid) -> Path:
+    return RAIZ / tipo / f"grupo={groupid}"
+
+
+def _dir_dia(tipo: str, groupid, dia: date) -> Path:
+    return _dir_grupo(tipo, groupid) / f"dia={dia.isoformat()}"
+
+
+def _partes(tipo: str, groupid, dia: date):
+    carpeta = _dir_dia(tipo, groupid, dia)
+    if not carpeta.is_dir():
+        return []
+    return sorted(carpeta.glob("parte-*.parquet"), key=lambda p: p.stat().st_mtime)
+
+
+def _terids_de_parte(ruta: Path) -> set:
+    meta = pq.read_schema(ruta).metadata or {}
+    return set(json.loads(meta.get(_META_TERIDS, b"[]")))
+
+
+#Convierte un bloque {columna: valores} al esquema en disco del tipo
+def _a_tabla(tipo: str, columnas: dict, terids) -> pa.Table:
+    esquema = ESQUEMAS[tipo]
+    n = len(next(iter(columnas.values()))) if columnas else 0
+
+    arreglos = []
+    for campo in esquema:
+        valores = columnas.get(campo.name)
+        if valores is None:
+            valores = [None] * n
+        elif pa.types.is_string(campo.type):
+            valores = [None if v is None else str(v) for v in valores]
+        arreglos.append(pa.array(valores, type=campo.type, from_pandas=True))
+
+    tabla = pa.Table.from_arrays(arreglos, schema=esquema)
+    #Ordenar por terid hace útiles las estadísticas por row group (predicate pushdown)
+    tabla = tabla.sort_by("terid")
+    meta = {_META_TERIDS: json.dumps(sorted(str(t) for t in terids)).encode()}
+    return tabla.replace_schema_metadata(meta)
+
+
+def _escribir(tabla: pa.Table, carpeta: Path, nombre: str):
+    #Escritura atómica: archivo temporal y luego rename
+    carpeta.mkdir(parents=True, exist_ok=True)
+    temporal = carpeta / f".{nombre}.tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, carpeta / nombre)
+
+
+# E S C R I T U R A
+
+def escribir_dia(tipo: str, groupid, dia: date, columnas: dict, terids, *, hoy: date) -> bool:
+    """
+    Guarda los datos de un día cerrado de `terids` (bloque {columna: valores})
+    como una nueva parte de la partición (grupo, día). Los terids que la
+    partición ya cubre se omiten, para que `leer` no cuente filas dos veces.
+    El día en curso (`hoy`, en la zona horaria de CEIBA) no se guarda porque
+    todavía cambia. Retorna True si se escribió.
+    """
+    if groupid is None or dia >= hoy or not terids:
+        return False
+
+    terids = {str(t) for t in terids}
+    tabla = _a_tabla(tipo, columnas, terids)
+    with _candado:
+        nuevos = terids - terids_cubiertos(tipo, groupid, dia)
+        if not nuevos:
+            return False
+        if nuevos != terids:
+            mascara = pc.is_in(tabla["terid"], value_set=pa.array(sorted(nuevos), type=pa.string()))
+            tabla = tabla.filter(mascara).replace_schema_metadata(
+                {_META_TERIDS: json.dumps(sorted(nuevos)).encode()}
+            )
+        _escribir(tabla, _dir_dia(tipo, groupid, dia), f"parte-{uuid.uuid4().hex}.parquet")
+        if len(_partes(tipo, groupid, dia)) > MAX_PARTES:
+            _compactar_dia(tipo, groupid, dia)
+    return True
+
+
+def _compactar_dia(tipo: str, groupid, dia: date):
+    partes = _partes(tipo, groupid, dia)
+    if len(partes) <= 1:
+        return
+
+    #Si un terid quedó en varias partes nos quedamos con la primera que lo cubrió
+    tablas = []
+    cubiertos = set()
+    for ruta in partes:
+        terids = _terids_de_parte(ruta) - cubiertos
+        if terids:
+            tabla = pq.read_table(ruta, schema=ESQUEMAS[tipo])
+            mascara = pc.is_in(tabla["terid"], value_set=pa.array(sorted(terids), type=pa.string()))
+            tablas.append(tabla.filter(mascara))
+            cubiertos |= terids
+
+    unida = pa.concat_tables(tablas) if tablas else ESQUEMAS[tipo].empty_table()
+    compacta = _a_tabla(tipo, unida.to_pydict(), cubiertos)
+    nombre = f"parte-{uuid.uuid4().hex}.parquet"
+    _escribir(compacta, _dir_dia(tipo, groupid, dia), nombre)
+    for ruta in partes:
+        ruta.unlink(missing_ok=True)
+
+
+def compactar(tipo: str, groupid, inicio: date | None = None, fin: date | None = None):
+    """
+    Junta las partes de cada día del grupo (opcionalmente solo en [inicio, fin])
+    en un solo archivo por día, sin filas repetidas por terid.
+    """
+    carpeta = _dir_grupo(tipo, groupid)
+    if not carpeta.is_dir():
+        return
+    with _candado:
+        for sub in sorted(carpeta.glob("dia=*")):
+            dia = date.fromisoformat(sub.name.split("=", 1)[1])
+            if (inicio and dia < inicio) or (fin and dia > fin):
+                continue
+            _compactar_dia(tipo, groupid, dia)
+
+
+# L E C T U R A
+
+def terids_cubiertos(tipo: str, groupid, dia: date) -> set:
+    """Terids cuyo día completo ya está en el almacén para esa partición."""
+    if groupid is None:
+        return set()
+    cubiertos = set()
+    for ruta in _partes(tipo, groupid, dia):
+        cubiertos |= _terids_de_parte(ruta)
+    return cubiertos
+
+
+def leer(
+        tipo: str,
+        groupid,
+        inicio: date,
+        fin: date,
+        terids=None,
+        columnas=None,
+) -> pa.Table:
+    """
+    Lee solo las particiones de [inicio, fin] del grupo y solo las `columnas`
+    pedidas; el filtro por terid se empuja al lector de Parquet.
+    """
+    esquema = ESQUEMAS[tipo]
+    columnas = list(columnas) if columnas else esquema.names
+    carpeta = _dir_grupo(tipo, groupid)
+    if not carpeta.is_dir():
+        return esquema.empty_table().select(columnas)
+
+    dataset = ds.dataset(
+        carpeta,
+        format="parquet",
+        schema=esquema.append(pa.field("dia", pa.string())),
+        partitioning=ds.partitioning(pa.schema([("dia", pa.string())]), flavor="hive"),
+        exclude_invalid_files=True,
+    )
+    filtro = (ds.field("dia") >= inicio.isoformat()) & (ds.field("dia") <= fin.isoformat())
+    if terids is not None:
+        filtro = filtro & ds.field("terid").isin([str(t) for t in terids])
+    return dataset.to_table(columns=columnas, filter=filtro)
+
+
+def leer_columnas(tipo: str, groupid, inicio: date, fin: date, terids=None, columnas=None) -> dict:
+    """Como `leer`, pero regresa {columna: valores} (NumPy para las numéricas)."""
+    tabla = leer(tipo, groupid, inicio, fin, terids=terids, columnas=columnas)
+    salida = {}
+    for nombre, col in zip(tabla.column_names, tabla.columns):
+        if pa.types.is_integer(col.type) or pa.types.is_floating(col.type):
+            salida[nombre] = np.asarray(col.to_numpy(zero_copy_only=False))
+        else:
+            salida[nombre] = col.to_pylist()
+    return salida
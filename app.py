@@ -1,14 +1,16 @@
 #Importamos utilidades del sistema
 import streamlit as st
-import pandas as pd
-from datetime import date, timedelta
+from datetime import timedelta
 
 
 #Improtamos utilidades propias de la aplicación
 import ceiba_client as cbc
-import procesed as pcd
+import ceiba_async as cba
+import acumulados as acu
+import ventanas as vent
 import graphics as graph
 import utilidades as util
+import instrumentacion as inst
 
 #Configuracion básica de la página
 st.set_page_config(
@@ -17,6 +19,9 @@ st.set_page_config(
     layout='wide'
 )
 
+#Tiempos de esta ejecución (panel de depuración con ?debug=1)
+inst.iniciar_rerun('Totales')
+
 #Requerimos el inicio de sesión.
 cbc.login()
 cbc.require_login()
@@ -39,11 +44,11 @@ st.title('INSITRA ANALYTICS: Totales 📊')
 #Seleccion de fechas para los KPIS
 
 #Tomamos automáticamente 6 dias
-date_presetg = date.today() - timedelta(days=6)
+date_presetg = cbc.hoy_ceiba() - timedelta(days=6)
 
 #Inicio y final
 iniciog = date_presetg
-finalg = date.today()
+finalg = cbc.hoy_ceiba()
 
 #Inicio y final en tupla
 rango_fechas_g = (iniciog,finalg)
@@ -51,65 +56,96 @@ rango_fechas_g = (iniciog,finalg)
 #Peticion de datos.
 
 
-st.header('Cifras del dia')
-
-#JSON pasajeros
-conteo_pasajerosg = {
-        "terid": terids_del_grupo,
-        "starttime": f"{iniciog} 00:00:00",
-        "endtime": f"{finalg} 23:59:59"
-        }
-
-#JSON kilometraje
-kilometrajeg = {
-        "terid": terids_del_grupo,
-        "starttime": f"{iniciog} 00:00:00",
-        "endtime": f"{finalg} 23:59:59"
-        }
-
-#Iniciamos la peticion P A S A J E R O S
-ok, payload, err = cbc.api_post('basic/passenger-count/detail',json=conteo_pasajerosg)
-
-#Construimos el dataset
-if ok:
-    conteog = pd.DataFrame(payload.get('data'))
-    kpigp = pcd.construir_padp(conteog,30)
-
-##Iniciamos la peticion K I L O M E T R O S
-ok, payload, err = cbc.api_post('basic/mileage/count',json=kilometrajeg)
-
-#Construimos el dataset
-if ok:
-    kilometrajeg = pd.DataFrame(payload.get('data'))
-    kpigk = pcd.construir_kipd(kilometrajeg,30)
-
-#Dataset's muestra
-
-st.dataframe(kpigp,use_container_width=True)
-
-# C O N S T R U C C I O N    D E L    K P I
-
-#KPI'S
-#Pasajeros actuales
-pasg_actuales = kpigp.iloc[-1,-3]
-#Pasajeros promedio por unidad actuales
-pasgp_actuales = kpigp.iloc[-1,-1]
-#kilometros actuales
-ktg = kpigk.iloc[-1,-3]
-#kilometros promedio por unidad
-kpg = kpigk.iloc[-1,-1]
-
-#KPI'S PROMEDIO COMPARATIVO
-#pasg_actuales_prom = kpigp[]
-
-
-row = st.container(horizontal=True)
-#Empiezan las divisiones.
-with row:
-    st.metric('Ascensos del dia'  , f'{pasg_actuales} Personas', border = True)
-    st.metric('Ascensos promedio' , f'{pasgp_actuales}', border=True)
-    st.metric('Kilometros del día', f'{ktg} Km ', border=True)
-    st.metric('Kilometros promedio', f'{kpg}', border=True)
+#Modo en vivo: las cifras del día se refrescan solas pidiendo solo los eventos nuevos
+INTERVALO_VIVO = 30
+with st.sidebar:
+    en_vivo = st.toggle('En vivo', key='tot_en_vivo',
+                        help=f'Actualiza las cifras del día cada {INTERVALO_VIVO} segundos.')
+ttl_hoy = INTERVALO_VIVO if en_vivo else cbc.TTL_HOY
+
+ENDPOINTS = {
+    'pasajeros': 'basic/passenger-count/detail',
+    'kilometraje': 'basic/mileage/count',
+}
+
+#Cargadores del dataset crudo: solo se llaman para los días sin acumulado guardado (y hoy).
+#Un rango dentro de lo ya cargado en la sesión se rebana sin volver a CEIBA.
+#Regresan (crudo, cerrado_hasta) para que solo se acumulen los días completos
+def cargar_pasajeros(inicio, fin):
+    return vent.datos_y_cierre('pasajeros', gid, terids_del_grupo, inicio, fin, ttl_hoy=ttl_hoy)
+
+def cargar_kilometraje(inicio, fin):
+    return vent.datos_y_cierre('kilometraje', gid, terids_del_grupo, inicio, fin, ttl_hoy=ttl_hoy)
+
+#Pide a CEIBA, todas a la vez, las peticiones independientes de la página: los días
+#sin acumulado de cada (tipo, inicio, fin). Los cargadores luego los toman de la caché.
+def precargar(rangos):
+    peticiones = set()
+    for tipo, inicio, fin in rangos:
+        faltan = acu.dias_faltantes(tipo, gid, terids_del_grupo, inicio, fin, 30) if inicio <= fin else []
+        if faltan:
+            peticiones.add((tipo, min(faltan), max(faltan)))
+    cba.precargar_por_dia(
+        [(ENDPOINTS[tipo], terids_del_grupo, inicio, fin) for tipo, inicio, fin in sorted(peticiones)],
+        groupid=gid, ttl_hoy=ttl_hoy, ensamblar=False,
+    )
+
+#Rangos de las secciones de abajo: el de sus selectores (o el de por defecto en la primera ejecución)
+precargar([
+    ('pasajeros', iniciog, finalg),
+    ('kilometraje', iniciog, finalg),
+    ('pasajeros', st.session_state.get('iniciop', iniciog), st.session_state.get('finalp', finalg)),
+    ('kilometraje', st.session_state.get('iniciok', iniciog), st.session_state.get('finalk', finalg)),
+])
+
+
+def cifras_del_dia():
+    st.header('Cifras del dia')
+
+    #En vivo este bloque se ejecuta solo: pasajeros y kilometraje del día a la vez
+    precargar([('pasajeros', iniciog, finalg), ('kilometraje', iniciog, finalg)])
+
+    #P A S A J E R O S  y  K I L O M E T R O S por día (acumulados diarios por grupo)
+    kpigp = acu.por_dia('pasajeros', gid, terids_del_grupo, iniciog, finalg, 30, cargar_pasajeros)
+    kpigk = acu.por_dia('kilometraje', gid, terids_del_grupo, iniciog, finalg, 30, cargar_kilometraje)
+
+    #Es un fragmento (en vivo se repite solo): st.stop() cortaría la página, solo avisamos
+    if kpigp is None or kpigk is None:
+        st.error('Error consultando CEIBA')
+        return None, None
+
+    #Dataset's muestra
+
+    st.dataframe(kpigp,use_container_width=True)
+
+    # C O N S T R U C C I O N    D E L    K P I
+
+    #KPI'S
+    #Pasajeros actuales
+    pasg_actuales = kpigp.iloc[-1,-3]
+    #Pasajeros promedio por unidad actuales
+    pasgp_actuales = kpigp.iloc[-1,-1]
+    #kilometros actuales
+    ktg = kpigk.iloc[-1,-3]
+    #kilometros promedio por unidad
+    kpg = kpigk.iloc[-1,-1]
+
+    #KPI'S PROMEDIO COMPARATIVO
+    #pasg_actuales_prom = kpigp[]
+
+
+    row = st.container(horizontal=True)
+    #Empiezan las divisiones.
+    with row:
+        st.metric('Ascensos del dia'  , f'{pasg_actuales} Personas', border = True)
+        st.metric('Ascensos promedio' , f'{pasgp_actuales}', border=True)
+        st.metric('Kilometros del día', f'{ktg} Km ', border=True)
+        st.metric('Kilometros promedio', f'{kpg}', border=True)
+
+    return kpigp, kpigk
+
+#En vivo solo se vuelve a ejecutar este bloque, no la página completa
+kpigp, kpigk = st.fragment(run_every=INTERVALO_VIVO if en_vivo else None)(inst.seccion('cifras')(cifras_del_dia))()
 # Aqui va a ir la barra de indicadores generales SOLO DEL DIA
 
 
@@ -117,123 +153,129 @@ with row:
 #Barra de indicadroes
 # C O N T E O   D E   P A S A J E R O S
 
-#Titulo de la sección
-st.header('Conteo de pasajeros')
-
-#INICIO SELECCION DE FECHA.
-#Delay de fehcas
-date_presetp = date.today() - timedelta(days=6)
-
-c1,c2 = st.columns(2)
-with c1:
-    iniciop = st.date_input('Inicio', date_presetp, key='iniciop')
-with c2:
-    finalp = st.date_input('Final', key='finalp')
-
-if iniciop > finalp:
-    st.error('La fecha final debe ser más reciente que la fecha de inicio')
+#Cada sección es un fragmento: sus selectores solo vuelven a ejecutar la sección
+@st.fragment
+@inst.seccion('pasajeros')
+def conteo_de_pasajeros(kpigp):
+    #Titulo de la sección
+    st.header('Conteo de pasajeros')
 
-#FINAL SELECCION DE FECHA.
+    #INICIO SELECCION DE FECHA.
+    #Delay de fehcas
+    date_presetp = cbc.hoy_ceiba() - timedelta(days=6)
 
-#JSON PASAJEROS
-conteo_pasajeros = {
-        "terid": terids_del_grupo,
-        "starttime": f"{iniciop} 00:00:00",
-        "endtime": f"{finalp} 23:59:59"
-        }
-
-#Realizamos la petición de PDAP: Pasajeros unidad dia promedio
-ok, payload, err = cbc.api_post('basic/passenger-count/detail',json=conteo_pasajeros)
-
-#Construimos el dataset
-if ok:
-    conteo = pd.DataFrame(payload.get('data'))
-    pdap = pcd.construir_padp(conteo,30)
-
-#Graficamos pdapfig1 = Total de ascensos por dia
-pdapfig1 = graph.pasajeros_por_unidad_dia_promedio(
-    df = pdap,
-    valor = 'Total de ascensos',
-)
-
-#Graficamos pdapfig2 = Promedio de ascensos por unidad.
-pdapfig2 = graph.pasajeros_por_unidad_dia_promedio(
-    df = pdap,
-    valor = 'Promedio por unidad',
-)
-
-#Si no hay datos de la unidad "Warning"
-if pdapfig1 is None or pdap.empty:
-    st.warning('No hay datos en las fechas seleccionadas')  
-
-#Ploteamos las graficas 
-else:
-    c1, c2 = st.columns(2)
+    c1,c2 = st.columns(2)
     with c1:
-        st.plotly_chart(pdapfig1, use_container_width=True)
+        iniciop = st.date_input('Inicio', date_presetp, key='iniciop')
     with c2:
-        st.plotly_chart(pdapfig2, use_container_width=True)
-    #Se dá al usuario el archivo de datos graficados
-    with st.expander('Ver los datos mostrados en la gráfica'):
-        st.dataframe(pdap)
+        finalp = st.date_input('Final', key='finalp')
+
+    if iniciop > finalp:
+        st.error('La fecha final debe ser más reciente que la fecha de inicio')
+
+    #FINAL SELECCION DE FECHA.
+
+    #Si el rango es el mismo de las cifras del día, reutilizamos el resumen ya construido
+    if kpigp is not None and (iniciop, finalp) == (iniciog, finalg):
+        pdap = kpigp
+    else:
+        #PDAP: Pasajeros unidad dia promedio, desde los acumulados diarios
+        pdap = acu.por_dia('pasajeros', gid, terids_del_grupo, iniciop, finalp, 30, cargar_pasajeros)
+
+    if pdap is None:
+        st.error('Error consultando CEIBA')
+        return
+
+    #Graficamos pdapfig1 = Total de ascensos por dia
+    pdapfig1 = graph.pasajeros_por_unidad_dia_promedio(
+        df = pdap,
+        valor = 'Total de ascensos',
+    )
+
+    #Graficamos pdapfig2 = Promedio de ascensos por unidad.
+    pdapfig2 = graph.pasajeros_por_unidad_dia_promedio(
+        df = pdap,
+        valor = 'Promedio por unidad',
+    )
+
+    #Si no hay datos de la unidad "Warning"
+    if pdapfig1 is None or pdap.empty:
+        st.warning('No hay datos en las fechas seleccionadas')  
+
+    #Ploteamos las graficas 
+    else:
+        c1, c2 = st.columns(2)
+        with c1:
+            st.plotly_chart(pdapfig1, use_container_width=True)
+        with c2:
+            st.plotly_chart(pdapfig2, use_container_width=True)
+        #Se dá al usuario el archivo de datos graficados
+        with st.expander('Ver los datos mostrados en la gráfica'):
+            st.dataframe(pdap)
+
+conteo_de_pasajeros(kpigp)
 
 #      K I L O M E T R A J E
 
-#Título de la sección
-st.header('Kilometraje')
-
-#Barra de selección de fecha.
+@st.fragment
+@inst.seccion('kilometraje')
+def kilometraje(kpigk):
+    #Título de la sección
+    st.header('Kilometraje')
 
-#Delay de fehcas
-date_presetk = date.today() - timedelta(days=6)
+    #Barra de selección de fecha.
 
-c1,c2 = st.columns(2)
-with c1:
-    iniciok = st.date_input('Inicio',date_presetk, key='iniciok')
-with c2:
-    finalk = st.date_input('Final', key='finalk')
-
-if iniciok > finalk:
-    st.error('La fecha final debe ser más reciente que la fecha de inicio')
-
-#Declaramos el json
-kilometraje = {
-        "terid": terids_del_grupo,
-        "starttime": f"{iniciok} 00:00:00",
-        "endtime": f"{finalk} 23:59:59"
-        }
-
-
-#Pasajeros unidad dia promedio
-ok, payload, err = cbc.api_post('basic/mileage/count',json=kilometraje)
-#Verificamos que la respuesta haya sido exitosa
-if ok:
-    conteo = pd.DataFrame(payload.get('data'))
-    kipd = pcd.construir_kipd(conteo,30)
-    
-
-#Graficamos: pdapfig1 = Total de kilometros por dia
-kipdfig1 = graph.pasajeros_por_unidad_dia_promedio(
-    df = kipd,
-    valor = 'Kilometraje',
-)
-
-#Graficamos: kidpfig2 = Promedio de kilometros por dia (Consideramos 30km de tolerancia)
-kipdfig2 = graph.pasajeros_por_unidad_dia_promedio(
-    df = kipd,
-    valor = 'Promedio por unidad',
-)
+    #Delay de fehcas
+    date_presetk = cbc.hoy_ceiba() - timedelta(days=6)
 
-#Casos
-#A) Si no hay datos en el plot: Mostramos la leyenda
-if kipdfig1 is None or pdap.empty:
-    st.warning('No hay datos en las fechas seleccionadas')
-    #B) si hay datos: Mostramos los plots y permitimos la descarga del dataset.  
-else:
-    c1, c2 = st.columns(2)
+    c1,c2 = st.columns(2)
     with c1:
-        st.plotly_chart(kipdfig1, use_container_width=True)
+        iniciok = st.date_input('Inicio',date_presetk, key='iniciok')
     with c2:
-        st.plotly_chart(kipdfig2, use_container_width=True)
-    with st.expander('Ver los datos mostrados en la gráfica'):
-        st.dataframe(kipd)
\ No newline at end of file
+        finalk = st.date_input('Final', key='finalk')
+
+    if iniciok > finalk:
+        st.error('La fecha final debe ser más reciente que la fecha de inicio')
+
+    #Si el rango es el mismo de las cifras del día, reutilizamos el resumen ya construido
+    if kpigk is not None and (iniciok, finalk) == (iniciog, finalg):
+        kipd = kpigk
+    else:
+        #Kilometros por dia promedio, desde los acumulados diarios
+        kipd = acu.por_dia('kilometraje', gid, terids_del_grupo, iniciok, finalk, 30, cargar_kilometraje)
+
+    if kipd is None:
+        st.error('Error consultando CEIBA')
+        return
+
+
+    #Graficamos: pdapfig1 = Total de kilometros por dia
+    kipdfig1 = graph.pasajeros_por_unidad_dia_promedio(
+        df = kipd,
+        valor = 'Kilometraje',
+    )
+
+    #Graficamos: kidpfig2 = Promedio de kilometros por dia (Consideramos 30km de tolerancia)
+    kipdfig2 = graph.pasajeros_por_unidad_dia_promedio(
+        df = kipd,
+        valor = 'Promedio por unidad',
+    )
+
+    #Casos
+    #A) Si no hay datos en el plot: Mostramos la leyenda
+    if kipdfig1 is None or kipd.empty:
+        st.warning('No hay datos en las fechas seleccionadas')
+        #B) si hay datos: Mostramos los plots y permitimos la descarga del dataset.  
+    else:
+        c1, c2 = st.columns(2)
+        with c1:
+            st.plotly_chart(kipdfig1, use_container_width=True)
+        with c2:
+            st.plotly_chart(kipdfig2, use_container_width=True)
+        with st.expander('Ver los datos mostrados en la gráfica'):
+            st.dataframe(kipd)
+
+kilometraje(kpigk)
+
+#Cerramos la traza de tiempos de la ejecución
+inst.cerrar_rerun()
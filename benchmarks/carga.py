@@ -0,0 +1,225 @@
+     # P R U E B A   D E   C A R G A
+"""
+Simula N sesiones concurrentes del tablero contra CEIBA (por defecto contra
+un servidor simulado local, ver ceiba_simulado.py) y mide el throughput de
+punta a punta.
+
+Cada sesión hace lo mismo que un usuario que entra a Totales: inicia sesión,
+lista grupos y dispositivos y pide pasajeros y kilometraje de un grupo en una
+ventana de días al azar.
+
+- `--modo cliente` (por defecto) pasa por ceiba_client: pool de conexiones,
+  reintentos, fragmentación, single-flight y caché por día.
+- `--modo http` hace las peticiones crudas, una por endpoint (sin cachés).
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/carga.py --sesiones 50 --concurrencia 10 --latencia 0.2
+    python benchmarks/carga.py --url http://127.0.0.1:8765 --modo http
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import requests
+
+RAIZ_REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ_REPO))
+
+from ceiba_simulado import Flota, crear_servidor
+
+#Ventanas (en días) que eligen las sesiones; la de 7 es la de por defecto en las páginas
+VENTANAS = [1, 7, 7, 7, 30]
+
+_PASAJEROS = "basic/passenger-count/detail"
+_KILOMETRAJE = "basic/mileage/count"
+
+
+class Tiempos:
+    def __init__(self):
+        self.pasos = {}
+        self.errores = {}
+        self._candado = threading.Lock()
+
+    def anotar(self, paso: str, segundos: float, ok: bool):
+        with self._candado:
+            self.pasos.setdefault(paso, []).append(segundos)
+            if not ok:
+                self.errores[paso] = self.errores.get(paso, 0) + 1
+
+    def resumen(self) -> dict:
+        salida = {}
+        for paso, valores in self.pasos.items():
+            orden = sorted(valores)
+            cuantil = lambda q: orden[min(len(orden) - 1, int(q * len(orden)))]
+            salida[paso] = {
+                "n": len(orden),
+                "errores": self.errores.get(paso, 0),
+                "p50_s": round(statistics.median(orden), 4),
+                "p95_s": round(cuantil(0.95), 4),
+                "p99_s": round(cuantil(0.99), 4),
+                "max_s": round(orden[-1], 4),
+            }
+        return salida
+
+
+def _medido(tiempos: Tiempos, paso: str, funcion):
+    t0 = time.perf_counter()
+    try:
+        ok, valor = funcion()
+    except Exception:
+        ok, valor = False, None
+    tiempos.anotar(paso, time.perf_counter() - t0, ok)
+    return ok, valor
+
+
+def _ventana(rng: random.Random):
+    fin = date.today()
+    return fin - timedelta(days=rng.choice(VENTANAS) - 1), fin
+
+
+# S E S I Ó N   V Í A   C E I B A _ C L I E N T
+
+def _sesion_cliente(n: int, args, tiempos: Tiempos):
+    import ceiba_client as cbc
+
+    rng = random.Random(n)
+    ok, key = _medido(tiempos, "login", lambda: cbc.validarUsuario(f"usuario{n % args.usuarios}", args.password)[:2])
+    if not ok:
+        return False
+
+    ok, grupos = _medido(tiempos, "grupos", lambda: _sin_error(cbc._grupos_de(key)))
+    ok2, dispositivos = _medido(tiempos, "dispositivos", lambda: _sin_error(cbc._dispositivos_de(key)))
+    if not (ok and ok2 and grupos):
+        return False
+
+    gid = rng.choice(grupos)["groupid"]
+    terids = [d["terid"] for d in dispositivos if str(d["groupid"]) == str(gid)]
+    inicio, fin = _ventana(rng)
+    ok = True
+    for paso, endpoint in (("pasajeros", _PASAJEROS), ("kilometraje", _KILOMETRAJE)):
+        ok &= _medido(tiempos, paso, lambda: cbc.api_post_por_dia(endpoint, terids, inicio, fin, groupid=gid, key=key)[:2])[0]
+    return ok
+
+
+def _sin_error(resultado):
+    datos, err = resultado
+    return err is None, datos
+
+
+# S E S I Ó N   H T T P   C R U D A
+
+def _sesion_http(n: int, args, tiempos: Tiempos):
+    rng = random.Random(n)
+    sesion = requests.Session()
+    url = args.url.rstrip("/")
+
+    def get(endpoint, params):
+        r = sesion.get(f"{url}/{endpoint}", params=params, timeout=30)
+        cuerpo = r.json()
+        return r.status_code == 200 and cuerpo.get("errorcode") == 200, cuerpo.get("data")
+
+    def post(endpoint, cuerpo):
+        r = sesion.post(f"{url}/{endpoint}", json=cuerpo, timeout=60)
+        cuerpo = r.json()
+        return r.status_code == 200 and cuerpo.get("errorcode") == 200, cuerpo.get("data")
+
+    ok, datos = _medido(tiempos, "login", lambda: get("basic/key", {
+        "username": f"usuario{n % args.usuarios}", "password": args.password}))
+    if not ok:
+        return False
+    key = datos["key"]
+
+    ok, grupos = _medido(tiempos, "grupos", lambda: get("basic/groups", {"key": key}))
+    ok2, dispositivos = _medido(tiempos, "dispositivos", lambda: get("basic/devices", {"key": key}))
+    if not (ok and ok2 and grupos):
+        return False
+
+    gid = rng.choice(grupos)["groupid"]
+    terids = [d["terid"] for d in dispositivos if str(d["groupid"]) == str(gid)]
+    inicio, fin = _ventana(rng)
+    cuerpo = {"key": key, "terid": terids, "starttime": f"{inicio} 00:00:00", "endtime": f"{fin} 23:59:59"}
+    ok = True
+    for paso, endpoint in (("pasajeros", _PASAJEROS), ("kilometraje", _KILOMETRAJE)):
+        ok &= _medido(tiempos, paso, lambda: post(endpoint, cuerpo))[0]
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sesiones", type=int, default=20)
+    parser.add_argument("--concurrencia", type=int, default=5)
+    parser.add_argument("--usuarios", type=int, default=3, help="usuarios distintos entre los que se reparten las sesiones")
+    parser.add_argument("--modo", choices=["cliente", "http"], default="cliente")
+    parser.add_argument("--url", default=None, help="servidor ya levantado; si no se da se levanta uno simulado local")
+    parser.add_argument("--password", default="simulado")
+    #Configuración del servidor simulado local
+    parser.add_argument("--unidades", type=int, default=100)
+    parser.add_argument("--grupos", type=int, default=4)
+    parser.add_argument("--eventos-por-dia", type=int, default=40)
+    parser.add_argument("--relleno", type=int, default=0)
+    parser.add_argument("--latencia", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--salida", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    servidor = None
+    if args.url is None:
+        flota = Flota(args.unidades, args.grupos, args.eventos_por_dia, args.relleno)
+        servidor = crear_servidor(0, flota, password=args.password, latencia=args.latencia,
+                                  jitter=args.jitter, tasa_error=args.tasa_error)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        args.url = f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    if args.modo == "cliente":
+        #ceiba_client lee la URL y la ruta del almacén al importarse; el almacén va a un directorio temporal
+        os.environ["CEIBA_BASE_URL"] = args.url
+        os.environ.setdefault("INSITRA_ALMACEN", tempfile.mkdtemp(prefix="insitra-almacen-"))
+        os.chdir(RAIZ_REPO)
+        sesion = _sesion_cliente
+    else:
+        sesion = _sesion_http
+
+    tiempos = Tiempos()
+    print(f"{args.sesiones} sesiones, {args.concurrencia} concurrentes, modo {args.modo}, contra {args.url}")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        resultados = list(pool.map(
+            lambda n: _medido(tiempos, "sesion", lambda: (sesion(n, args, tiempos), None))[0],
+            range(args.sesiones),
+        ))
+    total = time.perf_counter() - t0
+
+    reporte = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "modo": args.modo,
+        "url": args.url,
+        "sesiones": args.sesiones,
+        "concurrencia": args.concurrencia,
+        "sesiones_fallidas": resultados.count(False),
+        "duracion_s": round(total, 3),
+        "sesiones_por_s": round(args.sesiones / total, 3),
+        "pasos": tiempos.resumen(),
+    }
+    if servidor is not None:
+        reporte["servidor"] = servidor.estadisticas.como_dict()
+        servidor.shutdown()
+
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+    if args.salida:
+        args.salida.parent.mkdir(parents=True, exist_ok=True)
+        args.salida.write_text(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
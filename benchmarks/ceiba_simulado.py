@@ -0,0 +1,299 @@
+     # S E R V I D O R   C E I B A   S I M U L A D O
+"""
+Servidor HTTP local que imita los endpoints de CEIBA que usa ceiba_client,
+sobre una flota sintética (ver flota_sintetica.py):
+
+    GET  basic/key                      ?username=&password=
+    GET  basic/groups                   ?key=
+    GET  basic/devices                  ?key=
+    POST basic/passenger-count/detail   {key, terid: [...], starttime, endtime}
+    POST basic/mileage/count            {key, terid: [...], starttime, endtime}
+
+Los datos de cada día se generan de forma determinista la primera vez que se
+piden, así que cualquier rango responde igual entre corridas.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/ceiba_simulado.py --puerto 8765 --unidades 500 --latencia 0.15 --tasa-error 0.02
+
+y luego apuntar la app al servidor:
+
+    CEIBA_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from flota_sintetica import generar_kilometraje, generar_pasajeros, placa, terid
+
+_FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+#Endpoint de datos -> (generador, campo de fecha con el que se filtra la ventana)
+_ENDPOINTS_DATOS = {
+    "basic/passenger-count/detail": ("pasajeros", "opentime"),
+    "basic/mileage/count": ("kilometraje", "starttime"),
+}
+
+
+class Flota:
+    """
+    Flota sintética con `unidades` repartidas en `grupos`. Guarda por día los
+    registros ya serializados a JSON, agrupados por terid, para armar las
+    respuestas sin volver a serializar.
+    """
+
+    def __init__(self, unidades: int = 100, grupos: int = 4, eventos_por_dia: int = 40,
+                 relleno: int = 0, semilla: int = 0):
+        self.unidades = unidades
+        self.grupos = max(1, min(grupos, unidades))
+        self.eventos_por_dia = eventos_por_dia
+        self.relleno = "x" * relleno
+        self.semilla = semilla
+        self._dias = {}
+        self._candado = threading.Lock()
+
+    def grupo_de(self, i: int) -> str:
+        return str(1000 + i % self.grupos)
+
+    def grupos_json(self) -> list:
+        return [{"groupid": str(1000 + g), "groupname": f"Grupo simulado {g + 1}"} for g in range(self.grupos)]
+
+    def dispositivos_json(self) -> list:
+        return [
+            {"groupid": self.grupo_de(i), "carlicence": placa(i), "terid": terid(i)}
+            for i in range(self.unidades)
+        ]
+
+    def _generar_dia(self, tipo: str, dia: date) -> dict:
+        #Semilla por día: el mismo día siempre trae los mismos datos
+        semilla = self.semilla * 100_000 + dia.toordinal()
+        if tipo == "pasajeros":
+            columnas = generar_pasajeros(self.unidades, 1, self.eventos_por_dia, fin=dia, semilla=semilla)
+            campo = "opentime"
+        else:
+            columnas = generar_kilometraje(self.unidades, 1, fin=dia, semilla=semilla)
+            campo = "starttime"
+
+        nombres = list(columnas)
+        valores = [c.tolist() if hasattr(c, "tolist") else c for c in columnas.values()]
+        por_terid = {}
+        for fila in zip(*valores):
+            registro = dict(zip(nombres, fila))
+            if self.relleno:
+                registro["extra"] = self.relleno
+            por_terid.setdefault(registro["terid"], []).append(
+                (registro[campo], json.dumps(registro, separators=(",", ":")))
+            )
+        return por_terid
+
+    def registros(self, tipo: str, terids, inicio: datetime, fin: datetime) -> list:
+        """Registros JSON (texto) de `terids` cuya fecha cae en [inicio, fin]."""
+        #El día en curso solo llega hasta "ahora"
+        fin = min(fin, datetime.now())
+        desde, hasta = inicio.strftime(_FORMATO_FECHA), fin.strftime(_FORMATO_FECHA)
+
+        salida = []
+        dia = inicio.date()
+        while dia <= fin.date():
+            with self._candado:
+                por_terid = self._dias.get((tipo, dia))
+                if por_terid is None:
+                    por_terid = self._dias[(tipo, dia)] = self._generar_dia(tipo, dia)
+            for t in terids:
+                salida.extend(texto for fecha, texto in por_terid.get(str(t), ()) if desde <= fecha <= hasta)
+            dia += timedelta(days=1)
+        return salida
+
+
+class Estadisticas:
+    def __init__(self):
+        self.peticiones = {}
+        self.errores = 0
+        self.bytes = 0
+        self._candado = threading.Lock()
+
+    def anotar(self, endpoint: str, n_bytes: int, error: bool):
+        with self._candado:
+            self.peticiones[endpoint] = self.peticiones.get(endpoint, 0) + 1
+            self.bytes += n_bytes
+            self.errores += error
+
+    def como_dict(self) -> dict:
+        with self._candado:
+            return {"peticiones": dict(self.peticiones), "errores": self.errores, "bytes": self.bytes}
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    #Los atributos de configuración los pone crear_servidor en una subclase
+    flota: Flota
+    estadisticas: Estadisticas
+    password = "simulado"
+    latencia = 0.0
+    jitter = 0.0
+    tasa_error = 0.0
+    comprimir = True
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, endpoint: str, cuerpo, codigo: int = 200):
+        datos = cuerpo if isinstance(cuerpo, bytes) else json.dumps(cuerpo).encode()
+        comprimido = self.comprimir and "gzip" in self.headers.get("Accept-Encoding", "")
+        if comprimido:
+            datos = gzip.compress(datos, compresslevel=1)
+
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if comprimido:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+        self.estadisticas.anotar(endpoint, len(datos), codigo >= 500)
+
+    def _simular_red(self, endpoint: str) -> bool:
+        #Latencia y fallas configurables; True si la petición ya se respondió con error
+        espera = self.latencia + random.uniform(0, self.jitter)
+        if espera:
+            time.sleep(espera)
+        if random.random() < self.tasa_error:
+            self._responder(endpoint, {"errorcode": 500, "message": "Error simulado"}, codigo=503)
+            return True
+        return False
+
+    def _llave_valida(self, key) -> bool:
+        return bool(key) and str(key).startswith("sim-")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip("/")
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if self._simular_red(endpoint):
+            return
+
+        if endpoint == "basic/key":
+            if params.get("password") != self.password:
+                return self._responder(endpoint, {"errorcode": 206, "message": "Credenciales incorrectas"})
+            key = "sim-" + hashlib.sha1(params.get("username", "").encode()).hexdigest()[:16]
+            return self._responder(endpoint, {"errorcode": 200, "data": {"key": key}})
+
+        if not self._llave_valida(params.get("key")):
+            return self._responder(endpoint, {"errorcode": 401, "message": "key inválida"})
+        if endpoint == "basic/groups":
+            return self._responder(endpoint, {"errorcode": 200, "data": self.flota.grupos_json()})
+        if endpoint == "basic/devices":
+            return self._responder(endpoint, {"errorcode": 200, "data": self.flota.dispositivos_json()})
+        self._responder(endpoint, {"errorcode": 404, "message": "Endpoint no simulado"}, codigo=404)
+
+    def do_POST(self):
+        endpoint = urlparse(self.path).path.strip("/")
+        largo = int(self.headers.get("Content-Length") or 0)
+        try:
+            cuerpo = json.loads(self.rfile.read(largo) or b"{}")
+        except ValueError:
+            return self._responder(endpoint, {"errorcode": 400, "message": "JSON inválido"}, codigo=400)
+        if self._simular_red(endpoint):
+            return
+
+        if endpoint not in _ENDPOINTS_DATOS:
+            return self._responder(endpoint, {"errorcode": 404, "message": "Endpoint no simulado"}, codigo=404)
+        if not self._llave_valida(cuerpo.get("key")):
+            return self._responder(endpoint, {"errorcode": 401, "message": "key inválida"})
+        try:
+            inicio = datetime.strptime(cuerpo["starttime"], _FORMATO_FECHA)
+            fin = datetime.strptime(cuerpo["endtime"], _FORMATO_FECHA)
+        except (KeyError, TypeError, ValueError):
+            return self._responder(endpoint, {"errorcode": 400, "message": "starttime/endtime inválidos"})
+
+        terids = cuerpo.get("terid") or []
+        if not isinstance(terids, list):
+            terids = [terids]
+        tipo, _ = _ENDPOINTS_DATOS[endpoint]
+        registros = self.flota.registros(tipo, terids, inicio, fin)
+        texto = '{"errorcode":200,"data":[' + ",".join(registros) + "]}"
+        self._responder(endpoint, texto.encode())
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        #El cliente cerró una conexión keep-alive del pool: no es un error del servidor
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def crear_servidor(
+        puerto: int = 8765,
+        flota: Flota | None = None,
+        *,
+        host: str = "127.0.0.1",
+        password: str = "simulado",
+        latencia: float = 0.0,
+        jitter: float = 0.0,
+        tasa_error: float = 0.0,
+        comprimir: bool = True,
+) -> ThreadingHTTPServer:
+    """
+    Crea (sin arrancar) el servidor simulado. `latencia` + uniforme(0, `jitter`)
+    segundos por petición; con probabilidad `tasa_error` responde HTTP 503.
+    Las estadísticas quedan en `servidor.estadisticas`.
+    """
+    estadisticas = Estadisticas()
+    manejador = type("Manejador", (_Manejador,), {
+        "flota": flota or Flota(),
+        "estadisticas": estadisticas,
+        "password": password,
+        "latencia": latencia,
+        "jitter": jitter,
+        "tasa_error": tasa_error,
+        "comprimir": comprimir,
+    })
+    servidor = _Servidor((host, puerto), manejador)
+    servidor.estadisticas = estadisticas
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--unidades", type=int, default=100)
+    parser.add_argument("--grupos", type=int, default=4)
+    parser.add_argument("--eventos-por-dia", type=int, default=40, help="eventos de puerta por unidad y día")
+    parser.add_argument("--relleno", type=int, default=0, help="bytes extra por registro (tamaño del payload)")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos fijos por petición")
+    parser.add_argument("--jitter", type=float, default=0.0, help="segundos aleatorios extra por petición")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="probabilidad de responder HTTP 503")
+    parser.add_argument("--password", default="simulado", help="contraseña aceptada para cualquier usuario")
+    parser.add_argument("--sin-gzip", action="store_true")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    flota = Flota(args.unidades, args.grupos, args.eventos_por_dia, args.relleno, args.semilla)
+    servidor = crear_servidor(
+        args.puerto, flota, host=args.host, password=args.password, latencia=args.latencia,
+        jitter=args.jitter, tasa_error=args.tasa_error, comprimir=not args.sin_gzip,
+    )
+    print(f"CEIBA simulado en http://{args.host}:{args.puerto} ({args.unidades} unidades, {flota.grupos} grupos)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(json.dumps(servidor.estadisticas.como_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+     # B E N C H M A R K S   D E L   P R O C E S A M I E N T O
+"""
+Mide cómo escalan la ingesta, las agregaciones de procesed, las gráficas de
+Graphics y el filtro por zona de Ruta con flotas sintéticas.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/correr.py
+    python benchmarks/correr.py --unidades 10 100 --dias 1 7 --repeticiones 5
+    python benchmarks/correr.py --sin-graficas --salida reporte.json
+
+Por cada escenario (unidades x días) se reporta, para cada caso, la mediana y
+el mínimo de `--repeticiones` corridas y el pico de memoria de una corrida
+adicional medida con tracemalloc. El reporte JSON se escribe en `--salida`
+(por defecto datos/benchmarks/reporte-AAAAMMDD-HHMMSS.json).
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+RAIZ_REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ_REPO))
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import espacial as esp
+import procesed as pcd
+from flota_sintetica import CENTRO, generar_kilometraje, generar_pasajeros
+
+try:
+    import graphics as graph
+except ModuleNotFoundError:
+    #En sistemas de archivos que distinguen mayúsculas el módulo es Graphics.py
+    import Graphics as graph
+
+
+#Mismo umbral de actividad que usa la página de Totales
+UMBRAL = 30
+
+#Escenarios por defecto: de 10 a 2,000 unidades y de 1 a 180 días
+UNIDADES = [10, 100, 500, 2000]
+DIAS = [1, 7, 30, 180]
+
+
+def _medir(funcion, repeticiones: int) -> dict:
+    #Tiempos sin tracemalloc (lo hace más lento) y una corrida extra para la memoria
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mediana_s": round(statistics.median(tiempos), 6),
+        "min_s": round(min(tiempos), 6),
+        "pico_mb": round(pico / 2**20, 3),
+        "filas_salida": _filas(resultado),
+    }
+
+
+def _filas(resultado):
+    if isinstance(resultado, tuple):
+        resultado = resultado[-1]
+    if hasattr(resultado, "__len__"):
+        return len(resultado)
+    return None
+
+
+def _en_frio(grafica, *args):
+    #Graphics memoiza sus figuras: se vacía la memo para medir la construcción, no el hit
+    with graph._candado_figuras:
+        graph._figuras.clear()
+    return grafica(*args)
+
+
+def _casos(pasajeros: dict, kilometraje: dict, fin: date, dias: int, graficas: bool) -> dict:
+    """Casos a medir sobre los datos crudos de un escenario (nombre -> función)."""
+    ps = pcd.ingerir_pasajeros(pasajeros)
+    km = pcd.ingerir_kilometraje(kilometraje)
+    pud = pcd.construir_pud(ps)
+    kud = pcd.construir_kud(km)
+    padp = pcd.construir_padp(ps, UMBRAL)
+    rango = (fin - timedelta(days=dias - 1), fin)
+
+    #Zona dibujada: un círculo de ~3 km cerca del centro de operación
+    zona = shapely.Point(CENTRO[1] + 0.02, CENTRO[0]).buffer(0.03)
+    puntos = ps.rename(columns={"lng": "lon"}).dropna(subset=["lat", "lon"])
+    lat, lon = puntos["lat"].to_numpy(), puntos["lon"].to_numpy()
+    on, off = puntos["on"].to_numpy(), puntos["off"].to_numpy()
+    indice = esp.IndiceRejilla(lat, lon, on, off)
+
+    casos = {
+        "ingerir_pasajeros": lambda: pcd.ingerir_pasajeros(pasajeros),
+        "ingerir_kilometraje": lambda: pcd.ingerir_kilometraje(kilometraje),
+        "construir_pud": lambda: pcd.construir_pud(ps),
+        "construir_padp": lambda: pcd.construir_padp(ps, UMBRAL),
+        "construir_kud": lambda: pcd.construir_kud(km),
+        "construir_kipd": lambda: pcd.construir_kipd(km, UMBRAL),
+        "zona_mascara": lambda: np.flatnonzero(esp.mascara_en_zona(zona, lat, lon)),
+        "zona_indice_construir": lambda: esp.IndiceRejilla(lat, lon, on, off),
+        "zona_indice_consultar": lambda: indice.consultar(zona),
+    }
+    if graficas:
+        casos.update({
+            "graphics.pasajeros_unidad_dia":
+                lambda: _en_frio(graph.pasajeros_unidad_dia, pud, [], rango, "Ascensos"),
+            "graphics.kilometros_unidad_dia":
+                lambda: _en_frio(graph.kilometros_unidad_dia, kud, [], rango, "Kilometraje"),
+            "graphics.pasajeros_por_unidad_dia_promedio":
+                lambda: _en_frio(graph.pasajeros_por_unidad_dia_promedio, padp, "Promedio por unidad"),
+        })
+    return casos
+
+
+def correr_escenario(unidades: int, dias: int, args) -> dict:
+    fin = date.today() - timedelta(days=1)
+    pasajeros = generar_pasajeros(unidades, dias, args.eventos_por_dia, fin=fin, semilla=args.semilla)
+    kilometraje = generar_kilometraje(unidades, dias, fin=fin, semilla=args.semilla)
+
+    escenario = {
+        "unidades": unidades,
+        "dias": dias,
+        "filas_pasajeros": len(pasajeros["terid"]),
+        "filas_kilometraje": len(kilometraje["terid"]),
+        "casos": {},
+    }
+    for nombre, funcion in _casos(pasajeros, kilometraje, fin, dias, not args.sin_graficas).items():
+        escenario["casos"][nombre] = medida = _medir(funcion, args.repeticiones)
+        print(f"  {nombre:<44} {medida['mediana_s'] * 1000:>10.1f} ms {medida['pico_mb']:>9.1f} MB")
+    return escenario
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--unidades", type=int, nargs="+", default=UNIDADES)
+    parser.add_argument("--dias", type=int, nargs="+", default=DIAS)
+    parser.add_argument("--eventos-por-dia", type=int, default=40,
+                        help="eventos de puerta promedio por unidad y día")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--max-filas", type=int, default=5_000_000,
+                        help="escenarios con más eventos estimados se omiten")
+    parser.add_argument("--sin-graficas", action="store_true", help="no medir los constructores de Graphics")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    reporte = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "eventos_por_dia": args.eventos_por_dia,
+        "repeticiones": args.repeticiones,
+        "escenarios": [],
+    }
+
+    for unidades in args.unidades:
+        for dias in args.dias:
+            estimado = unidades * dias * args.eventos_por_dia
+            if estimado > args.max_filas:
+                print(f"[omitido] {unidades} unidades x {dias} días (~{estimado:,} eventos > --max-filas)")
+                reporte["escenarios"].append({"unidades": unidades, "dias": dias, "omitido": True})
+                continue
+            print(f"{unidades} unidades x {dias} días")
+            reporte["escenarios"].append(correr_escenario(unidades, dias, args))
+
+    salida = args.salida or RAIZ_REPO / "datos" / "benchmarks" / f"reporte-{datetime.now():%Y%m%d-%H%M%S}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(reporte, indent=2, ensure_ascii=False))
+    print(f"Reporte: {salida}")
+
+
+if __name__ == "__main__":
+    main()
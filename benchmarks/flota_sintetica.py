@@ -0,0 +1,138 @@
+     # F L O T A   S I N T É T I C A
+"""
+Genera datos con la forma de los payloads de CEIBA (las columnas que regresa
+ceiba_client.api_post_por_dia) para una flota de `unidades` durante `dias`.
+
+- Pasajeros (basic/passenger-count/detail): eventos de puerta a lo largo de
+  una ruta, concentrados en las horas pico, con ascensos/descensos Poisson.
+- Kilometraje (basic/mileage/count): uno a tres tramos por unidad y día.
+
+Las fechas salen como texto "AAAA-MM-DD HH:MM:SS", igual que en CEIBA.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+#Centro de la zona de operación (las rutas se dibujan alrededor)
+CENTRO = (19.4326, -99.1332)
+
+#Horario de servicio y peso relativo de cada hora (picos de mañana y tarde)
+HORA_INICIO, HORA_FIN = 5, 23
+_PESO_HORA = np.array([
+    0.4, 0.9, 1.6, 1.8, 1.2, 0.8, 0.8, 0.9, 0.9,   # 05 - 13
+    0.8, 0.8, 0.9, 1.3, 1.7, 1.5, 1.0, 0.6, 0.4,   # 14 - 22
+])
+
+#Probabilidad de que una unidad no salga en un día
+PROB_DESCANSO = 0.05
+
+
+def terid(i: int) -> str:
+    return f"SIM{i:05d}"
+
+
+def placa(i: int) -> str:
+    return f"SIM-{i:04d}"
+
+
+#Fechas en segundos desde época -> texto con el formato de CEIBA
+def _a_texto(segundos: np.ndarray) -> np.ndarray:
+    texto = np.datetime_as_string(segundos.astype("datetime64[s]"), unit="s")
+    return np.char.replace(texto, "T", " ")
+
+
+def _rutas(rng: np.random.Generator, unidades: int, paradas: int = 40) -> np.ndarray:
+    """Una ruta por unidad: `paradas` puntos (lat, lon) de un recorrido suave."""
+    angulo = rng.uniform(0, 2 * np.pi, size=(unidades, 1))
+    paso = rng.normal(0, 0.15, size=(unidades, paradas)).cumsum(axis=1)
+    distancia = np.linspace(0.005, 0.12, paradas)[None, :]
+    lat = CENTRO[0] + distancia * np.sin(angulo + paso)
+    lon = CENTRO[1] + distancia * np.cos(angulo + paso)
+    return np.stack([lat, lon], axis=-1)
+
+
+def generar_pasajeros(
+        unidades: int,
+        dias: int,
+        eventos_por_dia: int = 40,
+        fin: date | None = None,
+        semilla: int = 0,
+) -> dict:
+    """
+    Eventos de puerta de `unidades` durante los `dias` que terminan en `fin`
+    (por defecto ayer). Regresa {terid, opentime, closetime, on, off, lat, lng}.
+    """
+    rng = np.random.default_rng(semilla)
+    fin = fin or date.today() - timedelta(days=1)
+    inicio = fin - timedelta(days=dias - 1)
+
+    #Eventos por (unidad, día): alrededor de `eventos_por_dia`, cero si descansa
+    n = rng.poisson(eventos_por_dia, size=(unidades, dias))
+    n[rng.random((unidades, dias)) < PROB_DESCANSO] = 0
+    n = n.ravel()
+    total = int(n.sum())
+
+    unidad = np.repeat(np.repeat(np.arange(unidades), dias), n)
+    dia = np.repeat(np.tile(np.arange(dias), unidades), n)
+
+    #Hora del evento según el perfil de demanda
+    hora = rng.choice(np.arange(HORA_INICIO, HORA_FIN), size=total, p=_PESO_HORA / _PESO_HORA.sum())
+    base = np.datetime64(inicio.isoformat(), "s").astype(np.int64)
+    apertura = base + dia * 86400 + hora * 3600 + rng.integers(0, 3600, size=total)
+    cierre = apertura + rng.integers(5, 40, size=total)
+
+    #Ascensos/descensos: más gente en hora pico
+    demanda = _PESO_HORA[hora - HORA_INICIO] * 3
+    on = rng.poisson(demanda).astype(np.int32)
+    off = rng.poisson(demanda).astype(np.int32)
+
+    #Posición: una parada de la ruta de la unidad con un poco de ruido GPS
+    rutas = _rutas(rng, unidades)
+    parada = rng.integers(0, rutas.shape[1], size=total)
+    punto = rutas[unidad, parada] + rng.normal(0, 0.0002, size=(total, 2))
+
+    ids = np.array([terid(i) for i in range(unidades)], dtype=object)
+    return {
+        "terid": ids[unidad].tolist(),
+        "opentime": _a_texto(apertura).tolist(),
+        "closetime": _a_texto(cierre).tolist(),
+        "on": on,
+        "off": off,
+        "lat": punto[:, 0].astype(np.float32),
+        "lng": punto[:, 1].astype(np.float32),
+    }
+
+
+def generar_kilometraje(
+        unidades: int,
+        dias: int,
+        fin: date | None = None,
+        semilla: int = 0,
+) -> dict:
+    """
+    Tramos de kilometraje de `unidades` durante los `dias` que terminan en
+    `fin`. Regresa {terid, starttime, endtime, mileage}.
+    """
+    rng = np.random.default_rng(semilla + 1)
+    fin = fin or date.today() - timedelta(days=1)
+    inicio = fin - timedelta(days=dias - 1)
+
+    n = rng.integers(1, 4, size=(unidades, dias))
+    n[rng.random((unidades, dias)) < PROB_DESCANSO] = 0
+    n = n.ravel()
+    total = int(n.sum())
+
+    unidad = np.repeat(np.repeat(np.arange(unidades), dias), n)
+    dia = np.repeat(np.tile(np.arange(dias), unidades), n)
+
+    base = np.datetime64(inicio.isoformat(), "s").astype(np.int64)
+    salida = base + dia * 86400 + rng.integers(HORA_INICIO * 3600, (HORA_FIN - 2) * 3600, size=total)
+    llegada = salida + rng.integers(1800, 7200, size=total)
+
+    ids = np.array([terid(i) for i in range(unidades)], dtype=object)
+    return {
+        "terid": ids[unidad].tolist(),
+        "starttime": _a_texto(salida).tolist(),
+        "endtime": _a_texto(llegada).tolist(),
+        "mileage": rng.gamma(6.0, 12.0, size=total).astype(np.float32),
+    }
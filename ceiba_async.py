@@ -0,0 +1,325 @@
+     # C L I E N T E   A S Í N C R O N O   D E   C E I B A
+"""
+Variante asyncio (aiohttp) de ceiba_client para pedir a la vez todas las
+peticiones independientes de una página. Corre en un bucle de eventos propio
+del proceso, con una sola sesión aiohttp y un semáforo que limita las
+peticiones simultáneas a CEIBA entre todas las sesiones de Streamlit.
+
+Comparte con ceiba_client la caché de fragmentos (terid, día), el almacén,
+el refresco incremental del día en curso y las métricas; desde una página:
+
+    resultados = cba.precargar_por_dia([
+        ("basic/passenger-count/detail", terids, inicio, fin),
+        ("basic/mileage/count", terids, inicio, fin),
+    ], groupid=gid)
+
+El tiempo de espera es el de la petición más lenta, no la suma.
+"""
+import asyncio
+import atexit
+import codecs
+import threading
+import time
+from datetime import date
+
+import aiohttp
+import streamlit as st
+
+import ceiba_client as cbc
+import instrumentacion as inst
+import metricas as met
+
+#Peticiones simultáneas a CEIBA desde este cliente, entre todas las sesiones del proceso
+CONCURRENCIA = int(st.secrets.get("CEIBA_CONCURRENCIA_ASYNC", cbc.POOL_CONEXIONES))
+TIMEOUT = 20
+
+_bucle = None
+_candado_bucle = threading.Lock()
+
+#Solo se usan desde el hilo del bucle
+_sesion = None
+_limite = None
+#Tareas líderes de single-flight en curso (referencia fuerte hasta que terminan)
+_tareas = set()
+
+
+# ---------------------------------------------------------------------
+# BUCLE DE EVENTOS Y SESIÓN COMPARTIDOS
+# ---------------------------------------------------------------------
+
+def _obtener_bucle() -> asyncio.AbstractEventLoop:
+    #Un bucle por proceso en un hilo aparte: los scripts de Streamlit no tienen uno
+    global _bucle
+    if _bucle is None:
+        with _candado_bucle:
+            if _bucle is None:
+                bucle = asyncio.new_event_loop()
+                threading.Thread(target=bucle.run_forever, daemon=True, name="ceiba-async").start()
+                _bucle = bucle
+    return _bucle
+
+
+def _obtener_sesion() -> aiohttp.ClientSession:
+    global _sesion, _limite
+    if _sesion is None:
+        _limite = asyncio.Semaphore(CONCURRENCIA)
+        _sesion = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=CONCURRENCIA),
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+        )
+    return _sesion
+
+
+@atexit.register
+def _cerrar():
+    if _bucle is not None and _sesion is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_sesion.close(), _bucle).result(timeout=2)
+        except Exception:
+            pass
+
+
+def reunir(*corutinas) -> list:
+    """
+    Corre `corutinas` a la vez en el bucle compartido y regresa sus resultados
+    en el mismo orden. Se llama desde el script (bloquea hasta que terminan);
+    los spans de las corrutinas se anotan en la traza de la ejecución actual.
+    """
+    if not corutinas:
+        return []
+    contexto = inst.contexto()
+
+    async def _todas():
+        inst.adoptar(contexto)
+        return await asyncio.gather(*corutinas)
+
+    return asyncio.run_coroutine_threadsafe(_todas(), _obtener_bucle()).result()
+
+
+# ---------------------------------------------------------------------
+# HTTP (reintentos con backoff, igual que cbc._solicitar)
+# ---------------------------------------------------------------------
+
+async def _solicitar(metodo: str, endpoint: str, **kwargs) -> tuple:
+    """
+    Retorna (estado HTTP, cuerpo). Reintenta ante 5xx, timeouts y errores de
+    conexión; el semáforo se ocupa solo mientras la petición está en curso.
+    """
+    url = f"{cbc.API}/{endpoint.lstrip('/')}"
+    etiqueta = endpoint.lstrip("/")
+    sesion = _obtener_sesion()
+    for intento in range(cbc.REINTENTOS_HTTP + 1):
+        ultimo = intento == cbc.REINTENTOS_HTTP
+        estado = None
+        t0 = time.perf_counter()
+        try:
+            async with _limite, sesion.request(metodo, url, **kwargs) as r:
+                estado = r.status
+                met.CEIBA_LATENCIA.observar(time.perf_counter() - t0, endpoint=etiqueta, metodo=metodo, estado=estado)
+                if estado < 500 or ultimo:
+                    return estado, await r.read()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            if estado is None:
+                motivo = "timeout" if isinstance(e, asyncio.TimeoutError) else "conexion"
+                met.CEIBA_LATENCIA.observar(time.perf_counter() - t0, endpoint=etiqueta, metodo=metodo, estado=motivo)
+            if ultimo:
+                raise
+        met.CEIBA_REINTENTOS.inc(endpoint=etiqueta)
+        await asyncio.sleep(cbc._espera(intento))
+
+
+def _decodificar(endpoint: str, cuerpo: bytes) -> dict:
+    #Mismo decodificador en streaming que cbc._post_columnas_directo (corre en un hilo)
+    meta = {}
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    vista = memoryview(cuerpo)
+    trozos = (utf8.decode(vista[i:i + cbc._TAM_TROZO]) for i in range(0, len(vista), cbc._TAM_TROZO))
+    columnas = cbc._columnas_desde_registros(
+        cbc._iterar_datos(trozos, meta),
+        cbc.TIPOS_COLUMNAS.get(endpoint.lstrip("/"), {}),
+    )
+    return {**meta, "data": columnas}
+
+
+async def _post_directo(endpoint: str, json: dict, key: str):
+    #POST con `data` como columnas tipadas (mismo formato que cbc._post_columnas_directo).
+    #La decodificación va a un hilo para no detener el bucle con respuestas grandes
+    with inst.span("ceiba_async.http") as datos:
+        try:
+            estado, cuerpo = await _solicitar("POST", endpoint, json={**(json or {}), "key": key})
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            return False, None, f"Error de red: {e!r}"
+
+        try:
+            payload = await asyncio.to_thread(_decodificar, endpoint, cuerpo)
+        except ValueError as e:
+            return False, None, f"Respuesta no es JSON o llegó incompleta. HTTP {estado}: {e}"
+
+        cbc._medir_respuesta(endpoint, len(cuerpo), payload)
+        datos["filas"] = cbc._largo_columnas(payload["data"])
+    return True, payload, None
+
+
+async def _en_vuelo(llave: tuple, corutina, *args):
+    #Single-flight en el mismo registro que cbc: si hay un vuelo de `llave` en curso,
+    #síncrono (p. ej. cbc.precalentar) o de este bucle, se espera su resultado; si no,
+    #este llamado es el líder y corre corutina(*args)
+    vuelo, lider = cbc._abordar(llave)
+    if lider:
+        def _al_terminar(tarea):
+            fallo = tarea.cancelled() or tarea.exception() is not None
+            cbc._aterrizar(llave, vuelo, cbc._ERROR_VUELO if fallo else tarea.result())
+
+        tarea = asyncio.ensure_future(corutina(*args))
+        _tareas.add(tarea)
+        tarea.add_done_callback(_tareas.discard)
+        tarea.add_done_callback(_al_terminar)
+    #shield: si se cancela quien espera, el vuelo sigue para los demás
+    return await asyncio.shield(asyncio.wrap_future(vuelo.futuro))
+
+
+async def _post(endpoint: str, json: dict, key: str):
+    #Peticiones idénticas en curso comparten una sola llamada (ver cbc._post)
+    return await _en_vuelo(cbc._llave_vuelo(endpoint, json, key, True), _post_directo, endpoint, json, key)
+
+
+async def _post_con_reintentos(endpoint: str, json: dict, key: str, reintentos: int):
+    #Igual que cbc._post_con_reintentos: solo errores de aplicación (red y 5xx van en _solicitar)
+    err = None
+    for intento in range(reintentos + 1):
+        if intento:
+            await asyncio.sleep(0.5 * intento)
+        ok, payload, err = await _post(endpoint, json, key)
+        if not ok:
+            return False, None, err
+        errorcode = payload.get("errorcode")
+        if errorcode in (None, 200):
+            return True, payload, None
+        err = f"Error de aplicación (errorcode={errorcode})."
+    return False, None, err
+
+
+# ---------------------------------------------------------------------
+# PETICIONES FRAGMENTADAS Y POR DÍA
+# ---------------------------------------------------------------------
+
+async def post_fragmentado(
+        endpoint: str,
+        json: dict,
+        *,
+        key: str,
+        terids_por_lote: int = cbc.TERIDS_POR_LOTE,
+        dias_por_ventana: int = cbc.DIAS_POR_VENTANA,
+        reintentos: int = cbc.REINTENTOS,
+):
+    """
+    Igual que cbc.api_post_fragmentado(..., columnar=True), pero todos los
+    fragmentos salen a la vez; el límite lo pone el semáforo compartido.
+    """
+    with inst.span("ceiba_async.fragmentado") as datos:
+        resultados = await asyncio.gather(*(
+            _post_con_reintentos(endpoint, fragmento, key, reintentos)
+            for fragmento in cbc._fragmentar(json, terids_por_lote, dias_por_ventana)
+        ))
+        for ok, payload, err in resultados:
+            if not ok:
+                return False, None, err
+        data = cbc._unir_columnas([payload.get("data") or {} for _, payload, _ in resultados])
+        datos["filas"] = cbc._largo_columnas(data)
+    return True, {"errorcode": 200, "data": data}, None
+
+
+async def _pedir_y_guardar(endpoint: str, groupid, terids: list, inicio: date, fin: date, key: str):
+    #Lo que hace el líder de cbc._descargar_ventana, con el POST en el bucle y el guardado en un hilo
+    pedido_en = time.time()
+    ok, payload, err = await post_fragmentado(endpoint, cbc._json_ventana(terids, inicio, fin), key=key)
+    #No guardamos respuestas de error como fragmentos vacíos
+    if not ok:
+        return False, None, err
+    bloques = await asyncio.to_thread(
+        cbc._guardar_ventana, endpoint, groupid, terids, inicio, fin, payload.get("data") or {}, pedido_en, key,
+    )
+    return True, bloques, None
+
+
+async def _descargar_ventana(endpoint: str, groupid, terids: list, inicio: date, fin: date, key: str):
+    #Igual que cbc._descargar_ventana: solo quien hizo la petición guarda la ventana
+    llave = cbc._llave_ventana(endpoint, groupid, terids, inicio, fin, key)
+    return await _en_vuelo(llave, _pedir_y_guardar, endpoint, groupid, terids, inicio, fin, key)
+
+
+async def post_por_dia(
+        endpoint: str,
+        terids: list,
+        inicio: date,
+        fin: date,
+        *,
+        key: str,
+        groupid=None,
+        ttl_hoy: float = cbc.TTL_HOY,
+        ensamblar: bool = True,
+):
+    """
+    Igual que cbc.api_post_por_dia, pero los huecos de la caché de fragmentos
+    se piden todos a la vez. Todo lo que toca la caché, el almacén o copia
+    filas corre en hilos para no detener el bucle (y con él las peticiones de
+    las demás sesiones). Con `ensamblar=False` solo se llenan la caché y el
+    almacén (para precargar) y se retorna (ok, None, err).
+    Retorna (ok, {"data": columnas}, err).
+    """
+    with inst.span("ceiba_async.por_dia") as datos:
+        terids = [str(t) for t in terids]
+        faltantes, piezas = await asyncio.to_thread(
+            cbc._faltantes_contados, endpoint, terids, inicio, fin, ttl_hoy, key,
+        )
+
+        candidatos, json = await asyncio.to_thread(cbc._refresco_pendiente, endpoint, faltantes, key)
+        if candidatos:
+            pedido_en = time.time()
+            ok, payload, err = await post_fragmentado(endpoint, json, key=key)
+            if ok:
+                faltantes = await asyncio.to_thread(
+                    cbc._aplicar_refresco, endpoint, faltantes, candidatos, payload, pedido_en, key, piezas,
+                )
+
+        faltantes = await asyncio.to_thread(cbc._desde_almacen, endpoint, groupid, faltantes, key, piezas)
+        resultados = await asyncio.gather(*(
+            _descargar_ventana(endpoint, groupid, ids, ini, fin_v, key)
+            for ids, ini, fin_v in cbc._ventanas_faltantes(faltantes)
+        ))
+        for ok, bloques, err in resultados:
+            if not ok:
+                return False, None, err
+            piezas.update(bloques)
+        if not ensamblar:
+            return True, None, None
+
+        data = await asyncio.to_thread(cbc._ensamblar, piezas, terids, inicio, fin)
+        if data is None:
+            return False, None, cbc.ERROR_INCOMPLETO
+        datos["filas"] = cbc._largo_columnas(data)
+    return True, {"data": data}, None
+
+
+def precargar_por_dia(
+        peticiones: list,
+        *,
+        groupid=None,
+        ttl_hoy: float = cbc.TTL_HOY,
+        key: str | None = None,
+        ensamblar: bool = True,
+) -> list:
+    """
+    Varias cbc.api_post_por_dia a la vez: `peticiones` = [(endpoint, terids,
+    inicio, fin)]. Deja los fragmentos en la caché, así que las llamadas
+    síncronas que la página hace después ya no van a CEIBA. Si solo se quiere
+    calentar la caché, `ensamblar=False` evita armar los resultados.
+    Retorna [(ok, payload, err)] en el mismo orden (payload None sin ensamblar).
+    """
+    key = key or st.session_state.get("api_key")
+    if not key:
+        return [(False, None, "No autenticado (falta api_key).")] * len(peticiones)
+    return reunir(*(
+        post_por_dia(endpoint, terids, inicio, fin, key=key, groupid=groupid, ttl_hoy=ttl_hoy, ensamblar=ensamblar)
+        for endpoint, terids, inicio, fin in peticiones
+    ))
@@ -1,7 +1,99 @@
+import codecs
+import json as _json
+import os
+import random
+import threading
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, time as dt_time
+from types import MappingProxyType
+from zoneinfo import ZoneInfo
+
+import numpy as np
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+
+import almacen
+import instrumentacion as inst
+import metricas as met
+
+#La variable de entorno permite apuntar a otro servidor (p. ej. benchmarks/ceiba_simulado.py)
+API = os.environ.get("CEIBA_BASE_URL") or st.secrets.get("CEIBA_BASE_URL")
 
-API = st.secrets.get("CEIBA_BASE_URL")
+# ---------------------------------------------------------------------
+# SESIÓN HTTP COMPARTIDA (pool keep-alive + reintentos con backoff)
+# ---------------------------------------------------------------------
+
+#Conexiones que se mantienen abiertas hacia CEIBA por proceso
+POOL_CONEXIONES = int(st.secrets.get("CEIBA_POOL_CONEXIONES", 20))
+#Reintentos ante 5xx o timeouts, con backoff exponencial y jitter
+REINTENTOS_HTTP = int(st.secrets.get("CEIBA_REINTENTOS_HTTP", 3))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+_sesion = None
+_candado_sesion = threading.Lock()
+
+
+def _obtener_sesion() -> requests.Session:
+    """
+    Sesión compartida por todo el proceso: reutiliza conexiones TCP/TLS entre
+    peticiones (y entre usuarios) en lugar de abrir una por llamada.
+    """
+    global _sesion
+    if _sesion is None:
+        with _candado_sesion:
+            if _sesion is None:
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=POOL_CONEXIONES, pool_maxsize=POOL_CONEXIONES)
+                sesion.mount("https://", adaptador)
+                sesion.mount("http://", adaptador)
+                sesion.headers.update({
+                    "Accept-Encoding": "gzip, deflate",
+                    "Connection": "keep-alive",
+                })
+                _sesion = sesion
+    return _sesion
+
+
+def _espera(intento: int) -> float:
+    #Backoff exponencial con "full jitter"
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** intento)))
+
+
+@inst.medir("ceiba.http")
+def _solicitar(metodo: str, endpoint: str, *, timeout: float, **kwargs) -> requests.Response:
+    """
+    Hace la petición con la sesión compartida. Reintenta ante 5xx, timeouts y
+    errores de conexión; si se agotan los reintentos regresa la última
+    respuesta o propaga la última excepción (requests.RequestException).
+    """
+    url = f"{API}/{endpoint.lstrip('/')}"
+    etiqueta = endpoint.lstrip("/")
+    for intento in range(REINTENTOS_HTTP + 1):
+        ultimo = intento == REINTENTOS_HTTP
+        t0 = time.perf_counter()
+        try:
+            r = _obtener_sesion().request(metodo, url, timeout=timeout, **kwargs)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            estado = "timeout" if isinstance(e, requests.Timeout) else "conexion"
+            met.CEIBA_LATENCIA.observar(time.perf_counter() - t0, endpoint=etiqueta, metodo=metodo, estado=estado)
+            if ultimo:
+                raise
+        else:
+            met.CEIBA_LATENCIA.observar(time.perf_counter() - t0, endpoint=etiqueta, metodo=metodo,
+                                        estado=r.status_code)
+            if r.status_code < 500 or ultimo:
+                return r
+            #La respuesta descartada devuelve su conexión al pool (con stream=True quedaría abierta)
+            r.close()
+        met.CEIBA_REINTENTOS.inc(endpoint=etiqueta)
+        time.sleep(_espera(intento))
 # ---------------------------------------------------------------------
 # AUTENTICACIÓN
 # ---------------------------------------------------------------------
@@ -9,8 +101,9 @@ API = st.secrets.get("CEIBA_BASE_URL")
 #Valida que el usuario y la contraseña sean correctos
 def validarUsuario(usuario: str, clave: str):
     try:
-        resp = requests.get(
-            f"{API}/basic/key",
+        resp = _solicitar(
+            "GET",
+            "basic/key",
             params={"username": usuario, "password": clave},
             timeout=20,
         )
@@ -40,6 +133,8 @@ def _guardar_sesion(usuario: str, api_key: str):
 
 #Cierra sesión
 def cerrar_sesion():
+    _cache_llaves.descartar_llave(st.session_state.get("api_key"))
+    _fragmentos.descartar_llave(st.session_state.get("api_key"))
     st.session_state.clear()
     st.rerun()
 #Usamos para hacer get (Iniciar sesion)
@@ -48,11 +143,17 @@ def api_get(endpoint: str, params: dict):
     if "api_key" not in st.session_state:
         return False, None, "No autenticado (falta api_key)."
 
+    return _get(endpoint, params, st.session_state["api_key"])
+
+#GET con la llave explícita (se puede llamar desde hilos sin session_state)
+@inst.medir("ceiba.get")
+def _get(endpoint: str, params: dict, key: str):
+
     p = dict(params or {})
-    p["key"] = st.session_state["api_key"]
+    p["key"] = key
 
     try:
-        r = requests.get(f"{API}/{endpoint.lstrip('/')}", params=p, timeout=10)
+        r = _solicitar("GET", endpoint, params=p, timeout=10)
     except requests.RequestException as e:
         return False, None, f"Error de red: {e}"
 
@@ -61,24 +162,103 @@ def api_get(endpoint: str, params: dict):
     except ValueError:
         return False, None, "Respuesta no es JSON."
 
+    _medir_respuesta(endpoint, len(r.content), data)
     return True, data, None
 
+
+def _medir_respuesta(endpoint: str, n_bytes: int, payload):
+    #Tamaño y filas de cada respuesta para las métricas del proceso
+    etiqueta = endpoint.lstrip("/")
+    met.CEIBA_BYTES.observar(n_bytes, endpoint=etiqueta)
+    data = payload.get("data") if isinstance(payload, dict) else None
+    if isinstance(data, list):
+        met.CEIBA_FILAS.observar(len(data), endpoint=etiqueta)
+    elif isinstance(data, dict):
+        met.CEIBA_FILAS.observar(_largo_columnas(data), endpoint=etiqueta)
+
 #Lo utilizamos para hacer peticiones (de datos)
 def api_post(endpoint: str, json: dict):
 
     if "api_key" not in st.session_state:
         return False, None, "No autenticado (falta api_key)."
 
-    #p = dict(params or {})
-    key = st.session_state["api_key"]
-    json["key"] = key
+    return _post(endpoint, json, st.session_state["api_key"])
 
+# ---------------------------------------------------------------------
+# SINGLE-FLIGHT: peticiones idénticas en vuelo comparten una sola llamada
+# ---------------------------------------------------------------------
+
+_ERROR_VUELO = (False, None, "Error inesperado en la petición compartida.")
+
+
+class _Vuelo:
+    #El resultado se espera desde hilos (futuro.result()) o desde corrutinas
+    #de ceiba_async (asyncio.wrap_future), así ambos clientes comparten el vuelo
+    def __init__(self):
+        self.futuro = Future()
+
+
+#(endpoint, cuerpo canónico, key, columnar) -> _Vuelo. Lo usan ceiba_client y ceiba_async
+_en_vuelo = {}
+_candado_vuelo = threading.Lock()
+
+
+def _llave_vuelo(endpoint: str, json: dict, key: str, columnar: bool):
+    #El orden de los terids no cambia la respuesta; la llave separa a cada usuario
+    cuerpo = dict(json or {})
+    if isinstance(cuerpo.get("terid"), list):
+        cuerpo["terid"] = sorted(str(t) for t in cuerpo["terid"])
+    return endpoint.lstrip("/"), _json.dumps(cuerpo, sort_keys=True, default=str), key, columnar
+
+
+def _abordar(llave: tuple):
+    #(vuelo, lider): el vuelo en curso de `llave`, o uno nuevo del que somos líder
+    with _candado_vuelo:
+        vuelo = _en_vuelo.get(llave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _en_vuelo[llave] = _Vuelo()
+    met.cache("single_flight", hits=not lider, misses=lider)
+    return vuelo, lider
+
+
+def _aterrizar(llave: tuple, vuelo: _Vuelo, resultado: tuple):
+    #El líder entrega el resultado a quienes esperan y libera la llave
+    with _candado_vuelo:
+        _en_vuelo.pop(llave, None)
+    vuelo.futuro.set_result(resultado)
+
+
+#POST con la llave explícita (se puede llamar desde hilos sin session_state)
+@inst.medir("ceiba.post")
+def _post(endpoint: str, json: dict, key: str, columnar: bool = False):
+    """
+    Si ya hay una petición idéntica en vuelo (mismo endpoint, terids, ventana
+    y key) en cualquier sesión del proceso, de este cliente o de ceiba_async,
+    espera su resultado en lugar de repetirla. El payload se comparte entre quienes esperan: es de solo lectura.
+    Con `columnar=True` el arreglo `data` llega como columnas (ver _post_columnas_directo).
+    """
+    llave = _llave_vuelo(endpoint, json, key, columnar)
+    vuelo, lider = _abordar(llave)
+    if not lider:
+        return vuelo.futuro.result()
+
+    resultado = _ERROR_VUELO
     try:
-        r = requests.post(
-            f"{API}/{endpoint.lstrip('/')}",
-            json=json,  
-            timeout=20,
-        )
+        directo = _post_columnas_directo if columnar else _post_directo
+        resultado = directo(endpoint, json, key)
+    finally:
+        _aterrizar(llave, vuelo, resultado)
+    return resultado
+
+
+def _post_directo(endpoint: str, json: dict, key: str):
+
+    cuerpo = dict(json or {})
+    cuerpo["key"] = key
+
+    try:
+        r = _solicitar("POST", endpoint, json=cuerpo, timeout=20)
     except requests.RequestException as e:
         return False, None, f"Error de red: {e}"
 
@@ -88,13 +268,888 @@ def api_post(endpoint: str, json: dict):
     except ValueError:
         return False, None, f"Respuesta no es JSON. HTTP {r.status_code}: {r.text[:200]}"
 
+    _medir_respuesta(endpoint, len(r.content), payload)
     return True, payload, None
 
 
-### Juanito
-@st.cache_data(ttl=300)
-def listar_grupos():
-    ok, payload, err = api_get("basic/groups", params={'key': st.session_state.get("api_key")})
+# ---------------------------------------------------------------------
+# DECODIFICACIÓN EN STREAMING (arreglo `data` -> columnas tipadas)
+# ---------------------------------------------------------------------
+
+#Columnas numéricas que se guardan en buffers compactos: "i" = int32, "f" = float32.
+#Las demás columnas se guardan como listas de Python.
+TIPOS_COLUMNAS = {
+    "basic/passenger-count/detail": {"on": "i", "off": "i", "lat": "f", "lng": "f"},
+    "basic/mileage/count": {"mileage": "f"},
+}
+
+_TAM_TROZO = 64 * 1024
+_DTYPES = {"i": np.int32, "f": np.float32}
+_decodificador = _json.JSONDecoder()
+
+
+class _LectorJSON:
+    """
+    Lee un documento JSON a partir de trozos de texto sin tener el cuerpo
+    completo en memoria: solo se conserva lo que falta por consumir.
+    """
+
+    def __init__(self, trozos):
+        self._trozos = trozos
+        self._buf = ""
+        self._pos = 0
+        self._fin = False
+
+    def _rellenar(self) -> bool:
+        if self._fin:
+            return False
+        try:
+            trozo = next(self._trozos)
+        except StopIteration:
+            self._fin = True
+            return False
+        self._buf = self._buf[self._pos:] + trozo
+        self._pos = 0
+        return True
+
+    def ver(self) -> str:
+        #Siguiente carácter significativo (sin consumirlo); "" al final del documento
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._rellenar():
+                return ""
+
+    def consumir(self, esperado: str):
+        if self.ver() != esperado:
+            raise ValueError(f"JSON inválido: se esperaba {esperado!r}.")
+        self._pos += 1
+
+    def valor(self):
+        self.ver()
+        while True:
+            try:
+                obj, fin = _decodificador.raw_decode(self._buf, self._pos)
+            except _json.JSONDecodeError:
+                if not self._rellenar():
+                    raise
+                continue
+            #Un número al final del buffer puede seguir en el siguiente trozo
+            if fin == len(self._buf) and self._rellenar():
+                continue
+            self._pos = fin
+            return obj
+
+
+def _iterar_datos(trozos, meta: dict, campo: str = "data"):
+    """
+    Recorre el objeto JSON de nivel superior y va entregando uno a uno los
+    elementos de `campo`; el resto de las llaves (errorcode, etc.) se guarda en `meta`.
+    """
+    lector = _LectorJSON(trozos)
+    lector.consumir("{")
+    if lector.ver() == "}":
+        lector.consumir("}")
+        return
+    while True:
+        llave = lector.valor()
+        lector.consumir(":")
+        if llave == campo and lector.ver() == "[":
+            lector.consumir("[")
+            if lector.ver() == "]":
+                lector.consumir("]")
+            else:
+                while True:
+                    yield lector.valor()
+                    if lector.ver() == ",":
+                        lector.consumir(",")
+                        continue
+                    lector.consumir("]")
+                    break
+        else:
+            meta[llave] = lector.valor()
+
+        if lector.ver() == ",":
+            lector.consumir(",")
+            continue
+        lector.consumir("}")
+        return
+
+
+def _a_tipo(valor, tipo: str):
+    try:
+        return int(valor) if tipo == "i" else float(valor)
+    except (TypeError, ValueError):
+        return 0 if tipo == "i" else float("nan")
+
+
+def _columnas_desde_registros(registros, tipos: dict) -> dict:
+    """
+    Acomoda los registros en columnas conforme llegan. Las columnas de `tipos`
+    van a buffers compactos (array) y al final se exponen como arreglos NumPy;
+    las llaves que falten en un registro se rellenan (0, NaN o None).
+    """
+    buffers = {}
+    n = 0
+    for reg in registros:
+        if not isinstance(reg, dict):
+            continue
+        for col in reg.keys() - buffers.keys():
+            tipo = tipos.get(col)
+            if tipo:
+                buffers[col] = array(tipo, [_a_tipo(None, tipo)] * n)
+            else:
+                buffers[col] = [None] * n
+        for col, buf in buffers.items():
+            tipo = tipos.get(col)
+            buf.append(_a_tipo(reg.get(col), tipo) if tipo else reg.get(col))
+        n += 1
+
+    return {
+        col: np.frombuffer(buf, dtype=_DTYPES[tipos[col]]).copy() if col in tipos else buf
+        for col, buf in buffers.items()
+    }
+
+
+#Como _post_directo, pero `data` llega como {columna: valores}, con las columnas numéricas
+#de TIPOS_COLUMNAS ya en arreglos NumPy compactos. pd.DataFrame(payload["data"]) funciona igual
+def _post_columnas_directo(endpoint: str, json: dict, key: str):
+
+    cuerpo = dict(json or {})
+    cuerpo["key"] = key
+
+    try:
+        r = _solicitar("POST", endpoint, json=cuerpo, timeout=20, stream=True)
+    except requests.RequestException as e:
+        return False, None, f"Error de red: {e}"
+
+    meta = {}
+    leidos = [0]
+
+    def _contar(b):
+        leidos[0] += len(b)
+        return b
+
+    with r:
+        utf8 = codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+        trozos = (utf8.decode(_contar(b)) for b in r.iter_content(chunk_size=_TAM_TROZO) if b)
+        try:
+            columnas = _columnas_desde_registros(
+                _iterar_datos(trozos, meta),
+                TIPOS_COLUMNAS.get(endpoint.lstrip("/"), {}),
+            )
+        except (ValueError, requests.RequestException) as e:
+            return False, None, f"Respuesta no es JSON o llegó incompleta. HTTP {r.status_code}: {e}"
+
+    payload = {**meta, "data": columnas}
+    _medir_respuesta(endpoint, leidos[0], payload)
+    return True, payload, None
+
+
+#Peticiones grandes: el arreglo `data` se decodifica en streaming directo a columnas
+def _largo_columnas(columnas: dict) -> int:
+    return len(next(iter(columnas.values()))) if columnas else 0
+
+
+def _unir_columnas(bloques: list) -> dict:
+    #Concatena bloques {col: valores}; las columnas que falten en un bloque se rellenan
+    bloques = [b for b in bloques if _largo_columnas(b)]
+    nombres = []
+    for b in bloques:
+        nombres.extend(c for c in b if c not in nombres)
+
+    unidas = {}
+    for col in nombres:
+        partes = [b.get(col) for b in bloques]
+        if all(isinstance(p, np.ndarray) for p in partes):
+            unidas[col] = np.concatenate(partes)
+            continue
+        valores = []
+        for b, p in zip(bloques, partes):
+            if p is None:
+                valores.extend([None] * _largo_columnas(b))
+            else:
+                valores.extend(p.tolist() if isinstance(p, np.ndarray) else p)
+        unidas[col] = valores
+    return unidas
+
+
+def _tomar_columnas(columnas: dict, posiciones: list) -> dict:
+    #Subconjunto de filas de un bloque de columnas (copia, no vista)
+    idx = np.asarray(posiciones, dtype=np.int64)
+    return {
+        col: valores[idx] if isinstance(valores, np.ndarray) else [valores[i] for i in posiciones]
+        for col, valores in columnas.items()
+    }
+
+
+# ---------------------------------------------------------------------
+# PETICIONES FRAGMENTADAS (lotes de terids x ventanas de tiempo)
+# ---------------------------------------------------------------------
+
+#Valores por defecto del modo fragmentado
+TERIDS_POR_LOTE = 50
+DIAS_POR_VENTANA = 7
+MAX_HILOS = 4
+REINTENTOS = 2
+
+#Hilos compartidos por todas las peticiones fragmentadas del proceso: tantos como
+#conexiones del pool HTTP, así nunca hay más fragmentos en curso que conexiones.
+#Cada llamada ocupa a lo más `max_hilos` a la vez (ver api_post_fragmentado)
+_pool_fragmentos = ThreadPoolExecutor(max_workers=POOL_CONEXIONES, thread_name_prefix="ceiba-fragmentos")
+
+_FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+
+def _ventanas_de_tiempo(starttime: str, endtime: str, dias_por_ventana: int):
+    """
+    Parte [starttime, endtime] en ventanas de a lo más `dias_por_ventana` días
+    naturales. Retorna [(starttime, endtime)] como texto.
+    """
+    ini = datetime.strptime(starttime, _FORMATO_FECHA)
+    fin = datetime.strptime(endtime, _FORMATO_FECHA)
+
+    ventanas = []
+    while ini <= fin:
+        corte = datetime.combine(ini.date() + timedelta(days=dias_por_ventana - 1), dt_time(23, 59, 59))
+        corte = min(corte, fin)
+        ventanas.append((ini.strftime(_FORMATO_FECHA), corte.strftime(_FORMATO_FECHA)))
+        ini = datetime.combine(corte.date() + timedelta(days=1), dt_time(0, 0, 0))
+    return ventanas
+
+
+def _fragmentar(json: dict, terids_por_lote: int, dias_por_ventana: int) -> list:
+    #Cuerpos de las peticiones: lotes de terids x ventanas de días
+    terids = list(json.get("terid") or [])
+    lotes = [terids[i:i + terids_por_lote] for i in range(0, len(terids), terids_por_lote)] or [terids]
+    ventanas = _ventanas_de_tiempo(json["starttime"], json["endtime"], dias_por_ventana)
+    return [
+        {**json, "terid": lote, "starttime": ini, "endtime": fin}
+        for lote in lotes
+        for ini, fin in ventanas
+    ]
+
+
+def _en_pool(tarea, fragmentos: list, max_hilos: int) -> list:
+    #tarea(fragmento) en _pool_fragmentos con a lo más `max_hilos` en curso a la vez
+    #(ventana deslizante); los resultados regresan en el orden de `fragmentos`
+    resultados = [None] * len(fragmentos)
+    pendientes = iter(enumerate(fragmentos))
+    en_curso = {}
+
+    def _lanzar():
+        siguiente = next(pendientes, None)
+        if siguiente is not None:
+            en_curso[_pool_fragmentos.submit(tarea, siguiente[1])] = siguiente[0]
+
+    for _ in range(max_hilos):
+        _lanzar()
+    while en_curso:
+        hechos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            resultados[en_curso.pop(futuro)] = futuro.result()
+            _lanzar()
+    return resultados
+
+
+def _post_con_reintentos(endpoint: str, json: dict, key: str, reintentos: int, columnar: bool = False):
+    #Reintenta un solo fragmento ante errores de aplicación (errorcode); los de red
+    #y 5xx ya los reintentó _solicitar, así que esos fallan de inmediato
+    err = None
+    for intento in range(reintentos + 1):
+        if intento:
+            time.sleep(0.5 * intento)
+        ok, payload, err = _post(endpoint, json, key, columnar)
+        if not ok:
+            return False, None, err
+        errorcode = payload.get("errorcode")
+        if errorcode in (None, 200):
+            return True, payload, None
+        err = f"Error de aplicación (errorcode={errorcode})."
+    return False, None, err
+
+
+@inst.medir("ceiba.fragmentado")
+def api_post_fragmentado(
+        endpoint: str,
+        json: dict,
+        *,
+        terids_por_lote: int = TERIDS_POR_LOTE,
+        dias_por_ventana: int = DIAS_POR_VENTANA,
+        max_hilos: int = MAX_HILOS,
+        reintentos: int = REINTENTOS,
+        columnar: bool = False,
+        key: str | None = None,
+):
+    """
+    Igual que api_post, pero parte la petición en fragmentos (lotes de terids x
+    ventanas de días), los ejecuta en paralelo en el pool de hilos compartido
+    del proceso (a lo más `max_hilos` a la vez) y une los arreglos `data`.
+    Cada fragmento se reintenta por separado hasta
+    `reintentos` veces si CEIBA responde con un error de aplicación (los
+    errores de red y 5xx se reintentan en _solicitar); si alguno falla
+    definitivamente, falla la petición.
+    Con `columnar=True` cada fragmento se decodifica en streaming a columnas.
+    Con `key` explícita se puede llamar desde hilos sin session_state.
+    Retorna (ok, {"errorcode": 200, "data": registros | columnas}, err).
+    """
+    key = key or st.session_state.get("api_key")
+    if not key:
+        return False, None, "No autenticado (falta api_key)."
+
+    fragmentos = _fragmentar(json, terids_por_lote, dias_por_ventana)
+
+    #Un solo fragmento: no vale la pena pasar por el pool
+    if len(fragmentos) == 1:
+        resultados = [_post_con_reintentos(endpoint, fragmentos[0], key, reintentos, columnar)]
+    else:
+        resultados = _en_pool(
+            inst.propagar(lambda frag: _post_con_reintentos(endpoint, frag, key, reintentos, columnar)),
+            fragmentos,
+            max(1, max_hilos),
+        )
+
+    for ok, payload, err in resultados:
+        if not ok:
+            return False, None, err
+
+    if columnar:
+        data = _unir_columnas([payload.get("data") or {} for _, payload, _ in resultados])
+    else:
+        data = []
+        for _, payload, _ in resultados:
+            data.extend(payload.get("data") or [])
+
+    return True, {"errorcode": 200, "data": data}, None
+
+
+# ---------------------------------------------------------------------
+# CACHÉ POR API_KEY (LRU con tope de memoria)
+# ---------------------------------------------------------------------
+
+_FALTA = object()
+
+
+def _tamano(obj, vistos=None) -> int:
+    #Estimación recursiva de bytes (contenedores, dataclasses y su contenido)
+    vistos = set() if vistos is None else vistos
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    tam = sys.getsizeof(obj)
+    if isinstance(obj, (dict, MappingProxyType)):
+        tam += sum(_tamano(k, vistos) + _tamano(v, vistos) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        tam += sum(_tamano(v, vistos) for v in obj)
+    elif hasattr(obj, "__dataclass_fields__"):
+        tam += sum(_tamano(getattr(obj, campo), vistos) for campo in obj.__dataclass_fields__)
+    return tam
+
+
+class CachePorLlave:
+    """
+    Caché LRU cuyas llaves empiezan con la api_key, con TTL por consulta y un
+    tope de memoria total: al pasarse se desalojan las entradas menos usadas,
+    sin importar de qué usuario sean. Los valores se comparten, no se copian.
+    """
+
+    def __init__(self, nombre: str, max_bytes: int):
+        self.nombre = nombre
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()   # llave -> (valor, bytes, guardado_en)
+        self._bytes = 0
+        self._candado = threading.Lock()
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def ver(self, llave: tuple):
+        """Valor de `llave` sin TTL ni métricas (None si no está); cuenta como uso."""
+        with self._candado:
+            entrada = self._datos.get(llave)
+            if entrada is None:
+                return None
+            self._datos.move_to_end(llave)
+            return entrada[0]
+
+    def obtener(self, llave: tuple, ttl: float):
+        """Valor guardado y vigente de `llave`, o _FALTA."""
+        with self._candado:
+            entrada = self._datos.get(llave)
+            if entrada is not None and time.time() - entrada[2] >= ttl:
+                self._quitar(llave)
+                entrada = None
+            if entrada is not None:
+                self._datos.move_to_end(llave)
+        met.cache(self.nombre, hits=entrada is not None, misses=entrada is None)
+        return _FALTA if entrada is None else entrada[0]
+
+    def guardar(self, llave: tuple, valor):
+        tam = _tamano(valor)
+        if tam > self.max_bytes:
+            return
+        desalojos = 0
+        with self._candado:
+            if llave in self._datos:
+                self._quitar(llave)
+            self._datos[llave] = (valor, tam, time.time())
+            self._bytes += tam
+            while self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._datos)))
+                desalojos += 1
+        if desalojos:
+            met.CACHE_DESALOJOS.inc(desalojos, cache=self.nombre)
+
+    def descartar_llave(self, key: str):
+        """Olvida todo lo guardado para una api_key (p. ej. al cerrar sesión)."""
+        with self._candado:
+            for llave in [ll for ll in self._datos if ll[0] == key]:
+                self._quitar(llave)
+
+    def _quitar(self, llave):
+        _, tam, _ = self._datos.pop(llave)
+        self._bytes -= tam
+
+
+# ---------------------------------------------------------------------
+# CACHÉ DE FRAGMENTOS (terid, día)
+# ---------------------------------------------------------------------
+
+#Campo de fecha con el que cada endpoint ubica un registro en su día
+CAMPO_DIA = {
+    "basic/passenger-count/detail": "opentime",
+    "basic/mileage/count": "starttime",
+}
+
+#Zona horaria de CEIBA: sus fechas y el corte de cada día están en esta hora local,
+#no en la del servidor donde corre la app (p. ej. UTC en Streamlit Cloud)
+ZONA_CEIBA = ZoneInfo(st.secrets.get("CEIBA_ZONA_HORARIA", "America/Mexico_City"))
+
+#Segundos que vive un fragmento del día en curso (los días cerrados no expiran,
+#siempre que se hayan pedido después de cerrar; ver _fragmento_vigente)
+TTL_HOY = 60
+
+#Campo con el que se reconoce lo ya visto del día en curso (refresco incremental)
+CAMPO_CURSOR = {
+    "basic/passenger-count/detail": "closetime",
+}
+#Traslape (s) al pedir desde el cursor, para no perder eventos que se reportan tarde
+MARGEN_DELTA = 300
+
+#Tope de memoria (MB) de la caché de fragmentos; los días cerrados desalojados
+#se vuelven a leer del almacén local
+CACHE_FRAGMENTOS_MB = float(st.secrets.get("CEIBA_CACHE_FRAGMENTOS_MB", 256))
+
+#(api_key, endpoint, terid, dia) -> (columnas, guardado_en, cursor). Compartido por
+#todo el proceso. guardado_en es el time.time() en que se hizo la petición, no el
+#de la respuesta; cursor es el último CAMPO_CURSOR visto (solo en el día en curso).
+_fragmentos = CachePorLlave("fragmentos_lru", int(CACHE_FRAGMENTOS_MB * 2**20))
+#Serializa las lecturas y escrituras de varios fragmentos (p. ej. el refresco de hoy)
+_candado_fragmentos = threading.Lock()
+
+
+def hoy_ceiba() -> date:
+    """Día en curso en la zona horaria de CEIBA."""
+    return datetime.now(ZONA_CEIBA).date()
+
+
+def dia_ceiba(instante: float) -> date:
+    """Día de CEIBA al que pertenece un time.time()."""
+    return datetime.fromtimestamp(instante, ZONA_CEIBA).date()
+
+
+def _fin_del_dia(dia: date) -> float:
+    #time.time() en que termina `dia` en la zona horaria de CEIBA
+    return datetime.combine(dia + timedelta(days=1), dt_time(0, 0, 0), tzinfo=ZONA_CEIBA).timestamp()
+
+
+def _fragmento_vigente(entrada, dia: date, hoy: date, ahora: float, ttl_hoy: float) -> bool:
+    if entrada is None:
+        return False
+    if dia < hoy:
+        #Un día ya cerrado solo es definitivo si se pidió después de cerrar; si se
+        #guardó mientras aún era "hoy" está incompleto y se vuelve a pedir una vez
+        return entrada[1] >= _fin_del_dia(dia)
+    return (ahora - entrada[1]) < ttl_hoy
+
+
+def _dias(inicio: date, fin: date):
+    return [inicio + timedelta(days=i) for i in range((fin - inicio).days + 1)]
+
+
+def fragmentos_faltantes(endpoint: str, terids: list, inicio: date, fin: date, key: str, ttl_hoy: float = TTL_HOY):
+    """
+    Devuelve {terid: [dias]} con los fragmentos de `key` que no están en caché
+    (o que expiraron, en el caso de hoy) para el rango [inicio, fin].
+    """
+    return _revisar_fragmentos(endpoint, terids, inicio, fin, key, ttl_hoy)[0]
+
+
+def _revisar_fragmentos(endpoint: str, terids: list, inicio: date, fin: date, key: str, ttl_hoy: float):
+    #(faltantes, piezas): lo que hay que pedir y {(terid, dia): columnas} de los vigentes.
+    #Las piezas se toman aquí mismo: la caché puede desalojarlas en cualquier momento
+    hoy = hoy_ceiba()
+    ahora = time.time()
+    faltantes = {}
+    piezas = {}
+    with _candado_fragmentos:
+        for terid in terids:
+            terid = str(terid)
+            for d in _dias(inicio, fin):
+                entrada = _fragmentos.ver((key, endpoint, terid, d))
+                if _fragmento_vigente(entrada, d, hoy, ahora, ttl_hoy):
+                    piezas[(terid, d)] = entrada[0]
+                else:
+                    faltantes.setdefault(terid, []).append(d)
+    return faltantes, piezas
+
+
+def _ventanas_faltantes(faltantes: dict):
+    """
+    Agrupa los fragmentos faltantes en peticiones: los terids que comparten los
+    mismos días se piden juntos, una petición por cada tramo de días continuos.
+    Retorna [(terids, dia_inicio, dia_fin)].
+    """
+    por_dias = {}
+    for terid, dias in faltantes.items():
+        por_dias.setdefault(tuple(dias), []).append(terid)
+
+    ventanas = []
+    for dias, terids in por_dias.items():
+        tramo_ini = tramo_fin = dias[0]
+        for d in dias[1:]:
+            if d == tramo_fin + timedelta(days=1):
+                tramo_fin = d
+                continue
+            ventanas.append((terids, tramo_ini, tramo_fin))
+            tramo_ini = tramo_fin = d
+        ventanas.append((terids, tramo_ini, tramo_fin))
+    return ventanas
+
+
+def _guardar_fragmentos(endpoint: str, terids: list, inicio: date, fin: date, columnas: dict, pedido_en: float, key: str,
+                        pares=None):
+    #Repartimos las filas en su (terid, día); los fragmentos sin filas también
+    #se guardan para no volver a pedirlos. `pedido_en` es el time.time() de la petición.
+    #Con `pares` solo se guardan esos (terid, día) y se ignoran las demás filas
+    campo = CAMPO_DIA.get(endpoint, "starttime")
+    if pares is None:
+        pares = [(t, d) for t in terids for d in _dias(inicio, fin)]
+    cubetas = {par: [] for par in pares}
+    n = _largo_columnas(columnas)
+    fechas = columnas.get(campo) or [None] * n
+    ids = columnas.get("terid") or [None] * n
+    for i, (terid, fecha) in enumerate(zip(ids, fechas)):
+        try:
+            dia = date.fromisoformat(str(fecha)[:10])
+        except ValueError:
+            continue
+        cubeta = cubetas.get((str(terid), dia))
+        if cubeta is not None:
+            cubeta.append(i)
+
+    hoy = hoy_ceiba()
+    campo_cursor = CAMPO_CURSOR.get(endpoint)
+    bloques = {}
+    with _candado_fragmentos:
+        for (terid, dia), posiciones in cubetas.items():
+            bloque = _tomar_columnas(columnas, posiciones) if posiciones else {}
+            cursor = None
+            if campo_cursor and dia == hoy:
+                vistos = [v for v in bloque.get(campo_cursor, []) if v]
+                cursor = max(vistos) if vistos else None
+            _fragmentos.guardar((key, endpoint, terid, dia), (bloque, pedido_en, cursor))
+            bloques[(terid, dia)] = bloque
+    return bloques
+
+
+def _faltantes_contados(endpoint: str, terids: list, inicio: date, fin: date, ttl_hoy: float, key: str):
+    #_revisar_fragmentos, anotando hits/misses de la caché de fragmentos
+    faltantes, piezas = _revisar_fragmentos(endpoint, terids, inicio, fin, key, ttl_hoy)
+    n_faltantes = sum(len(dias) for dias in faltantes.values())
+    met.cache("fragmentos", hits=len(piezas), misses=n_faltantes)
+    return faltantes, piezas
+
+
+def _refrescar_hoy(endpoint: str, faltantes: dict, key: str, piezas: dict) -> dict:
+    """
+    Refresco incremental del día en curso: para los terids cuyo fragmento de
+    hoy ya existe pero expiró, pide solo los eventos posteriores al último
+    CAMPO_CURSOR visto (con MARGEN_DELTA de traslape), descarta los repetidos
+    y los agrega al fragmento (y a `piezas`). Retorna los faltantes que aún quedan.
+    """
+    candidatos, json = _refresco_pendiente(endpoint, faltantes, key)
+    if not candidatos:
+        return faltantes
+
+    pedido_en = time.time()
+    ok, payload, err = api_post_fragmentado(endpoint, json=json, columnar=True, key=key)
+    if not ok:
+        #Si falla, esos terids se piden completos como cualquier faltante
+        return faltantes
+    return _aplicar_refresco(endpoint, faltantes, candidatos, payload, pedido_en, key, piezas)
+
+
+def _refresco_pendiente(endpoint: str, faltantes: dict, key: str):
+    """
+    Terids de `faltantes` con fragmento de hoy ya guardado (pero vencido) y el
+    cuerpo de la única petición que los pone al día. (None, None) si no hay.
+    """
+    campo = CAMPO_CURSOR.get(endpoint)
+    if campo is None:
+        return None, None
+
+    hoy = hoy_ceiba()
+    with _candado_fragmentos:
+        entradas = {
+            t: _fragmentos.ver((key, endpoint, t, hoy))
+            for t, dias in faltantes.items() if hoy in dias
+        }
+    candidatos = [t for t, entrada in entradas.items() if entrada is not None]
+    cursores = [entradas[t][2] for t in candidatos]
+    if not candidatos:
+        return None, None
+
+    #Una sola petición desde el cursor más viejo del lote
+    inicio_dia = datetime.combine(hoy, dt_time(0, 0, 0))
+    if all(cursores):
+        desde = datetime.strptime(min(cursores), _FORMATO_FECHA) - timedelta(seconds=MARGEN_DELTA)
+        desde = max(desde, inicio_dia)
+    else:
+        desde = inicio_dia
+
+    return candidatos, {
+        "terid": candidatos,
+        "starttime": desde.strftime(_FORMATO_FECHA),
+        "endtime": f"{hoy} 23:59:59",
+    }
+
+
+def _aplicar_refresco(endpoint: str, faltantes: dict, candidatos: list, payload: dict, pedido_en: float, key: str,
+                      piezas: dict) -> dict:
+    #Agrega a los fragmentos de hoy (y a `piezas`) los eventos nuevos; retorna los faltantes que quedan
+    campo = CAMPO_CURSOR[endpoint]
+    hoy = hoy_ceiba()
+    nuevos = payload.get("data") or {}
+    por_terid = {}
+    for i, terid in enumerate(nuevos.get("terid") or []):
+        por_terid.setdefault(str(terid), []).append(i)
+
+    aplicados = set()
+    with _candado_fragmentos:
+        for terid in candidatos:
+            entrada = _fragmentos.ver((key, endpoint, terid, hoy))
+            if entrada is None:
+                #Se desalojó mientras se pedía: queda como faltante
+                continue
+            bloque, _, cursor = entrada
+            vistos = set(zip(bloque.get("opentime", []), bloque.get(campo, [])))
+            extra = _tomar_columnas(nuevos, por_terid.get(terid, []))
+            posiciones = [
+                i for i, llave in enumerate(zip(extra.get("opentime", []), extra.get(campo, [])))
+                if llave not in vistos
+            ]
+            if posiciones:
+                bloque = _unir_columnas([bloque, _tomar_columnas(extra, posiciones)])
+                vistos_campo = [v for v in bloque.get(campo, []) if v]
+                cursor = max(vistos_campo) if vistos_campo else None
+            _fragmentos.guardar((key, endpoint, terid, hoy), (bloque, pedido_en, cursor))
+            piezas[(terid, hoy)] = bloque
+            aplicados.add(terid)
+
+    restantes = {}
+    for terid, dias in faltantes.items():
+        if terid in aplicados:
+            dias = [d for d in dias if d != hoy]
+        if dias:
+            restantes[terid] = dias
+    return restantes
+
+
+def _desde_almacen(endpoint: str, groupid, faltantes: dict, key: str, piezas: dict) -> dict:
+    """
+    Carga del almacén local (a la caché y a `piezas`) los fragmentos faltantes
+    de días cerrados que ya estén guardados para el grupo. Retorna los
+    faltantes que aún quedan.
+    """
+    tipo = almacen.tipo_de_endpoint(endpoint)
+    if tipo is None or groupid is None:
+        return faltantes
+
+    antes = sum(len(dias) for dias in faltantes.values())
+    hoy = hoy_ceiba()
+    por_dia = {}
+    for terid, dias in faltantes.items():
+        for d in dias:
+            if d < hoy:
+                por_dia.setdefault(d, []).append(terid)
+
+    #(terid, día) que el almacén ya tiene; la cobertura sale de los metadatos de cada partición
+    cargados = set()
+    for d, terids in por_dia.items():
+        cubiertos = almacen.terids_cubiertos(tipo, groupid, d)
+        cargados.update((t, d) for t in terids if t in cubiertos)
+
+    if cargados:
+        #Una sola lectura del rango; las filas se reparten por día con el mismo campo
+        #con el que _al_almacen las separó al escribirlas
+        inicio, fin = min(d for _, d in cargados), max(d for _, d in cargados)
+        ids = sorted({t for t, _ in cargados})
+        columnas = almacen.leer_columnas(tipo, groupid, inicio, fin, terids=ids)
+        #El almacén solo tiene días pedidos ya cerrados (ver _al_almacen): son definitivos
+        piezas.update(_guardar_fragmentos(endpoint, ids, inicio, fin, columnas, _fin_del_dia(fin), key,
+                                          pares=cargados))
+        cargados.update((t, d) for t in cubiertos)
+
+    restantes = {}
+    for terid, dias in faltantes.items():
+        dias = [d for d in dias if (terid, d) not in cargados]
+        if dias:
+            restantes[terid] = dias
+    met.cache("almacen", hits=len(cargados), misses=antes - len(cargados))
+    return restantes
+
+
+def _al_almacen(endpoint: str, groupid, terids: list, inicio: date, fin: date, bloques: dict, pedido_en: float):
+    #Los días que ya estaban cerrados al hacer la petición se guardan como partición (grupo, día)
+    tipo = almacen.tipo_de_endpoint(endpoint)
+    if tipo is None or groupid is None:
+        return
+    for d in _dias(inicio, min(fin, dia_ceiba(pedido_en) - timedelta(days=1))):
+        almacen.escribir_dia(tipo, groupid, d, _unir_columnas([bloques[(t, d)] for t in terids]), terids,
+                             hoy=hoy_ceiba())
+
+
+def _json_ventana(terids: list, inicio: date, fin: date) -> dict:
+    return {"terid": terids, "starttime": f"{inicio} 00:00:00", "endtime": f"{fin} 23:59:59"}
+
+
+def _guardar_ventana(endpoint: str, groupid, terids: list, inicio: date, fin: date, columnas: dict,
+                     pedido_en: float, key: str):
+    #Una ventana recién descargada: a la caché de fragmentos y al almacén.
+    #Retorna {(terid, dia): columnas} de la ventana
+    bloques = _guardar_fragmentos(endpoint, terids, inicio, fin, columnas, pedido_en, key)
+    _al_almacen(endpoint, groupid, terids, inicio, fin, bloques, pedido_en)
+    return bloques
+
+
+def _llave_ventana(endpoint: str, groupid, terids: list, inicio: date, fin: date, key: str) -> tuple:
+    #Llave de single-flight de "pedir y guardar" una ventana faltante (ver _descargar_ventana)
+    return "ventana", _llave_vuelo(endpoint, _json_ventana(terids, inicio, fin), key, True), str(groupid)
+
+
+def _descargar_ventana(endpoint: str, groupid, terids: list, inicio: date, fin: date, key: str):
+    """
+    Pide a CEIBA una ventana faltante y la guarda en la caché y el almacén.
+    Si otra llamada (p. ej. el precalentamiento o la precarga de ceiba_async)
+    ya la está pidiendo, espera su resultado: solo quien hizo la petición la
+    guarda. Retorna (ok, {(terid, dia): columnas}, err).
+    """
+    llave = _llave_ventana(endpoint, groupid, terids, inicio, fin, key)
+    vuelo, lider = _abordar(llave)
+    if not lider:
+        return vuelo.futuro.result()
+
+    resultado = _ERROR_VUELO
+    try:
+        #Los huecos grandes se piden en fragmentos paralelos
+        pedido_en = time.time()
+        ok, payload, err = api_post_fragmentado(endpoint, json=_json_ventana(terids, inicio, fin),
+                                                columnar=True, key=key)
+        #No guardamos respuestas de error como fragmentos vacíos
+        if not ok:
+            resultado = False, None, err
+        else:
+            bloques = _guardar_ventana(endpoint, groupid, terids, inicio, fin, payload.get("data") or {}, pedido_en, key)
+            resultado = True, bloques, None
+    finally:
+        _aterrizar(llave, vuelo, resultado)
+    return resultado
+
+
+#Error cuando falta algún (terid, día) al armar la respuesta
+ERROR_INCOMPLETO = "Respuesta incompleta: faltan fragmentos (terid, día) del rango."
+
+
+def _ensamblar(piezas: dict, terids: list, inicio: date, fin: date):
+    """
+    Columnas de [inicio, fin] para `terids` a partir de las piezas reunidas en
+    esta llamada (caché, almacén y CEIBA), no de una segunda lectura de la
+    caché, que pudo desalojarlas. None si falta alguna: nunca se regresa un
+    resultado parcial como completo.
+    """
+    bloques = []
+    for terid in terids:
+        for d in _dias(inicio, fin):
+            bloque = piezas.get((terid, d))
+            if bloque is None:
+                return None
+            bloques.append(bloque)
+    return _unir_columnas(bloques)
+
+
+@inst.medir("ceiba.por_dia")
+def api_post_por_dia(
+        endpoint: str,
+        terids: list,
+        inicio: date,
+        fin: date,
+        groupid=None,
+        ttl_hoy: float = TTL_HOY,
+        key: str | None = None,
+):
+    """
+    Igual que api_post para endpoints con ventana starttime/endtime, pero
+    respaldado por la caché de fragmentos (terid, día): solo se piden a CEIBA
+    los fragmentos que faltan. Los días pedidos después de cerrar se guardan
+    indefinidamente y el día en curso expira a los TTL_HOY segundos. Los fragmentos se
+    decodifican y guardan por columnas (ver _post_columnas_directo).
+    Con `groupid`, los días cerrados se buscan primero en el almacén local
+    (Parquet) y lo descargado de CEIBA se guarda ahí.
+    El día en curso se refresca cada `ttl_hoy` segundos pidiendo solo los
+    eventos nuevos (ver _refrescar_hoy).
+    Con `key` explícita se puede llamar desde hilos sin session_state.
+    Retorna (ok, {"data": columnas}, err).
+    """
+    key = key or st.session_state.get("api_key")
+    if not key:
+        return False, None, "No autenticado (falta api_key)."
+    terids = [str(t) for t in terids]
+
+    faltantes, piezas = _faltantes_contados(endpoint, terids, inicio, fin, ttl_hoy, key)
+    faltantes = _refrescar_hoy(endpoint, faltantes, key, piezas)
+    faltantes = _desde_almacen(endpoint, groupid, faltantes, key, piezas)
+    for ids, ini, fin_v in _ventanas_faltantes(faltantes):
+        ok, bloques, err = _descargar_ventana(endpoint, groupid, ids, ini, fin_v, key)
+        if not ok:
+            return False, None, err
+        piezas.update(bloques)
+
+    data = _ensamblar(piezas, terids, inicio, fin)
+    if data is None:
+        return False, None, ERROR_INCOMPLETO
+    return True, {"data": data}, None
+
+
+# ---------------------------------------------------------------------
+# DIRECTORIO (grupos y dispositivos) POR API KEY
+# ---------------------------------------------------------------------
+
+#Segundos que se reutiliza el directorio armado con basic/groups y basic/devices
+TTL_DIRECTORIO = 300
+#Tope de memoria (MB) de la caché por api_key, entre todos los usuarios del proceso
+CACHE_LLAVES_MB = float(st.secrets.get("CEIBA_CACHE_LLAVES_MB", 64))
+
+_cache_llaves = CachePorLlave("por_api_key", int(CACHE_LLAVES_MB * 2**20))
+
+
+def _grupos_de(key: str):
+    ok, payload, err = _get("basic/groups", None, key)
     if not ok:
         return [], err
     grupos = payload.get("data", []) or []
@@ -110,17 +1165,9 @@ def listar_grupos():
     return out, None
 
 
-###Juanito
-@st.cache_data(ttl=300)
-def listar_dispositivos_simplificado(groupid: str | None = None):
-    """
-    Devuelve la lista de dispositivos del usuario en un formato normalizado:
-      { "groupid": str, "carlicence": str, "terid": str }
-    Si se especifica groupid, filtra por ese grupo.
-    Es robusta a variaciones de llaves del backend.
-    """
+def _dispositivos_de(key: str, groupid: str | None = None):
     # Pedimos todos los dispositivos del usuario
-    ok, payload, err = api_get("basic/devices", params={'key': st.session_state.get("api_key")})
+    ok, payload, err = _get("basic/devices", None, key)
     if not ok:
         return [], err
 
@@ -146,10 +1193,128 @@ def listar_dispositivos_simplificado(groupid: str | None = None):
 
     return out, None
 
+
+@dataclass(frozen=True)
+class DirectorioDispositivos:
+    """
+    Grupos y dispositivos de una api_key con sus índices ya armados, para que
+    filtrar por grupo o traducir placa <-> terid no recorra la lista. Es
+    inmutable y se comparte entre sesiones (ver `directorio`). Los groupid y
+    terid se indexan como texto.
+    """
+    grupos: tuple                  # ({groupid, groupname}, ...) en el orden de CEIBA
+    dispositivos: tuple            # ({groupid, carlicence, terid}, ...)
+    por_grupo: MappingProxyType    # groupid -> (dispositivos...)
+    placa_por_terid: MappingProxyType
+    terid_por_placa_por_grupo: MappingProxyType   # groupid -> {placa: terid}
+    conteo_por_grupo: MappingProxyType
+    nombre_por_grupo: MappingProxyType
+
+    @classmethod
+    def desde(cls, grupos: list, dispositivos: list) -> "DirectorioDispositivos":
+        dispositivos = tuple(MappingProxyType(dict(d)) for d in dispositivos)
+        por_grupo = {}
+        placa_por_terid = {}
+        terid_por_placa = {}
+        for d in dispositivos:
+            gid, placa, ter = d.get("groupid"), d.get("carlicence"), d.get("terid")
+            if gid is not None:
+                por_grupo.setdefault(str(gid), []).append(d)
+            if placa and ter:
+                placa_por_terid[str(ter)] = placa
+                #Las placas solo son únicas dentro de un grupo (p. ej. "SIN PLACA" se repite)
+                terid_por_placa.setdefault(str(gid), {})[placa] = ter
+
+        return cls(
+            grupos=tuple(MappingProxyType(dict(g)) for g in grupos),
+            dispositivos=dispositivos,
+            por_grupo=MappingProxyType({gid: tuple(ds) for gid, ds in por_grupo.items()}),
+            placa_por_terid=MappingProxyType(placa_por_terid),
+            terid_por_placa_por_grupo=MappingProxyType({
+                gid: MappingProxyType(mapa) for gid, mapa in terid_por_placa.items()
+            }),
+            conteo_por_grupo=MappingProxyType({gid: len(ds) for gid, ds in por_grupo.items()}),
+            nombre_por_grupo=MappingProxyType({
+                str(g.get("groupid")): g.get("groupname") for g in grupos if g.get("groupid") is not None
+            }),
+        )
+
+    def dispositivos_de(self, groupid) -> tuple:
+        return self.por_grupo.get(str(groupid), ())
+
+    def conteo(self, groupid) -> int:
+        return self.conteo_por_grupo.get(str(groupid), 0)
+
+    def terids_de(self, groupid) -> list:
+        return [d.get("terid") for d in self.dispositivos_de(groupid) if d.get("terid")]
+
+    def terid_por_placa_de(self, groupid) -> MappingProxyType:
+        return self.terid_por_placa_por_grupo.get(str(groupid), MappingProxyType({}))
+
+    def placas_de(self, groupid) -> list:
+        #Solo las unidades que tienen placa y terid (las que se pueden consultar)
+        return [d.get("carlicence") for d in self.dispositivos_de(groupid)
+                if d.get("carlicence") and d.get("terid")]
+
+    def grupo_inicial(self):
+        """Primer grupo con al menos una unidad (o el primero si ninguno tiene)."""
+        for g in self.grupos:
+            if self.conteo(g.get("groupid")):
+                return g
+        return self.grupos[0] if self.grupos else None
+
+
+def directorio(key: str | None = None):
+    """
+    DirectorioDispositivos de `key` (por defecto la de la sesión), armado una
+    vez por api_key y reutilizado por todo el proceso durante TTL_DIRECTORIO
+    (en la caché por api_key, con su tope de memoria). Retorna (directorio, err).
+    """
+    key = key or st.session_state.get("api_key")
+    if not key:
+        return None, "No autenticado (falta api_key)."
+
+    armado = _cache_llaves.obtener((key, "directorio"), TTL_DIRECTORIO)
+    if armado is not _FALTA:
+        return armado, None
+
+    grupos, err = _grupos_de(key)
+    if err:
+        return None, err
+    dispositivos, err = _dispositivos_de(key)
+    if err:
+        return None, err
+
+    armado = DirectorioDispositivos.desde(grupos, dispositivos)
+    _cache_llaves.guardar((key, "directorio"), armado)
+    return armado, None
+
+
+### Juanito
+def listar_grupos():
+    dire, err = directorio()
+    if err:
+        return [], err
+    return [dict(g) for g in dire.grupos], None
+
+
+###Juanito
+def listar_dispositivos_simplificado(groupid: str | None = None):
+    """
+    Devuelve la lista de dispositivos del usuario en un formato normalizado:
+      { "groupid": str, "carlicence": str, "terid": str }
+    Si se especifica groupid, filtra por ese grupo.
+    Es robusta a variaciones de llaves del backend.
+    """
+    dire, err = directorio()
+    if err:
+        return [], err
+    dispositivos = dire.dispositivos if groupid is None else dire.dispositivos_de(groupid)
+    return [dict(d) for d in dispositivos], None
+
 #Modificaciones Emiliano
 
 ###Emiliano
-@st.cache_data(ttl=300)
 def grupo_por_defecto():
     """
     Devuelve (groupid, groupname, err) del primer grupo disponible para el usuario.
@@ -163,7 +1328,6 @@ def grupo_por_defecto():
     return g0.get("groupid"), g0.get("groupname"), None
 
 ###Opciones de grupos
-@st.cache_data(ttl=300)
 def opciones_de_grupos():
     """
     Regresa (groupnames, map_name_to_id, err) para poblar el sidebar.
@@ -181,7 +1345,6 @@ def opciones_de_grupos():
     return groupnames, map_name_to_id, None
 
 ###Emiliano
-@st.cache_data(ttl=300)
 def listar_dispositivos_por_grupo(groupid: str):
     """
     Filtra los dispositivos del usuario por un groupid dado.
@@ -190,15 +1353,12 @@ def listar_dispositivos_por_grupo(groupid: str):
     if not groupid:
         return [], "groupid no proporcionado."
 
-    dispositivos, err = listar_dispositivos_simplificado()
+    dire, err = directorio()
     if err:
         return [], err
-
-    filtrados = [d for d in dispositivos if d.get("groupid") == groupid]
-    return filtrados, None
+    return list(dire.dispositivos_de(groupid)), None
 
 ###Emiliano
-@st.cache_data(ttl=300)
 def placas_y_mapas_por_grupo(groupid: str):
     """
     Para un groupid dado:
@@ -207,36 +1367,75 @@ def placas_y_mapas_por_grupo(groupid: str):
       - map_terid_to_placa
     Retorna (placas, map_placa_to_terid, map_terid_to_placa, err)
     """
-    dispositivos, err = listar_dispositivos_por_grupo(groupid)
+    if not groupid:
+        return [], {}, {}, "groupid no proporcionado."
+
+    dire, err = directorio()
     if err:
         return [], {}, {}, err
 
-    placas = []
-    map_placa_to_terid = {}
-    map_terid_to_placa = {}
-
-    for d in dispositivos:
-        placa = d.get("carlicence")
-        terid = d.get("terid")
-        if placa and terid:
-            placas.append(placa)
-            map_placa_to_terid[placa] = terid
-            map_terid_to_placa[terid] = placa
-
+    placas = dire.placas_de(groupid)
+    map_placa_to_terid = dict(dire.terid_por_placa_de(groupid))
+    #Desde placa_por_terid: invertir placa->terid perdería las unidades con placa repetida
+    map_terid_to_placa = {
+        t: dire.placa_por_terid[str(t)]
+        for t in dire.terids_de(groupid) if str(t) in dire.placa_por_terid
+    }
     return placas, map_placa_to_terid, map_terid_to_placa, None
 
 ####Emiliano
-@st.cache_data(ttl=300)
 def terids_por_grupo(groupid: str):
     """
     Devuelve solo la lista de terids del groupid.
     Retorna (terids, err)
     """
-    dispositivos, err = listar_dispositivos_por_grupo(groupid)
+    if not groupid:
+        return [], "groupid no proporcionado."
+
+    dire, err = directorio()
     if err:
         return [], err
-    return [d.get("terid") for d in dispositivos if d.get("terid")], None
+    return dire.terids_de(groupid), None
+
+
+
+# ---------------------------------------------------------------------
+# PRECALENTAMIENTO DE CACHÉ (al iniciar sesión)
+# ---------------------------------------------------------------------
 
+#Días que se precargan del grupo por defecto (la ventana por defecto de las páginas)
+DIAS_PRECALENTAR = 7
+
+_pool_precalentar = ThreadPoolExecutor(max_workers=4, thread_name_prefix="precalentar")
+
+
+def _precalentar(key: str):
+    dire, err = directorio(key)
+    if err:
+        return
+
+    #Misma regla que util.sidebar_grupos: primer grupo con al menos una unidad
+    grupo = dire.grupo_inicial()
+    gid = grupo.get("groupid") if grupo else None
+    terids = dire.terids_de(gid)
+    if not terids:
+        return
+
+    fin = hoy_ceiba()
+    inicio = fin - timedelta(days=DIAS_PRECALENTAR - 1)
+    for endpoint in ("basic/passenger-count/detail", "basic/mileage/count"):
+        _pool_precalentar.submit(api_post_por_dia, endpoint, terids, inicio, fin, groupid=gid, key=key)
+
+
+def precalentar(key: str):
+    """
+    Carga en segundo plano el directorio de dispositivos y los últimos
+    DIAS_PRECALENTAR días del grupo por defecto, para que la primera página
+    encuentre todo en caché. Si la página pide lo mismo mientras tanto (con
+    ceiba_client o con la precarga de ceiba_async), se une a la petición en
+    vuelo (single-flight) en lugar de repetirla.
+    """
+    _pool_precalentar.submit(_precalentar, key)
 
 
 #Modificaciones Emiliano
@@ -292,6 +1491,8 @@ def login():
                 ok, key, err = validarUsuario(parUsuario, parPassword)
             if ok and key:
                 _guardar_sesion(parUsuario, key)
+                #Mientras se dibuja la página, la caché se llena en segundo plano
+                precalentar(key)
                 st.rerun()
             else:
                 st.error(err or "Usuario o clave inválidos", icon=":material/gpp_maybe:")
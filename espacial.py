@@ -0,0 +1,192 @@
+# U T I L I D A D E S   E S P A C I A L E S
+import numpy as np
+import shapely
+
+
+# Z O N A S   D I B U J A D A S
+
+#Máscara booleana de los eventos que caen dentro de la zona (sin incluir el borde)
+def mascara_en_zona(
+        zona,
+        lat,
+        lon,
+) -> np.ndarray:
+    """
+    Evalúa todos los puntos (lat, lon) contra `zona` en una sola llamada.
+    Primero descarta con la caja envolvente de la zona y solo los candidatos
+    se prueban contra la geometría preparada. Equivale a `zona.contains(Point)`.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    mascara = np.zeros(lat.shape[0], dtype=bool)
+
+    if zona is None or zona.is_empty or not lat.size:
+        return mascara
+
+    #Prefiltro por caja envolvente (GeoJSON: x = lon, y = lat)
+    minx, miny, maxx, maxy = zona.bounds
+    candidatos = np.flatnonzero(
+        (lon >= minx) & (lon <= maxx) & (lat >= miny) & (lat <= maxy)
+    )
+    if not candidatos.size:
+        return mascara
+
+    shapely.prepare(zona)
+    mascara[candidatos] = shapely.contains_xy(zona, lon[candidatos], lat[candidatos])
+    return mascara
+
+
+# M A P A   D E   C A L O R
+
+#Agrupa los eventos en una rejilla cuyo tamaño de celda depende del zoom
+def binear_calor(
+        lat,
+        lon,
+        peso,
+        zoom: int,
+        radio_px: int = 25,
+) -> list:
+    """
+    Pre-agrega los eventos para HeatMap: celdas de `radio_px / 2` pixeles al
+    `zoom` dado (el mismo tamaño de celda que usa Leaflet.heat internamente),
+    cada una representada por el centroide ponderado de sus eventos y la suma
+    de sus pesos. Solo regresa celdas con peso > 0, como [[lat, lon, peso]].
+    El tamaño del resultado depende de la resolución del mapa, no del número
+    de eventos.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    peso = np.asarray(peso, dtype=float)
+
+    validos = (peso > 0) & np.isfinite(lat) & np.isfinite(lon)
+    lat, lon, peso = lat[validos], lon[validos], peso[validos]
+    if not peso.size:
+        return []
+
+    #Grados por pixel en Web Mercator; la latitud se corrige por cos(lat)
+    grados_px = 360.0 / (256 * 2 ** zoom)
+    dlon = grados_px * radio_px / 2
+    dlat = dlon * np.cos(np.radians(lat.mean()))
+
+    ix = np.floor(lon / dlon).astype(np.int64)
+    iy = np.floor(lat / dlat).astype(np.int64)
+    _, celda = np.unique(np.stack((iy, ix), axis=1), axis=0, return_inverse=True)
+    celda = celda.ravel()
+
+    suma = np.bincount(celda, weights=peso)
+    lat_c = np.bincount(celda, weights=lat * peso) / suma
+    lon_c = np.bincount(celda, weights=lon * peso) / suma
+
+    return np.column_stack((lat_c, lon_c, suma)).tolist()
+
+
+# Í N D I C E   E N   R E J I L L A
+
+#Posiciones [inicio, inicio + largo) de varios rangos, concatenadas
+def _rangos(inicios: np.ndarray, largos: np.ndarray) -> np.ndarray:
+    total = int(largos.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    desplazamientos = np.repeat(inicios - np.concatenate(([0], np.cumsum(largos)[:-1])), largos)
+    return desplazamientos + np.arange(total)
+
+
+class IndiceRejilla:
+    """
+    Rejilla uniforme sobre los eventos de un dataset, con `on`, `off` y el
+    número de eventos ya sumados por celda. Se construye una vez por dataset;
+    cada consulta suma directamente las celdas que quedan completamente dentro
+    de la zona y solo prueba punto por punto las celdas del borde.
+    """
+
+    def __init__(self, lat, lon, on, off, celdas_por_lado: int | None = None):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        on = np.asarray(on, dtype=float)
+        off = np.asarray(off, dtype=float)
+
+        n = lat.shape[0]
+        if celdas_por_lado is None:
+            #~32 eventos por celda en promedio, sin pasar de 256 x 256
+            celdas_por_lado = int(np.clip(np.sqrt(n / 32), 1, 256))
+        self.nx = self.ny = celdas_por_lado
+
+        if n:
+            self.minx, self.maxx = float(lon.min()), float(lon.max())
+            self.miny, self.maxy = float(lat.min()), float(lat.max())
+        else:
+            self.minx = self.maxx = self.miny = self.maxy = 0.0
+        self.dx = (self.maxx - self.minx) / self.nx or 1e-9
+        self.dy = (self.maxy - self.miny) / self.ny or 1e-9
+
+        ix = np.clip(((lon - self.minx) / self.dx).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((lat - self.miny) / self.dy).astype(np.int64), 0, self.ny - 1)
+        celda = iy * self.nx + ix
+
+        #Eventos ordenados por celda: los de la celda c están en [inicio[c], inicio[c+1])
+        total_celdas = self.nx * self.ny
+        self._orden = np.argsort(celda, kind="stable")
+        self._conteo = np.bincount(celda, minlength=total_celdas)
+        self._inicio = np.concatenate(([0], np.cumsum(self._conteo)))
+        self._suma_on = np.bincount(celda, weights=on, minlength=total_celdas)
+        self._suma_off = np.bincount(celda, weights=off, minlength=total_celdas)
+
+        self._lat = lat[self._orden]
+        self._lon = lon[self._orden]
+        self._on = on[self._orden]
+        self._off = off[self._orden]
+
+    def _cajas(self, celdas: np.ndarray):
+        #Cajas de las celdas, apenas ensanchadas para que contengan a sus puntos
+        eps = 1e-9 * max(self.dx, self.dy)
+        ix = celdas % self.nx
+        iy = celdas // self.nx
+        x0 = self.minx + ix * self.dx
+        y0 = self.miny + iy * self.dy
+        return shapely.box(x0 - eps, y0 - eps, x0 + self.dx + eps, y0 + self.dy + eps)
+
+    def consultar(self, zona):
+        """
+        Retorna (total_on, total_off, n_eventos, posiciones) de los eventos
+        dentro de `zona` (sin incluir el borde). `posiciones` son las filas del
+        dataset original, en orden ascendente.
+        """
+        vacio = (0.0, 0.0, 0, np.empty(0, dtype=np.int64))
+        if zona is None or zona.is_empty or not self._orden.size:
+            return vacio
+
+        #Celdas que tocan la caja envolvente de la zona y tienen eventos
+        minx, miny, maxx, maxy = zona.bounds
+        ix0 = max(int((minx - self.minx) // self.dx), 0)
+        ix1 = min(int((maxx - self.minx) // self.dx), self.nx - 1)
+        iy0 = max(int((miny - self.miny) // self.dy), 0)
+        iy1 = min(int((maxy - self.miny) // self.dy), self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return vacio
+
+        iy, ix = np.mgrid[iy0:iy1 + 1, ix0:ix1 + 1]
+        celdas = (iy * self.nx + ix).ravel()
+        celdas = celdas[self._conteo[celdas] > 0]
+        if not celdas.size:
+            return vacio
+
+        shapely.prepare(zona)
+        cajas = self._cajas(celdas)
+        dentro = shapely.contains_properly(zona, cajas)
+        borde = ~dentro & shapely.intersects(zona, cajas)
+
+        llenas = celdas[dentro]
+        total_on = float(self._suma_on[llenas].sum())
+        total_off = float(self._suma_off[llenas].sum())
+        pos_llenas = _rangos(self._inicio[llenas], self._conteo[llenas])
+
+        #Celdas del borde: prueba punto por punto
+        celdas_borde = celdas[borde]
+        pos_borde = _rangos(self._inicio[celdas_borde], self._conteo[celdas_borde])
+        if pos_borde.size:
+            pos_borde = pos_borde[shapely.contains_xy(zona, self._lon[pos_borde], self._lat[pos_borde])]
+            total_on += float(self._on[pos_borde].sum())
+            total_off += float(self._off[pos_borde].sum())
+
+        posiciones = np.sort(self._orden[np.concatenate((pos_llenas, pos_borde))])
+        return total_on, total_off, int(posiciones.size), posiciones
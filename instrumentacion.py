@@ -0,0 +1,285 @@
+     # I N S T R U M E N T A C I Ó N   ( T I E M P O S   P O R   E J E C U C I Ó N )
+import contextvars
+import dataclasses
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import metricas as met
+
+#Panel de depuración en el sidebar: INSITRA_DEBUG=1 o ?debug=1 en la URL
+DEBUG = os.environ.get("INSITRA_DEBUG", "").lower() in ("1", "true", "si", "sí")
+
+#Una línea JSON por ejecución de página. Sin handler configurado no se escribe nada;
+#con INSITRA_LOG_RENDIMIENTO=ruta se agrega un archivo .jsonl
+log = logging.getLogger("insitra.rendimiento")
+if os.environ.get("INSITRA_LOG_RENDIMIENTO"):
+    _handler = logging.FileHandler(os.environ["INSITRA_LOG_RENDIMIENTO"], encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+
+
+class Traza:
+    """Spans de una ejecución (rerun) de una página."""
+
+    def __init__(self, pagina: str):
+        self.pagina = pagina
+        self.id = uuid.uuid4().hex[:8]
+        self.inicio = datetime.now()
+        self._t0 = time.perf_counter()
+        self._fin = None
+        self.spans = []
+        self._candado = threading.Lock()
+
+    @property
+    def cerrada(self) -> bool:
+        return self._fin is not None
+
+    def ms(self) -> float:
+        return ((self._fin or time.perf_counter()) - self._t0) * 1000
+
+    def agregar(self, nombre: str, inicio: float, fin: float, nivel: int, filas, error):
+        with self._candado:
+            self.spans.append({
+                "nombre": nombre,
+                "inicio_ms": round((inicio - self._t0) * 1000, 2),
+                "duracion_ms": round((fin - inicio) * 1000, 2),
+                "filas": filas,
+                "nivel": nivel,
+                "hilo": threading.current_thread().name,
+                "error": error,
+            })
+
+    def cerrar(self):
+        if self.cerrada:
+            return
+        #Si la página se detuvo antes (st.stop) la duración llega hasta el último span
+        fines = [self._t0 + (s["inicio_ms"] + s["duracion_ms"]) / 1000 for s in self.spans]
+        self._fin = time.perf_counter() if not fines else max(max(fines), time.perf_counter())
+        met.RERUN_SEGUNDOS.observar((self._fin - self._t0), pagina=self.pagina)
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps(self.como_dict(), ensure_ascii=False, default=str))
+
+    def como_dict(self) -> dict:
+        with self._candado:
+            spans = sorted(self.spans, key=lambda s: s["inicio_ms"])
+        return {
+            "evento": "rerun",
+            "pagina": self.pagina,
+            "rerun": self.id,
+            "inicio": self.inicio.isoformat(timespec="milliseconds"),
+            "duracion_ms": round(self.ms(), 2),
+            "spans": spans,
+        }
+
+
+#Traza activa y profundidad del span actual en este hilo/contexto
+_traza = contextvars.ContextVar("insitra_traza", default=None)
+_nivel = contextvars.ContextVar("insitra_nivel", default=0)
+
+
+# S P A N S
+
+@contextmanager
+def span(nombre: str):
+    """
+    Mide el bloque como un span de la ejecución actual. Se puede anotar el
+    número de filas con `datos["filas"] = n`. Sin traza activa no hace nada.
+    """
+    datos = {}
+    traza = _traza.get()
+    if traza is None:
+        yield datos
+        return
+
+    nivel = _nivel.get()
+    token = _nivel.set(nivel + 1)
+    error = None
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _nivel.reset(token)
+        fin = time.perf_counter()
+        met.SPAN_SEGUNDOS.observar(fin - inicio, span=nombre)
+        traza.agregar(nombre, inicio, fin, nivel, datos.get("filas"), error)
+
+
+def contar_filas(resultado):
+    """Filas de un resultado típico de la app (DataFrame, payload de CEIBA, figura...)."""
+    if resultado is None:
+        return None
+    if hasattr(resultado, "shape"):
+        return int(resultado.shape[0])
+    if hasattr(resultado, "to_plotly_json"):
+        return sum(len(t.x) for t in resultado.data if getattr(t, "x", None) is not None)
+    if dataclasses.is_dataclass(resultado):
+        return contar_filas(getattr(resultado, dataclasses.fields(resultado)[0].name))
+    if isinstance(resultado, dict):
+        data = resultado.get("data")
+        if isinstance(data, dict):
+            return len(next(iter(data.values()))) if data else 0
+        return len(data) if isinstance(data, list) else None
+    if isinstance(resultado, tuple):
+        #(ok, payload, err) de ceiba_client o (fig, df) de Graphics
+        for elemento in reversed(resultado):
+            filas = contar_filas(elemento)
+            if filas is not None:
+                return filas
+        return None
+    if isinstance(resultado, list):
+        return len(resultado)
+    return None
+
+
+def medir(nombre: str | None = None):
+    """Decorador: cada llamada es un span con las filas del resultado."""
+    def decorador(funcion):
+        etiqueta = nombre or f"{funcion.__module__}.{funcion.__name__}"
+
+        @functools.wraps(funcion)
+        def envuelta(*args, **kwargs):
+            if _traza.get() is None:
+                return funcion(*args, **kwargs)
+            with span(etiqueta) as datos:
+                resultado = funcion(*args, **kwargs)
+                datos["filas"] = contar_filas(resultado)
+                return resultado
+
+        return envuelta
+    return decorador
+
+
+def propagar(funcion):
+    """
+    Envuelve `funcion` para que, al correr en otro hilo (p. ej. un
+    ThreadPoolExecutor), sus spans se sigan anotando en la traza actual.
+    """
+    traza, nivel = _traza.get(), _nivel.get()
+    if traza is None:
+        return funcion
+
+    @functools.wraps(funcion)
+    def envuelta(*args, **kwargs):
+        tokens = _traza.set(traza), _nivel.set(nivel)
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _nivel.reset(tokens[1])
+            _traza.reset(tokens[0])
+
+    return envuelta
+
+
+def contexto() -> tuple:
+    """Traza y nivel actuales, para adoptarlos en otro hilo o bucle asyncio."""
+    return _traza.get(), _nivel.get()
+
+
+def adoptar(contexto_: tuple):
+    """
+    Hace de `contexto_` (ver contexto()) el contexto actual. Dentro de una
+    tarea asyncio solo afecta a esa tarea y a las que cree.
+    """
+    _traza.set(contexto_[0])
+    _nivel.set(contexto_[1])
+
+
+# E J E C U C I O N E S   D E   P Á G I N A
+
+def _debug_activo() -> bool:
+    import streamlit as st
+    return DEBUG or st.query_params.get("debug") == "1"
+
+
+def _dibujar(traza: Traza, titulo: str):
+    import pandas as pd
+    import streamlit as st
+
+    lugar = st.session_state.get("_inst_panel")
+    if lugar is None:
+        return
+    with lugar.container():
+        with st.expander(f"⏱ Rendimiento ({titulo})", expanded=False):
+            datos = traza.como_dict()
+            st.caption(f"{datos['pagina']} · {datos['duracion_ms']:.0f} ms · rerun {datos['rerun']}")
+            if datos["spans"]:
+                tabla = pd.DataFrame(datos["spans"])
+                tabla["nombre"] = ["· " * n + s for n, s in zip(tabla["nivel"], tabla["nombre"])]
+                st.dataframe(
+                    tabla[["nombre", "duracion_ms", "filas", "inicio_ms", "hilo", "error"]],
+                    hide_index=True, use_container_width=True,
+                )
+
+
+def iniciar_rerun(pagina: str) -> Traza:
+    """
+    Abre la traza de esta ejecución de `pagina`. Si la anterior quedó abierta
+    (la página se detuvo con st.stop) se cierra y registra aquí. Con el modo
+    debug activo reserva el panel del sidebar y muestra la ejecución anterior.
+    """
+    import streamlit as st
+
+    anterior = st.session_state.get("_inst_traza")
+    if anterior is not None:
+        anterior.cerrar()
+
+    met.RERUNS.inc(pagina=pagina)
+    traza = Traza(pagina)
+    _traza.set(traza)
+    _nivel.set(0)
+    st.session_state["_inst_traza"] = traza
+
+    st.session_state["_inst_panel"] = st.sidebar.empty() if _debug_activo() else None
+    if anterior is not None:
+        _dibujar(anterior, "ejecución anterior")
+    return traza
+
+
+def seccion(nombre: str):
+    """
+    Decorador para las secciones st.fragment de una página. Dentro de la
+    ejecución completa la sección es un span más; cuando Streamlit vuelve a
+    ejecutar solo la sección, abre y cierra su propia traza ("Página:sección").
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envuelta(*args, **kwargs):
+            import streamlit as st
+
+            pagina = _traza.get() or st.session_state.get("_inst_traza")
+            if pagina is not None and not pagina.cerrada:
+                with span(f"seccion.{nombre}"):
+                    return funcion(*args, **kwargs)
+
+            traza = Traza(f"{pagina.pagina}:{nombre}" if pagina else nombre)
+            met.RERUNS.inc(pagina=traza.pagina)
+            tokens = _traza.set(traza), _nivel.set(0)
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                traza.cerrar()
+                _nivel.reset(tokens[1])
+                _traza.reset(tokens[0])
+
+        return envuelta
+    return decorador
+
+
+def cerrar_rerun():
+    """Cierra y registra la traza actual y la muestra en el panel de depuración."""
+    traza = _traza.get()
+    if traza is None:
+        return
+    traza.cerrar()
+    _dibujar(traza, "esta ejecución")
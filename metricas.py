@@ -0,0 +1,214 @@
+     # M É T R I C A S   D E L   P R O C E S O   ( F O R M A T O   P R O M E T H E U S )
+import itertools
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#Exportación: archivo de texto (p. ej. para el textfile collector de node_exporter)
+#y/o endpoint HTTP /metrics en un puerto local
+ARCHIVO = os.environ.get("INSITRA_METRICAS_ARCHIVO")
+PUERTO = os.environ.get("INSITRA_METRICAS_PUERTO")
+#Cada cuántos segundos se reescribe el archivo
+INTERVALO_ARCHIVO = float(os.environ.get("INSITRA_METRICAS_INTERVALO", 15))
+
+#Cubetas por tipo de medición
+CUBETAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CUBETAS_BYTES = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+CUBETAS_FILAS = (10, 100, 1e3, 1e4, 1e5, 1e6)
+
+_candado = threading.Lock()
+_registro = {}
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _texto_etiquetas(nombres: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self._valores = {}
+
+    def inc(self, valor: float = 1, **etiquetas):
+        llave = tuple(str(etiquetas.get(n, "")) for n in self.etiquetas)
+        with _candado:
+            self._valores[llave] = self._valores.get(llave, 0) + valor
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with _candado:
+            valores = sorted(self._valores.items())
+        for llave, valor in valores:
+            lineas.append(f"{self.nombre}{_texto_etiquetas(self.etiquetas, llave)} {_numero(valor)}")
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), cubetas: tuple = CUBETAS_SEGUNDOS):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self.cubetas = tuple(sorted(cubetas))
+        #llave -> [conteos por cubeta..., suma, total]
+        self._valores = {}
+
+    def observar(self, valor: float, **etiquetas):
+        llave = tuple(str(etiquetas.get(n, "")) for n in self.etiquetas)
+        with _candado:
+            serie = self._valores.get(llave)
+            if serie is None:
+                serie = self._valores[llave] = [0] * (len(self.cubetas) + 2)
+            for i, limite in enumerate(self.cubetas):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with _candado:
+            valores = sorted((llave, list(serie)) for llave, serie in self._valores.items())
+        for llave, serie in valores:
+            #Las cubetas de Prometheus son acumulativas; +Inf es el total
+            acumulados = itertools.accumulate(serie[:-2])
+            for limite, conteo in zip(self.cubetas + (math.inf,), itertools.chain(acumulados, [serie[-1]])):
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_texto_etiquetas(self.etiquetas, llave, le)} {conteo}")
+            lineas.append(f"{self.nombre}_sum{_texto_etiquetas(self.etiquetas, llave)} {_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_count{_texto_etiquetas(self.etiquetas, llave)} {serie[-1]}")
+        return lineas
+
+
+def _registrar(metrica):
+    with _candado:
+        return _registro.setdefault(metrica.nombre, metrica)
+
+
+def contador(nombre: str, ayuda: str, etiquetas: tuple = ()) -> Contador:
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def histograma(nombre: str, ayuda: str, etiquetas: tuple = (), cubetas: tuple = CUBETAS_SEGUNDOS) -> Histograma:
+    return _registrar(Histograma(nombre, ayuda, etiquetas, cubetas))
+
+
+# M É T R I C A S   D E   L A   A P P
+
+CEIBA_LATENCIA = histograma(
+    "insitra_ceiba_latencia_segundos", "Latencia de cada intento HTTP a CEIBA (hasta los encabezados).",
+    ("endpoint", "metodo", "estado"))
+CEIBA_BYTES = histograma(
+    "insitra_ceiba_respuesta_bytes", "Bytes (descomprimidos) por respuesta de CEIBA.",
+    ("endpoint",), CUBETAS_BYTES)
+CEIBA_FILAS = histograma(
+    "insitra_ceiba_respuesta_filas", "Registros en el arreglo data por respuesta de CEIBA.",
+    ("endpoint",), CUBETAS_FILAS)
+CEIBA_REINTENTOS = contador(
+    "insitra_ceiba_reintentos_total", "Reintentos HTTP a CEIBA por 5xx, timeout o error de conexión.",
+    ("endpoint",))
+CACHE = contador(
+    "insitra_cache_total", "Consultas a cada caché de la app por resultado (hit/miss).",
+    ("cache", "resultado"))
+CACHE_DESALOJOS = contador(
+    "insitra_cache_desalojos_total", "Entradas sacadas de una caché acotada para respetar su tope de memoria.",
+    ("cache",))
+RERUNS = contador(
+    "insitra_reruns_total", "Ejecuciones (reruns) de cada página.", ("pagina",))
+RERUN_SEGUNDOS = histograma(
+    "insitra_rerun_segundos", "Duración de cada ejecución de página.", ("pagina",))
+SPAN_SEGUNDOS = histograma(
+    "insitra_span_segundos", "Duración de cada span instrumentado (CEIBA, ingesta, agregación, gráficas).",
+    ("span",))
+
+
+def cache(nombre: str, hits: int = 0, misses: int = 0):
+    """Anota `hits` y `misses` de la caché `nombre`."""
+    if hits:
+        CACHE.inc(hits, cache=nombre, resultado="hit")
+    if misses:
+        CACHE.inc(misses, cache=nombre, resultado="miss")
+
+
+# E X P O R T A C I Ó N
+
+def exportar() -> str:
+    """Todas las métricas en formato de texto de Prometheus."""
+    with _candado:
+        metricas = list(_registro.values())
+    lineas = []
+    for metrica in metricas:
+        lineas.extend(metrica.exportar())
+    return "\n".join(lineas) + "\n"
+
+
+def escribir(ruta: str):
+    #Escritura atómica para que el colector nunca lea un archivo a medias
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(exportar())
+    os.replace(temporal, ruta)
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = exportar().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def _escribir_periodicamente(ruta: str):
+    while True:
+        try:
+            escribir(ruta)
+        except OSError:
+            pass
+        time.sleep(INTERVALO_ARCHIVO)
+
+
+_exportando = False
+
+
+def iniciar_exportacion():
+    """Arranca (una vez por proceso) el archivo y/o el endpoint configurados."""
+    global _exportando
+    with _candado:
+        if _exportando:
+            return
+        _exportando = True
+    if ARCHIVO:
+        threading.Thread(target=_escribir_periodicamente, args=(ARCHIVO,), daemon=True,
+                         name="metricas-archivo").start()
+    if PUERTO:
+        try:
+            servidor = ThreadingHTTPServer(("127.0.0.1", int(PUERTO)), _Manejador)
+        except OSError:
+            #Otro proceso (o una recarga del módulo) ya tiene el puerto
+            return
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True, name="metricas-http").start()
+
+
+iniciar_exportacion()
@@ -1,21 +1,19 @@
 # ------------------ Configuración y imports ------------------
-from datetime import date, timedelta
+import hashlib
 import streamlit as st
 import pandas as pd
 import folium
 from folium.plugins import HeatMap, Draw
 from streamlit_folium import st_folium
-from shapely.geometry import Point, shape
+from shapely.geometry import shape
 from shapely.ops import unary_union
 
 #Importamos utilidades nativas
 import ceiba_client as cbc
 import utilidades as util
-import procesed as pcd
-import graphics as graph
-import folium
-from streamlit_folium import st_folium
-from folium.plugins import HeatMap
+import espacial as esp
+import instrumentacion as inst
+import ventanas as vent
 # import graphics as graph  # si lo necesitas después
 
 st.set_page_config(
@@ -24,6 +22,9 @@ st.set_page_config(
     layout='wide',
 )
 
+# Tiempos de esta ejecución (panel de depuración con ?debug=1)
+inst.iniciar_rerun('Ruta')
+
 # ------------------ Autenticación y sidebar ------------------
 cbc.login()
 cbc.require_login()
@@ -41,166 +42,182 @@ util.navegacion()
 st.title('INSITRA ANALYTICS: Ruta 🚦')
 st.header('Mapa de calor')
 
-# ---------- Rango de fechas ----------
-date_presetk = date.today()
-
-c1, c2 = st.columns(2)
-with c1:
-    iniciop = st.date_input('Inicio', date_presetk, key='uni_inicio_p')
-with c2:
-    finalp = st.date_input('Final', key='uni_final_p')
-
-if iniciop > finalp:
-    st.error('La fecha final debe ser más reciente que la fecha de inicio')
-    st.stop()
-
-rango_fechas = (iniciop,finalp)
-
-
-# ---------- Llamada a la API ----------
-conteo_pasajeros = {
-    "terid": terids_del_grupo,
-    "starttime": f"{iniciop} 00:00:00",
-    "endtime": f"{finalp} 23:59:59",
-}
-
-ok, payload, err = cbc.api_post("basic/passenger-count/detail", json=conteo_pasajeros)
-if not ok:
-    st.error(err or "Error consultando CEIBA")
-    st.stop()
-
-# ---------- Procesamiento y vista ----------
-conteo = pd.DataFrame(payload.get('data') or [])
-if conteo.empty:
-    st.warning("No hay datos para los filtros seleccionados.")
-    st.stop()
-
-#Ajuste y normalización de datos
-
-conteo = conteo.rename(columns={
-    'lat': 'lat', 
-    'lng': 'lon',
-    'on':'on',
-})
-
-# ---- KPIs ARRIBA (placeholders) ----
-st.subheader("Resultados en la zona dibujada")
-kpi = st.container()
-with kpi:
-    c1, c2, c3 = st.columns(3)
-    m_on  = c1.empty()  # placeholder métrica Ascensos
-    m_off = c2.empty()  # placeholder métrica Descensos
-    m_pts = c3.empty()  # placeholder métrica Puntos
-
-# Valores iniciales (mientras no haya polígono dibujado)
-#Modificamos el tamaño de letra
-st.markdown("""
-    <style>
-    [data-testid = "stMetricLabel"] p{
-            font-size: 1.5rem;
-            }
-            <style>
-             """,unsafe_allow_html=True)
-
-m_on.metric("Ascensos", "—", border=True)
-m_off.metric("Descensos", "—", border=True)
-m_pts.metric("Eventos dentro del área", "—", border=True)
-
-# ----------------- TU PROCESAMIENTO -----------------
-# Asegura nombres y tipos
-conteo = pd.DataFrame(payload.get("data") or [])
-conteo = conteo.rename(columns={"lng": "lon"})  # por si viene 'lng'
-conteo["lat"] = pd.to_numeric(conteo["lat"], errors="coerce")
-conteo["lon"] = pd.to_numeric(conteo["lon"], errors="coerce")
-conteo["on"]  = pd.to_numeric(conteo.get("on"),  errors="coerce").fillna(0)
-conteo["off"] = pd.to_numeric(conteo.get("off"), errors="coerce").fillna(0)
-conteo = conteo.dropna(subset=["lat","lon"])
-
-if conteo.empty:
-    st.warning("No hay coordenadas válidas para el mapa.")
-    st.stop()
-
-# Mapa base
-centro = [float(conteo["lat"].mean()), float(conteo["lon"].mean())]
-m = folium.Map(location=centro, zoom_start=12, tiles="OpenStreetMap", control_scale=True)
-
-# Heatmap
-heat_data = conteo[["lat","lon"]].assign(peso=conteo["on"]).values.tolist()
-HeatMap(heat_data, radius=25, blur=18, max_zoom=12).add_to(m)
-
-# Herramienta de dibujo
-Draw(
-    export=False,
-    position="topleft",
-    draw_options={
-        "polyline": False,
-        "polygon": True,
-        "rectangle": True,
-        "circle": False,
-        "circlemarker": False,
-        "marker": False,
-    },
-    edit_options={"edit": True, "remove": True},
-).add_to(m)
-
-# Render y captura
-state = st_folium(
-    m,
-    height=600,
-    key="mapa_ruta_draw",
-    returned_objects=["all_drawings", "last_active_drawing"],
-    width=None
-)
-
-# ---- Procesar polígonos dibujados ----
-features = []
-if state is not None:
-    drawings = state.get("all_drawings")
-    last_one = state.get("last_active_drawing")
-
-    if drawings:
-        if isinstance(drawings, dict) and "features" in drawings:  # FeatureCollection
-            features = drawings["features"]
-        elif isinstance(drawings, list):                           # lista de features
-            features = drawings
-
-    if not features and isinstance(last_one, dict):
-        features = [last_one]
-
-if not features:
-    st.info("Dibuja un polígono o rectángulo en el mapa para ver los totales dentro de la zona.")
-    st.stop()
-
-# Geometrías shapely
-geoms = []
-for feat in features:
-    try:
-        geom = shape(feat["geometry"])   # GeoJSON es [lon, lat]
-        geoms.append(geom)
-    except Exception:
-        continue
-
-if not geoms:
-    st.warning("No se pudo interpretar la geometría dibujada.")
-    st.stop()
-
-zona = unary_union(geoms)
-
-# Métricas en la zona (incluye borde si prefieres .covers)
-pts  = [Point(xy) for xy in zip(conteo["lon"].to_numpy(), conteo["lat"].to_numpy())]
-mask = [zona.contains(p) for p in pts]  # o zona.covers(p) para incluir borde
-en_zona = conteo.loc[mask]
-
-total_on  = int(en_zona["on"].sum()) if not en_zona.empty else 0
-total_off = int(en_zona["off"].sum()) if not en_zona.empty else 0
-n_puntos  = len(en_zona)
-
-# ---- ACTUALIZAR KPIs (arriba) ----
-m_on.metric("Ascensos", f"{total_on:,}", border=True)
-m_off.metric("Descensos", f"{total_off:,}", border=True)
-m_pts.metric("Eventos dentro del área", f"{n_puntos:,}", border=True)
-
-# (Opcional) tabla
-with st.expander("Ver puntos dentro de la zona"):
-    st.dataframe(en_zona, use_container_width=True)
-
+# El mapa es un fragmento: dibujar una zona o cambiar las fechas solo vuelve a
+# ejecutar esta sección, no la autenticación ni el sidebar
+@st.fragment
+@inst.seccion('mapa')
+def mapa_de_calor():
+    # ---------- Rango de fechas ----------
+    date_presetk = cbc.hoy_ceiba()
+
+    c1, c2 = st.columns(2)
+    with c1:
+        iniciop = st.date_input('Inicio', date_presetk, key='uni_inicio_p')
+    with c2:
+        finalp = st.date_input('Final', key='uni_final_p')
+
+    if iniciop > finalp:
+        st.error('La fecha final debe ser más reciente que la fecha de inicio')
+        return
+
+    rango_fechas = (iniciop,finalp)
+
+
+    # ---------- Llamada a la API ----------
+    # Un rango dentro del ya cargado se rebana en la sesión; a CEIBA solo van los días que falten.
+    # Ingesta tipada: lat/lng float32, on/off int32, fechas ya parseadas
+    conteo = vent.datos("pasajeros", gid, terids_del_grupo, iniciop, finalp)
+    if conteo is None:
+        st.error("Error consultando CEIBA")
+        return
+
+    # ---------- Procesamiento y vista ----------
+    if conteo.empty:
+        st.warning("No hay datos para los filtros seleccionados.")
+        return
+
+    #Ajuste y normalización de datos
+
+    conteo = conteo.rename(columns={
+        'lat': 'lat', 
+        'lng': 'lon',
+        'on':'on',
+    })
+
+    # ---- KPIs ARRIBA (placeholders) ----
+    st.subheader("Resultados en la zona dibujada")
+    kpi = st.container()
+    with kpi:
+        c1, c2, c3 = st.columns(3)
+        m_on  = c1.empty()  # placeholder métrica Ascensos
+        m_off = c2.empty()  # placeholder métrica Descensos
+        m_pts = c3.empty()  # placeholder métrica Puntos
+
+    # Valores iniciales (mientras no haya polígono dibujado)
+    #Modificamos el tamaño de letra
+    st.markdown("""
+        <style>
+        [data-testid = "stMetricLabel"] p{
+                font-size: 1.5rem;
+                }
+                <style>
+                 """,unsafe_allow_html=True)
+
+    m_on.metric("Ascensos", "—", border=True)
+    m_off.metric("Descensos", "—", border=True)
+    m_pts.metric("Eventos dentro del área", "—", border=True)
+
+    # ----------------- TU PROCESAMIENTO -----------------
+    # Los tipos ya vienen de la ingesta; solo descartamos coordenadas inválidas
+    conteo = conteo.dropna(subset=["lat","lon"])
+
+    if conteo.empty:
+        st.warning("No hay coordenadas válidas para el mapa.")
+        return
+
+    # Mapa base
+    ZOOM_INICIAL = 12
+    centro = [float(conteo["lat"].mean()), float(conteo["lon"].mean())]
+    m = folium.Map(location=centro, zoom_start=ZOOM_INICIAL, tiles="OpenStreetMap", control_scale=True)
+
+    # Heatmap: solo enviamos las celdas no vacías, binneadas con 2 niveles de zoom de margen
+    with inst.span("ruta.calor") as datos:
+        heat_data = esp.binear_calor(
+            conteo["lat"].to_numpy(), conteo["lon"].to_numpy(), conteo["on"].to_numpy(),
+            zoom=ZOOM_INICIAL + 2, radio_px=25,
+        )
+        datos["filas"] = len(heat_data)
+    HeatMap(heat_data, radius=25, blur=18, max_zoom=12).add_to(m)
+
+    # Herramienta de dibujo
+    Draw(
+        export=False,
+        position="topleft",
+        draw_options={
+            "polyline": False,
+            "polygon": True,
+            "rectangle": True,
+            "circle": False,
+            "circlemarker": False,
+            "marker": False,
+        },
+        edit_options={"edit": True, "remove": True},
+    ).add_to(m)
+
+    # Render y captura
+    with inst.span("ruta.mapa"):
+        state = st_folium(
+            m,
+            height=600,
+            key="mapa_ruta_draw",
+            returned_objects=["all_drawings", "last_active_drawing"],
+            width=None
+        )
+
+    # ---- Procesar polígonos dibujados ----
+    features = []
+    if state is not None:
+        drawings = state.get("all_drawings")
+        last_one = state.get("last_active_drawing")
+
+        if drawings:
+            if isinstance(drawings, dict) and "features" in drawings:  # FeatureCollection
+                features = drawings["features"]
+            elif isinstance(drawings, list):                           # lista de features
+                features = drawings
+
+        if not features and isinstance(last_one, dict):
+            features = [last_one]
+
+    if not features:
+        st.info("Dibuja un polígono o rectángulo en el mapa para ver los totales dentro de la zona.")
+        return
+
+    # Geometrías shapely
+    geoms = []
+    for feat in features:
+        try:
+            geom = shape(feat["geometry"])   # GeoJSON es [lon, lat]
+            geoms.append(geom)
+        except Exception:
+            continue
+
+    if not geoms:
+        st.warning("No se pudo interpretar la geometría dibujada.")
+        return
+
+    zona = unary_union(geoms)
+
+    # Índice espacial: se construye una vez por dataset cargado y se reutiliza en cada redibujo.
+    # La llave es una huella de los puntos (y su orden): cambia si el día en curso trae eventos nuevos
+    huella = pd.util.hash_pandas_object(conteo[["lat", "lon", "on", "off"]], index=False).to_numpy()
+    llave_indice = (gid, hashlib.sha1(huella.tobytes()).hexdigest())
+    if st.session_state.get("ruta_indice_llave") != llave_indice:
+        st.session_state["ruta_indice"] = esp.IndiceRejilla(
+            conteo["lat"].to_numpy(), conteo["lon"].to_numpy(),
+            conteo["on"].to_numpy(), conteo["off"].to_numpy(),
+        )
+        st.session_state["ruta_indice_llave"] = llave_indice
+
+    # Métricas en la zona (celdas completas ya sumadas + prueba punto a punto en el borde)
+    with inst.span("ruta.zona") as datos:
+        total_on, total_off, n_puntos, posiciones = st.session_state["ruta_indice"].consultar(zona)
+        en_zona = conteo.iloc[posiciones]
+        datos["filas"] = len(en_zona)
+
+    total_on  = int(total_on)
+    total_off = int(total_off)
+
+    # ---- ACTUALIZAR KPIs (arriba) ----
+    m_on.metric("Ascensos", f"{total_on:,}", border=True)
+    m_off.metric("Descensos", f"{total_off:,}", border=True)
+    m_pts.metric("Eventos dentro del área", f"{n_puntos:,}", border=True)
+
+    # (Opcional) tabla
+    with st.expander("Ver puntos dentro de la zona"):
+        st.dataframe(en_zona, use_container_width=True)
+
+mapa_de_calor()
+
+# Cerramos la traza de tiempos de la ejecución
+inst.cerrar_rerun()
@@ -1,12 +1,15 @@
 # ------------------ Configuración y imports ------------------
-from datetime import date, timedelta
+from datetime import timedelta
 import streamlit as st
 import pandas as pd
 
 import ceiba_client as cbc
+import ceiba_async as cba
 import utilidades as util
+import ventanas as vent
 import procesed as pcd
 import graphics as graph
+import instrumentacion as inst
 # import graphics as graph  # si lo necesitas después
 
 st.set_page_config(
@@ -15,6 +18,9 @@ st.set_page_config(
     layout='wide',
 )
 
+# Tiempos de esta ejecución (panel de depuración con ?debug=1)
+inst.iniciar_rerun('Unidades')
+
 # ------------------ Autenticación y sidebar ------------------
 cbc.login()
 cbc.require_login()
@@ -30,164 +36,159 @@ util.navegacion()
 
 # ------------------ Vista principal ------------------
 st.title('INSITRA ANALYTICS: Unidades 🚍')
-st.header('Conteo de pasajeros')
 
 # ---------- Selección por unidades ----------
-# Obtenemos dispositivos del usuario y filtramos por el grupo activo
-dispositivos, err = cbc.listar_dispositivos_simplificado()
+# Directorio indexado del usuario: placas del grupo activo y mapas placa <-> terid
+directorio, err = cbc.directorio()
 if err:
     st.error(err)
     st.stop()
 
-dispositivos = [d for d in dispositivos if str(d.get("groupid")) == str(gid)]
-
-placas = [d.get("carlicence") for d in dispositivos if d.get("carlicence")]
-map_placa_to_terid = {
-    d.get("carlicence"): d.get("terid")
-    for d in dispositivos
-    if d.get("carlicence") and d.get("terid")
-}
+placas = directorio.placas_de(gid)
+map_placa_to_terid = directorio.terid_por_placa_de(gid)
 
 #Mapeamos de regreso
-map_terid_to_placa = {
-    str(d.get("terid")): d.get("carlicence")
-    for d in dispositivos
-    if d.get("carlicence") and d.get("terid")
-}
-
-sel_placas = st.multiselect("Unidades", options=placas, key="uni_ms_unidades")
-
-# Si no se elige nada, tomamos TODAS las del grupo
-if sel_placas:
-    sel_terids = [map_placa_to_terid[p] for p in sel_placas]
-else:
-    sel_terids = [map_placa_to_terid[p] for p in placas]
-
-# ---------- Rango de fechas ----------
-date_presetp = date.today() - timedelta(days=6)
-
-c1, c2 = st.columns(2)
-with c1:
-    iniciop = st.date_input('Inicio', date_presetp, key='uni_inicio')
-with c2:
-    finalp = st.date_input('Final', key='uni_final')
-
-if iniciop > finalp:
-    st.error('La fecha final debe ser más reciente que la fecha de inicio')
-    st.stop()
-
-# ---------- Llamada a la API ----------
-conteo_pasajeros = {
-    "terid": sel_terids,
-    "starttime": f"{iniciop} 00:00:00",
-    "endtime": f"{finalp} 23:59:59",
-}
-
-rango_fechas = (iniciop,finalp)
-
-ok, payload, err = cbc.api_post("basic/passenger-count/detail", json=conteo_pasajeros)
-if not ok:
-    st.error(err or "Error consultando CEIBA")
-    st.stop()
-
-# ---------- Procesamiento y vista ----------
-conteo = pd.DataFrame(payload.get('data') or [])
-if conteo.empty:
-    st.warning("No hay datos para los filtros seleccionados.")
-    st.stop()
-
-pud = pcd.construir_pud(conteo)  # tu función de procesado por unidad/día
-
-if "Unidad" in pud.columns:
-    pud["Unidad"] = pud["Unidad"].astype(str).map(map_terid_to_placa).fillna(pud["Unidad"])
-elif "terid" in pud.columns:
-    pud["terid"] = pud["terid"].astype(str).map(map_terid_to_placa).fillna(pud["terid"])
-    # (opcional) si prefieres que la columna final se llame 'Unidad':
-    pud = pud.rename(columns={"terid": "Unidad"})
-
-#G R A F I C A M O S
-pfig, pud_plot = graph.pasajeros_unidad_dia(
-    df = pud,
-    unidades = sel_placas,
-    rango_fechas = rango_fechas,
-    valor = 'Ascensos'
-)
-
-#Excepsiones
-if pfig is None or pud_plot.empty:
-    st.warning('No hay datos de las fechas seleccionadas')
-else:
-    st.plotly_chart(pfig,use_container_width=True)
-    with st.expander('Ver los datos mostrados en la gráfica'):
-        st.dataframe(pud_plot,use_container_width=True)
+map_terid_to_placa = directorio.placa_por_terid
+
+def terids_de(seleccion):
+    # Si no se elige nada, tomamos TODAS las del grupo
+    return [map_placa_to_terid[p] for p in (seleccion or placas)]
+
+# ---------- Precarga ----------
+# Pasajeros y kilometraje son independientes: en la ejecución completa se piden a
+# CEIBA a la vez (con lo que tengan sus selectores) y cada sección los toma de la caché
+date_preset = cbc.hoy_ceiba() - timedelta(days=6)
+cba.precargar_por_dia([
+    ("basic/passenger-count/detail", terids_de(st.session_state.get('uni_ms_unidades')),
+     st.session_state.get('uni_inicio', date_preset), st.session_state.get('uni_final', cbc.hoy_ceiba())),
+    ("basic/mileage/count", terids_del_grupo,
+     st.session_state.get('uni_inicio_k', date_preset), st.session_state.get('uni_final_k', cbc.hoy_ceiba())),
+], groupid=gid, ensamblar=False)
+
+
+# ---------- Pasajeros ----------
+# Cada sección es un fragmento: sus selectores solo vuelven a ejecutar la sección
+@st.fragment
+@inst.seccion('pasajeros')
+def conteo_de_pasajeros():
+    st.header('Conteo de pasajeros')
+
+    sel_placas = st.multiselect("Unidades", options=placas, key="uni_ms_unidades")
+    sel_terids = terids_de(sel_placas)
+
+    # ---------- Rango de fechas ----------
+    date_presetp = cbc.hoy_ceiba() - timedelta(days=6)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        iniciop = st.date_input('Inicio', date_presetp, key='uni_inicio')
+    with c2:
+        finalp = st.date_input('Final', key='uni_final')
+
+    if iniciop > finalp:
+        st.error('La fecha final debe ser más reciente que la fecha de inicio')
+        return
+
+    # ---------- Llamada a la API ----------
+    rango_fechas = (iniciop,finalp)
+
+    # Un rango dentro del ya cargado se rebana en la sesión; a CEIBA solo van los días que falten
+    conteo = vent.datos("pasajeros", gid, sel_terids, iniciop, finalp)
+    if conteo is None:
+        st.error("Error consultando CEIBA")
+        return
+
+    # ---------- Procesamiento y vista ----------
+    if conteo.empty:
+        st.warning("No hay datos para los filtros seleccionados.")
+        return
+
+    pud = pcd.resumir_pasajeros(conteo).por_unidad_dia  # una sola pasada sobre el dataset crudo
+
+    if "Unidad" in pud.columns:
+        pud["Unidad"] = pud["Unidad"].astype(str).map(map_terid_to_placa).fillna(pud["Unidad"])
+    elif "terid" in pud.columns:
+        pud["terid"] = pud["terid"].astype(str).map(map_terid_to_placa).fillna(pud["terid"])
+        # (opcional) si prefieres que la columna final se llame 'Unidad':
+        pud = pud.rename(columns={"terid": "Unidad"})
+
+    #G R A F I C A M O S
+    pfig, pud_plot = graph.pasajeros_unidad_dia(
+        df = pud,
+        unidades = sel_placas,
+        rango_fechas = rango_fechas,
+        valor = 'Ascensos'
+    )
+
+    #Excepsiones
+    if pfig is None or pud_plot.empty:
+        st.warning('No hay datos de las fechas seleccionadas')
+    else:
+        st.plotly_chart(pfig,use_container_width=True)
+        with st.expander('Ver los datos mostrados en la gráfica'):
+            st.dataframe(pud_plot,use_container_width=True)
+
+conteo_de_pasajeros()
 
 
 #Kilometraje
 
-
-sel_placas_k = st.multiselect("Unidades", options=placas, key="uni_ms_unidades_k")
-
-# Si no se elige nada, tomamos TODAS las del grupo
-if sel_placas_k:
-    sel_terids = [map_placa_to_terid[p] for p in sel_placas_k]
-else:
-    sel_terids = [map_placa_to_terid[p] for p in placas]
-
-# ---------- Rango de fechas ----------
-date_presetk = date.today() - timedelta(days=6)
-
-c1, c2 = st.columns(2)
-with c1:
-    iniciok = st.date_input('Inicio', date_presetk, key='uni_inicio_k')
-with c2:
-    finalk = st.date_input('Final', key='uni_final_k')
-
-if iniciok > finalk:
-    st.error('La fecha final debe ser más reciente que la fecha de inicio')
-    st.stop()
-
-
-rango_fechask = (iniciok,finalk)
-
-kilometraje = {
-        "terid": terids_del_grupo,
-        "starttime": f"{iniciok} 00:00:00",
-        "endtime": f"{finalk} 23:59:59"
-        }
-
-ok, payload, err = cbc.api_post("basic/mileage/count", json=kilometraje)
-if not ok:
-    st.error(err or "Error consultando CEIBA")
-    st.stop()
-
-# ---------- Procesamiento y vista ----------
-kilometraje = pd.DataFrame(payload.get('data') or [])
-if conteo.empty:
-    st.warning("No hay datos para los filtros seleccionados.")
-    st.stop()
-
-kud = pcd.construir_kud(kilometraje)
-
-if "Unidad" in kud.columns:
-    kud["Unidad"] = kud["Unidad"].astype(str).map(map_terid_to_placa).fillna(kud["Unidad"])
-elif "terid" in kud.columns:
-    kud["terid"] = kud["terid"].astype(str).map(map_terid_to_placa).fillna(kud["terid"])
-    # (opcional) si prefieres que la columna final se llame 'Unidad':
-    kud = kud.rename(columns={"terid": "Unidad"})
-
-kfig, kud_plot = graph.kilometros_unidad_dia(
-    df = kud,
-    unidades = sel_placas_k,
-    rango_fechas = rango_fechask,
-    valor = 'Kilometraje',
-)
-
-#Excepsiones
-if kfig is None or kud_plot.empty:
-    st.warning('No hay datos de las fechas seleccionadas')
-else:
-    st.plotly_chart(kfig,use_container_width=True)
-    with st.expander('Ver los datos mostrados en la gráfica'):
-        st.dataframe(kud_plot,use_container_width=True)
-
-
+@st.fragment
+@inst.seccion('kilometraje')
+def kilometraje_por_unidad():
+    sel_placas_k = st.multiselect("Unidades", options=placas, key="uni_ms_unidades_k")
+
+    # ---------- Rango de fechas ----------
+    date_presetk = cbc.hoy_ceiba() - timedelta(days=6)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        iniciok = st.date_input('Inicio', date_presetk, key='uni_inicio_k')
+    with c2:
+        finalk = st.date_input('Final', key='uni_final_k')
+
+    if iniciok > finalk:
+        st.error('La fecha final debe ser más reciente que la fecha de inicio')
+        return
+
+
+    rango_fechask = (iniciok,finalk)
+
+    kilometraje = vent.datos("kilometraje", gid, terids_del_grupo, iniciok, finalk)
+    if kilometraje is None:
+        st.error("Error consultando CEIBA")
+        return
+
+    # ---------- Procesamiento y vista ----------
+    if kilometraje.empty:
+        st.warning("No hay datos para los filtros seleccionados.")
+        return
+
+    kud = pcd.resumir_kilometraje(kilometraje).por_unidad_dia
+
+    if "Unidad" in kud.columns:
+        kud["Unidad"] = kud["Unidad"].astype(str).map(map_terid_to_placa).fillna(kud["Unidad"])
+    elif "terid" in kud.columns:
+        kud["terid"] = kud["terid"].astype(str).map(map_terid_to_placa).fillna(kud["terid"])
+        # (opcional) si prefieres que la columna final se llame 'Unidad':
+        kud = kud.rename(columns={"terid": "Unidad"})
+
+    kfig, kud_plot = graph.kilometros_unidad_dia(
+        df = kud,
+        unidades = sel_placas_k,
+        rango_fechas = rango_fechask,
+        valor = 'Kilometraje',
+    )
+
+    #Excepsiones
+    if kfig is None or kud_plot.empty:
+        st.warning('No hay datos de las fechas seleccionadas')
+    else:
+        st.plotly_chart(kfig,use_container_width=True)
+        with st.expander('Ver los datos mostrados en la gráfica'):
+            st.dataframe(kud_plot,use_container_width=True)
+
+kilometraje_por_unidad()
+
+# Cerramos la traza de tiempos de la ejecución
+inst.cerrar_rerun()
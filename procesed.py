@@ -1,202 +1,197 @@
      # U T I L I I D A D E S
+from dataclasses import dataclass
+
 import pandas as pd
 
-# U N I D A D E S 
+import instrumentacion as inst
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+
+#Convierte a datetime con el formato de CEIBA; solo lo que no encaje se infiere
+def _a_fecha(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    fechas = pd.to_datetime(serie, format=FORMATO_FECHA, errors='coerce')
+    faltan = fechas.isna() & serie.notna()
+    if faltan.any():
+        fechas[faltan] = pd.to_datetime(serie[faltan], errors='coerce')
+    return fechas
+
+
+#Convierte a número (None/basura -> 0) solo si la columna aún no es numérica
+def _a_numero(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_float_dtype(serie):
+        return serie
+    return pd.to_numeric(serie, errors='coerce').fillna(0)
+
+
+# I N G E S T A
+
+#Esquemas declarados de los payloads de CEIBA
+ESQUEMA_PASAJEROS = {
+    'terid': 'category',
+    'opentime': 'datetime64',
+    'closetime': 'datetime64',
+    'on': 'int32',
+    'off': 'int32',
+    'lat': 'float32',
+    'lng': 'float32',
+}
+
+ESQUEMA_KILOMETRAJE = {
+    'terid': 'category',
+    'starttime': 'datetime64',
+    'endtime': 'datetime64',
+    'mileage': 'float32',
+}
+
+
+#Construye el DataFrame tipado a partir de `data` (lista de registros o dict de columnas)
+def _ingerir(data, esquema: dict, columnas=None) -> pd.DataFrame:
+    df = pd.DataFrame(data if data is not None else [])
+    if columnas is not None:
+        esquema = {col: tipo for col, tipo in esquema.items() if col in columnas}
+
+    columnas = {}
+    for col, tipo in esquema.items():
+        serie = df[col] if col in df else pd.Series([None] * len(df), dtype=object)
+        if tipo == 'datetime64':
+            columnas[col] = _a_fecha(serie)
+        elif tipo == 'category':
+            columnas[col] = serie.astype(str).where(serie.notna()).astype('category')
+        elif tipo.startswith('int'):
+            columnas[col] = pd.to_numeric(serie, errors='coerce').fillna(0).astype(tipo)
+        else:
+            #Coordenadas/kilometraje: lo inválido queda como NaN
+            columnas[col] = pd.to_numeric(serie, errors='coerce').astype(tipo)
+
+    #Columnas fuera del esquema se conservan tal cual
+    for col in df.columns:
+        if col not in columnas:
+            columnas[col] = df[col]
+
+    return pd.DataFrame(columnas, index=df.index)
+
+
+#Dataset tipado de basic/passenger-count/detail
+@inst.medir("procesed.ingerir_pasajeros")
+def ingerir_pasajeros(data) -> pd.DataFrame:
+    return _ingerir(data, ESQUEMA_PASAJEROS)
+
+
+#Dataset tipado de basic/mileage/count
+@inst.medir("procesed.ingerir_kilometraje")
+def ingerir_kilometraje(data) -> pd.DataFrame:
+    return _ingerir(data, ESQUEMA_KILOMETRAJE)
+
+
+#Promedios por día a partir de la tabla por unidad y día (columna `valor`)
+def _por_dia(por_unidad: pd.DataFrame, valor: str, umbral: float,
+             col_total: str, col_activas: str) -> pd.DataFrame:
+    grupos = por_unidad.groupby('Dia')
+    total = grupos[valor].sum()
+    #La tabla por unidad ya es única por (Dia, Unidad): contar filas = nunique
+    if umbral > 0:
+        activas = (por_unidad[valor] >= umbral).groupby(por_unidad['Dia']).sum()
+    else:
+        activas = grupos.size()
 
+    por_dia = pd.DataFrame({col_total: total, col_activas: activas.astype(int)}).reset_index()
 
-#Construimos pud: pasajeros por unidad y día. (espera parámetros de unidad)
-def construir_pud(
-        ps: pd.DataFrame,
-):  
-#Renombra la columnas del dataset
-    ps  = ps.rename(columns={
-        'terid': 'Unidad',
-        'on': 'Ascensos',
-        'off': 'Descensos',
-        'opentime': 'Apertura de puerta',
-        'closetime': 'Cierre de puerta',
-        'lat': 'Latitud',
-        'lng': 'Longitud',
-    })
-    
-    #transforma a datetimes
-    ps['Apertura de puerta'] = pd.to_datetime(ps['Apertura de puerta'], format="%Y-%m-%d %H:%M:%S")
-    ps['Cierre de puerta'] = pd.to_datetime(ps['Cierre de puerta'], format="%Y-%m-%d %H:%M:%S")
-
-    #Construimos el dataset.
-    return (ps.groupby([ps['Apertura de puerta'].dt.date, 'Unidad'])[['Ascensos','Descensos']]
-        .sum() #Sumamos los valores 
-        .reset_index()) #Volvemos a convertir a un dataset
+    #Evitamos dividir entre cero en días sin unidades activas
+    denom = por_dia[col_activas].where(por_dia[col_activas] != 0, 1)
+    por_dia['Promedio por unidad'] = (por_dia[col_total] / denom).where(por_dia[col_activas] != 0, 0).round(0)
+    return por_dia.sort_values('Dia', kind='stable')
 
 
-#Construimos kud: kilometros unidad y dia (Espera parámetros)
-def construir_kud(
-        km: pd.DataFrame,
-):
-    # Renombra la columnas del dataset
-    km = km.rename(columns={
-        'terid': 'Unidad',
-        'mileage': 'Kilometraje',
-        'starttime': 'Dia inicio',
-        'endtime': 'Tiempo final',
-    })
-
-    # Asegura tipos correctos y tolera formatos inesperados
-    km['Dia inicio']   = pd.to_datetime(km['Dia inicio'], errors='coerce')               
-    km['Tiempo final'] = pd.to_datetime(km['Tiempo final'], errors='coerce')             
-    km['Kilometraje']  = pd.to_numeric(km.get('Kilometraje'), errors='coerce')           
-
-    # Limpia las fechas con la columna inválida
-    km = km.dropna(subset=['Dia inicio'])
-
-    # Deja 'Dia inicio' como date puro (para que compare bien con el input en el front end)
-    km = km.assign(**{'Dia inicio': km['Dia inicio'].dt.date})
-
-    # Construimos el dataset agrupado
-    return (
-        km.groupby(['Dia inicio', 'Unidad'], as_index=False)['Kilometraje']
-          .sum() #Sumamos los valores
-          .sort_values(['Dia inicio', 'Unidad']) #Lo convertimos a dataset ordenandolo por dia de inicio y luego unidad (Fecha y número de unidad)
-    )
-    
-# Contruimos padp: pasajeros unidad dia promedio. (No espera unidades)
+# M O T O R   D E   A G R E G A C I Ó N
 
-def construir_padp(pad: pd.DataFrame, umbral_ascensos_unidad: int):
+@dataclass(frozen=True)
+class ResumenPasajeros:
+    por_unidad_dia: pd.DataFrame  # Apertura de puerta (date), Unidad, Ascensos, Descensos
+    por_dia: pd.DataFrame         # Dia, Total de ascensos, unidades_activas, Promedio por unidad
+
+
+@dataclass(frozen=True)
+class ResumenKilometraje:
+    por_unidad_dia: pd.DataFrame  # Dia inicio (date), Unidad, Kilometraje
+    por_dia: pd.DataFrame         # Dia, Kilometraje, Unidades Activas, Promedio por unidad
 
-    #Renombramos las columnas
-    pad  = pad.rename(columns={
-        'terid': 'Plate No.',
-        'on': 'On person',
-        'off': 'Off person',
-        'opentime': 'Open door time',
-        'closetime': 'Close door time',
-        'lat': 'Latitud',
-        'lng': 'Longitud',
-    })
-
-    # Tipado robusto (Forzamos el datetime)
-    pad['Open door time']  = pd.to_datetime(pad['Open door time'],  errors='coerce')
-    #También ponemos Close door time (En caso de que utilicemos DVR's viejos)
-    pad['Close door time'] = pd.to_datetime(pad['Close door time'], errors='coerce')
-    # Tipado robusto, en caso de que no llegara a ser un número y si es un None, lo rellena con 0
-    pad['On person'] = pd.to_numeric(pad['On person'], errors='coerce').fillna(0)
-
-    #Liampiamos los datos en caso de no tenerlos.
-    pad = pad.dropna(subset=['Open door time']) #No lo considera si no tiene es valor, si arroja un None o no es un datetime
-
-    # Utilizamos dia, por practicidad y lo volvemos a poner como datetime.
-    pad['Dia'] = pad['Open door time'].dt.date
-
-    
-    # Agrupamos ascensos por unidad y dia (Tabla pivote)
-    por_unidad = (
-        pad.groupby(['Dia', 'Plate No.'], as_index=False)['On person']
-           .sum()
-           .rename(columns={'On person': 'Ascensos'})
-    )
 
-    # Reagrupamos pero ahora sin unidad, solo los totales
-    totales_dia = (
-        por_unidad.groupby('Dia', as_index=False)['Ascensos']
-                  .sum()
-                  .rename(columns={'Ascensos': 'Total de ascensos'})
+#Parsea y agrupa una sola vez el dataset crudo de passenger-count/detail
+@inst.medir("procesed.resumir_pasajeros")
+def resumir_pasajeros(ps: pd.DataFrame, umbral_ascensos_unidad: int = 0) -> ResumenPasajeros:
+    #Solo tomamos las columnas que usamos (no copiamos lat/lng ni closetime).
+    #Si el dataset viene de ingerir_pasajeros no se vuelve a convertir nada.
+    base = pd.DataFrame({
+        'Dia': _a_fecha(ps['opentime']).dt.normalize(),
+        'Unidad': ps['terid'],
+        'Ascensos': _a_numero(ps['on']),
+        'Descensos': _a_numero(ps['off']),
+    }).dropna(subset=['Dia'])
+
+    #Una sola agrupación por unidad y día; de ahí salen los totales por día
+    por_unidad = (base.groupby(['Dia', 'Unidad'], as_index=False, sort=True, observed=True)
+                  [['Ascensos', 'Descensos']].sum())
+    por_unidad['Dia'] = por_unidad['Dia'].dt.date
+    por_dia = _por_dia(por_unidad, 'Ascensos', umbral_ascensos_unidad,
+                       'Total de ascensos', 'unidades_activas')
+
+    return ResumenPasajeros(
+        por_unidad_dia=por_unidad.rename(columns={'Dia': 'Apertura de puerta'}),
+        por_dia=por_dia,
     )
 
-    # Establecemos un umbral de ascensos por unidad
-    
-    #CASO A, considera el umbral
-    if umbral_ascensos_unidad > 0:
-        activas = (
-            por_unidad[por_unidad['Ascensos'] >= umbral_ascensos_unidad]
-            .groupby('Dia', as_index=False)['Plate No.']
-            .nunique()
-            .rename(columns={'Plate No.': 'unidades_activas'})
-        )
-    #CASO B, no considera el umbral
-    else:
-        activas = (
-            por_unidad.groupby('Dia', as_index=False)['Plate No.']
-                      .nunique()
-                      .rename(columns={'Plate No.': 'unidades_activas'})
-        )
-
-    #Creamos padp = pasajeros dia promedio
-    padp = totales_dia.merge(activas, on='Dia', how='left')
-    padp['unidades_activas'] = padp['unidades_activas'].fillna(0).astype(int)
-    
-    #Nos aseguramos que de haber 0's no nos afecten
-    denom = padp['unidades_activas'].where(padp['unidades_activas'] != 0, 1)
-    
-    #Calculamos el promedio y nos volvemos a asegurar de que no haya errores en caso de que alguna día
-    #ninguna unidad haya salido a trabajar y no se cuenten con unidades disponibles
-    padp['Promedio por unidad'] = (padp['Total de ascensos'] / denom).where(padp['unidades_activas'] != 0, 0)
-    #Redondeamos
-    padp['Promedio por unidad'] = padp['Promedio por unidad'].round(0)
-
-    #Ordenamos de nuevo
-    padp = padp.sort_values('Dia', kind='stable')
-
-    return padp
 
-def construir_kipd(
-        kipd: pd.DataFrame,
-        umbral_kilometros: int,
-):
-    kipd = kipd.rename(columns={
-        'terid': 'Unidad',
-        'mileage': 'Kilometraje',
-        'starttime': 'Dia inicio',
-        'endtime': 'Tiempo final',
-    })
-
-    # Tipos
-    kipd['Dia inicio']   = pd.to_datetime(kipd['Dia inicio'], errors='coerce')
-    kipd['Kilometraje']  = pd.to_numeric(kipd['Kilometraje'], errors='coerce').fillna(0)
-
-    # Limpieza
-    kipd = kipd.dropna(subset=['Dia inicio'])
-    kipd['Dia'] = kipd['Dia inicio'].dt.date
-
-    # Totales por día (suma de km)
-    totales_unidad_dia = kipd[['Unidad', 'Dia', 'Kilometraje']].copy()
-    totales_dia = (
-        kipd.groupby(['Dia'], as_index=False)['Kilometraje']
-            .sum()
+#Parsea y agrupa una sola vez el dataset crudo de mileage/count
+@inst.medir("procesed.resumir_kilometraje")
+def resumir_kilometraje(km: pd.DataFrame, umbral_kilometros: int = 0) -> ResumenKilometraje:
+    base = pd.DataFrame({
+        'Dia': _a_fecha(km['starttime']).dt.normalize(),
+        'Unidad': km['terid'],
+        'Kilometraje': _a_numero(km['mileage']),
+    }).dropna(subset=['Dia'])
+
+    por_unidad = (base.groupby(['Dia', 'Unidad'], as_index=False, sort=True, observed=True)
+                  ['Kilometraje'].sum())
+    por_unidad['Dia'] = por_unidad['Dia'].dt.date
+    por_dia = _por_dia(por_unidad, 'Kilometraje', umbral_kilometros,
+                       'Kilometraje', 'Unidades Activas')
+    por_dia['Kilometraje'] = por_dia['Kilometraje'].round(0)
+
+    return ResumenKilometraje(
+        por_unidad_dia=por_unidad.rename(columns={'Dia': 'Dia inicio'}),
+        por_dia=por_dia,
     )
 
-    # Unidades activas (contar unidades únicas por día según umbral)
-    if umbral_kilometros > 0:
-        activas = (
-            totales_unidad_dia[totales_unidad_dia['Kilometraje'] >= umbral_kilometros]
-            .groupby('Dia', as_index=False)['Unidad']
-            .nunique()
-            .rename(columns={'Unidad': 'Unidades Activas'})
-        )
-    else:
-        activas = (
-            totales_unidad_dia
-            .groupby('Dia', as_index=False)['Unidad']
-            .nunique()
-            .rename(columns={'Unidad': 'Unidades Activas'})
-        )
+# U N I D A D E S
 
-    # Mezcla y métricas
-    kipd = totales_dia.merge(activas, on='Dia', how='left')
-    kipd['Unidades Activas'] = kipd['Unidades Activas'].fillna(0).astype(int)
 
-    # Evitar división entre cero
-    denom = kipd['Unidades Activas'].where(kipd['Unidades Activas'] != 0, 1)
-    kipd['Promedio por unidad'] = (kipd['Kilometraje'] / denom).where(kipd['Unidades Activas'] != 0, 0)
-    kipd['Promedio por unidad'] = kipd['Promedio por unidad'].round(0)
-    kipd['Kilometraje'] = kipd['Kilometraje'].round(0)
+#Construimos pud: pasajeros por unidad y día. (espera parámetros de unidad)
+@inst.medir("procesed.construir_pud")
+def construir_pud(
+        ps: pd.DataFrame,
+):
+    return resumir_pasajeros(ps).por_unidad_dia
 
-    # Orden
-    kipd = kipd.sort_values('Dia', kind='stable')
-    return kipd
 
+#Construimos kud: kilometros unidad y dia (Espera parámetros)
+@inst.medir("procesed.construir_kud")
+def construir_kud(
+        km: pd.DataFrame,
+):
+    return resumir_kilometraje(km).por_unidad_dia
 
+# Contruimos padp: pasajeros unidad dia promedio. (No espera unidades)
 
-     
-    
-    
+@inst.medir("procesed.construir_padp")
+def construir_padp(pad: pd.DataFrame, umbral_ascensos_unidad: int):
+    return resumir_pasajeros(pad, umbral_ascensos_unidad).por_dia
 
+@inst.medir("procesed.construir_kipd")
+def construir_kipd(
+        kipd: pd.DataFrame,
+        umbral_kilometros: int,
+):
+    return resumir_kilometraje(kipd, umbral_kilometros).por_dia
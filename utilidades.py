@@ -20,9 +20,11 @@ def sidebar_grupos(key_prefix: str = "grp"):
     with st.sidebar:
         st.title("Grupo")
 
-        grupos, err_g = cbc.listar_grupos()
-        if err_g:
-            return None, None, [], f"Error al obtener grupos: {err_g}"
+        # Directorio indexado (grupos, dispositivos y conteos) compartido por todas las páginas
+        directorio, err = cbc.directorio()
+        if err:
+            return None, None, [], f"Error al obtener grupos y dispositivos: {err}"
+        grupos = directorio.grupos
         if not grupos:
             return None, None, [], "No hay grupos disponibles para tu usuario."
 
@@ -30,25 +32,10 @@ def sidebar_grupos(key_prefix: str = "grp"):
         groupnames = [g.get("groupname") for g in grupos if g.get("groupname")]
         name2id = {g.get("groupname"): g.get("groupid") for g in grupos if g.get("groupname") and g.get("groupid")}
 
-        # Cargamos todos los dispositivos una sola vez y contamos por groupid
-        dispositivos_all, err_d = cbc.listar_dispositivos_simplificado()
-        if err_d:
-            return None, None, [], f"Error al obtener dispositivos: {err_d}"
-
-        conteo_por_gid = {}
-        for d in dispositivos_all:
-            gid = d.get("groupid")
-            if gid is None:
-                continue
-            conteo_por_gid[gid] = conteo_por_gid.get(gid, 0) + 1
-
         # Default = primer grupo con al menos una unidad
-        default_index = 0
-        for idx, g in enumerate(grupos):
-            gid = g.get("groupid")
-            if conteo_por_gid.get(gid, 0) > 0:
-                default_index = idx
-                break
+        inicial = directorio.grupo_inicial()
+        nombre_inicial = inicial.get("groupname") if inicial else None
+        default_index = groupnames.index(nombre_inicial) if nombre_inicial in groupnames else 0
 
         selected_groupname = st.selectbox(
             "Selecciona un grupo",
@@ -62,11 +49,8 @@ def sidebar_grupos(key_prefix: str = "grp"):
     st.session_state["selected_groupname"] = selected_groupname
     st.session_state["selected_groupid"] = selected_groupid
 
-    # Terids del grupo seleccionado (filtrando del listado ya cargado)
-    terids_del_grupo = [
-        d.get("terid") for d in dispositivos_all
-        if str(d.get("groupid")) == str(selected_groupid) and d.get("terid")
-    ]
+    # Terids del grupo seleccionado (búsqueda directa en el índice por grupo)
+    terids_del_grupo = directorio.terids_de(selected_groupid)
 
     if not terids_del_grupo:
         return selected_groupid, selected_groupname, [], "Este grupo no tiene unidades. Cambia de grupo para ver datos."
@@ -79,7 +63,7 @@ from typing import Callable, Dict, List, Optional, Tuple
 
 def multiselect_unidades_por_grupo(
     groupid: str | int,
-    listar_dispositivos_fn: Callable[[], Tuple[List[Dict], Optional[str]]],
+    listar_dispositivos_fn: Optional[Callable[[], Tuple[List[Dict], Optional[str]]]] = None,
     *,
     key_prefix: str = "unidades",
     label: str = "Selecciona las unidades (placa)",
@@ -93,8 +77,9 @@ def multiselect_unidades_por_grupo(
     ----------
     groupid : str|int
         ID del grupo previamente seleccionado.
-    listar_dispositivos_fn : función que devuelve (dispositivos, err)
+    listar_dispositivos_fn : función que devuelve (dispositivos, err), opcional
         dispositivos: lista de dicts con al menos {"groupid","carlicence","terid"}.
+        Si no se da, se usa el directorio indexado de la sesión (cbc.directorio).
     key_prefix : str
         Prefijo para las keys de Streamlit (evita colisiones).
     label : str
@@ -110,24 +95,24 @@ def multiselect_unidades_por_grupo(
         st.warning("No se ha proporcionado un groupid.")
         return [], [], {}
 
-    dispositivos, err = listar_dispositivos_fn()
+    if listar_dispositivos_fn is None:
+        directorio, err = cbc.directorio()
+    else:
+        dispositivos, err = listar_dispositivos_fn()
+        directorio = None if err else cbc.DirectorioDispositivos.desde([], dispositivos)
     if err:
         st.error(err)
         return [], [], {}
 
-    # Filtra dispositivos por grupo
-    dispo_grupo = [d for d in dispositivos if d.get("groupid") == groupid]
-    if not dispo_grupo:
+    # Dispositivos del grupo (búsqueda directa en el índice por grupo)
+    if not directorio.conteo(groupid):
         st.info("Este grupo no tiene unidades disponibles.")
         return [], [], {}
 
     # Construye opciones y mapeo placa->terid
-    placas_opciones = sorted({d.get("carlicence") for d in dispo_grupo if d.get("carlicence")})
-    map_placa_terid = {
-        d["carlicence"]: d["terid"]
-        for d in dispo_grupo
-        if d.get("carlicence") and d.get("terid") is not None
-    }
+    placas_grupo = directorio.placas_de(groupid)
+    placas_opciones = sorted(set(placas_grupo))
+    map_placa_terid = dict(directorio.terid_por_placa_de(groupid))
 
     # Default: última selección persistida o todas (si default_all=True)
     prev_key = f"{key_prefix}_placas_sel"
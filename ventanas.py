@@ -0,0 +1,187 @@
+     # V E N T A N A S   C A R G A D A S   ( P O R   S E S I Ó N )
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import ceiba_client as cbc
+import instrumentacion as inst
+import metricas as met
+import procesed as pcd
+
+#Tipo -> (endpoint, ingesta). Se ordena y rebana por cbc.CAMPO_DIA del endpoint,
+#el mismo campo con el que la caché de fragmentos ubica cada registro en su día.
+_TIPOS = {
+    "pasajeros": ("basic/passenger-count/detail", pcd.ingerir_pasajeros),
+    "kilometraje": ("basic/mileage/count", pcd.ingerir_kilometraje),
+}
+
+#Ventanas que guarda cada sesión; al pasarse se descarta la usada hace más tiempo
+MAX_VENTANAS = 4
+
+_UN_DIA = timedelta(days=1)
+
+
+def _instante(dia: date) -> np.datetime64:
+    return np.datetime64(datetime.combine(dia, dt_time(0, 0, 0)), "ns")
+
+
+@dataclass(frozen=True)
+class Ventana:
+    """Dataset ingerido de [inicio, fin], ordenado por su columna de fecha."""
+    inicio: date
+    fin: date
+    datos: pd.DataFrame
+    fechas: np.ndarray    # columna de fecha como datetime64[ns], para searchsorted
+    cargada_en: float     # time.time() de la petición más vieja de los días no cerrados al pedirlos
+
+    @classmethod
+    def armar(cls, campo: str, inicio: date, fin: date, piezas: list, cargada_en: float):
+        #Las piezas llegan en orden de días; el orden estable conserva el de CEIBA dentro del día
+        datos = pd.concat(piezas, ignore_index=True) if len(piezas) > 1 else piezas[0]
+        for col in piezas[0].columns:
+            if isinstance(piezas[0][col].dtype, pd.CategoricalDtype):
+                datos[col] = datos[col].astype("category")
+        datos = datos.sort_values(campo, kind="stable", ignore_index=True)
+        return cls(inicio, fin, datos, datos[campo].to_numpy(dtype="datetime64[ns]"), cargada_en)
+
+    def cubre(self, inicio: date, fin: date) -> bool:
+        return self.inicio <= inicio and fin <= self.fin
+
+    def rebanar(self, inicio: date, fin: date) -> pd.DataFrame:
+        i, j = np.searchsorted(self.fechas, [_instante(inicio), _instante(fin + _UN_DIA)])
+        return self.datos.iloc[i:j].reset_index(drop=True)
+
+    def hasta(self, fin: date):
+        #Misma ventana recortada a [inicio, fin]; None si queda vacía
+        if fin < self.inicio:
+            return None
+        j = np.searchsorted(self.fechas, _instante(fin + _UN_DIA))
+        return Ventana(self.inicio, fin, self.datos.iloc[:j], self.fechas[:j], self.cargada_en)
+
+
+def _cerrada(ventana: Ventana) -> bool:
+    #Todos sus días ya habían cerrado cuando se pidieron: no cambian más
+    return ventana.cargada_en >= cbc._fin_del_dia(ventana.fin)
+
+
+def _cerrado_hasta(ventana: Ventana) -> date:
+    #Último día de la ventana que ya había cerrado cuando se pidió
+    return ventana.fin if _cerrada(ventana) else cbc.dia_ceiba(ventana.cargada_en) - _UN_DIA
+
+
+def _vigente(ventana: Ventana | None, ttl_hoy: float):
+    #Los días pedidos después de cerrar no cambian; lo cargado en el día en curso
+    #vence a los `ttl_hoy` segundos y se recorta al último día cerrado al cargarlo
+    if ventana is None or _cerrada(ventana):
+        return ventana
+    cargada = cbc.dia_ceiba(ventana.cargada_en)
+    if cargada == cbc.hoy_ceiba() and time.time() - ventana.cargada_en < ttl_hoy:
+        return ventana
+    return ventana.hasta(cargada - _UN_DIA)
+
+
+def _de_otra_ventana(guardadas: dict, tipo: str, groupid: str, terids: frozenset,
+                     inicio: date, fin: date, ttl_hoy: float):
+    #Una ventana del mismo grupo con más unidades que ya cubra el rango: se filtra por terid
+    for (t, g, ids), otra in guardadas.items():
+        if (t, g) != (tipo, groupid) or not terids < ids:
+            continue
+        otra = _vigente(otra, ttl_hoy)
+        if otra is not None and otra.cubre(inicio, fin):
+            rebanada = otra.rebanar(inicio, fin)
+            return rebanada[rebanada["terid"].isin(terids)].reset_index(drop=True), _cerrado_hasta(otra)
+    return None
+
+
+def datos(
+        tipo: str,
+        groupid,
+        terids: list,
+        inicio: date,
+        fin: date,
+        ttl_hoy: float = cbc.TTL_HOY,
+):
+    """
+    Dataset ingerido de `tipo` ("pasajeros" o "kilometraje") para `terids` en
+    [inicio, fin]: el mismo DataFrame que ingerir_*(api_post_por_dia(...)).
+    La sesión guarda por (tipo, grupo, conjunto de terids) la ventana de días ya
+    cargada; un rango dentro de ella se rebana sin volver a CEIBA ni a la
+    ingesta, y solo los días fuera de ella (antes o después) se piden y se
+    pegan. Retorna None si CEIBA falló.
+    """
+    resultado = datos_y_cierre(tipo, groupid, terids, inicio, fin, ttl_hoy)
+    return None if resultado is None else resultado[0]
+
+
+@inst.medir("ventanas.datos")
+def datos_y_cierre(
+        tipo: str,
+        groupid,
+        terids: list,
+        inicio: date,
+        fin: date,
+        ttl_hoy: float = cbc.TTL_HOY,
+):
+    """
+    Igual que datos(), pero retorna (DataFrame, cerrado_hasta): el último día
+    cuyos datos se pidieron a CEIBA después de que terminó, es decir, que ya no
+    van a cambiar. Los días posteriores pueden estar incompletos.
+    Retorna None si CEIBA falló.
+    """
+    endpoint, ingerir = _TIPOS[tipo]
+    campo = cbc.CAMPO_DIA[endpoint]
+    terids = frozenset(str(t) for t in terids)
+    llave = (tipo, str(groupid), terids)
+    guardadas = st.session_state.setdefault("_ventanas", {})
+
+    #Sacamos la ventana para volver a ponerla al final (la más reciente)
+    ventana = _vigente(guardadas.pop(llave, None), ttl_hoy)
+    if ventana is None or not ventana.cubre(inicio, fin):
+        rebanada = _de_otra_ventana(guardadas, tipo, str(groupid), terids, inicio, fin, ttl_hoy)
+        if rebanada is not None:
+            if ventana is not None:
+                guardadas[llave] = ventana
+            met.cache("ventanas", hits=1)
+            return rebanada
+
+    #Una ventana que no toca el rango pedido se reemplaza (nunca se guardan huecos)
+    if ventana is not None and (ventana.fin + _UN_DIA < inicio or fin + _UN_DIA < ventana.inicio):
+        ventana = None
+
+    if ventana is None:
+        tramos = [(inicio, fin)]
+    else:
+        tramos = [(a, b) for a, b in ((inicio, ventana.inicio - _UN_DIA), (ventana.fin + _UN_DIA, fin)) if a <= b]
+    met.cache("ventanas", hits=not tramos, misses=bool(tramos))
+
+    antes, despues = [], []
+    pedido_en = time.time()
+    for a, b in tramos:
+        ok, payload, err = cbc.api_post_por_dia(endpoint, sorted(terids), a, b, groupid=groupid, ttl_hoy=ttl_hoy)
+        if not ok:
+            if ventana is not None:
+                guardadas[llave] = ventana
+            return None
+        pieza = ingerir(payload.get("data"))
+        (despues if ventana is not None and a > ventana.fin else antes).append(pieza)
+
+    if tramos:
+        medio = [ventana.datos] if ventana is not None else []
+        #Si la ventana guardada tenía días aún abiertos, su carga sigue siendo la más vieja
+        cargada_en = pedido_en if ventana is None or _cerrada(ventana) else ventana.cargada_en
+        ventana = Ventana.armar(
+            campo,
+            min(inicio, ventana.inicio) if ventana is not None else inicio,
+            max(fin, ventana.fin) if ventana is not None else fin,
+            antes + medio + despues,
+            cargada_en,
+        )
+
+    guardadas[llave] = ventana
+    while len(guardadas) > MAX_VENTANAS:
+        del guardadas[next(iter(guardadas))]
+    return ventana.rebanar(inicio, fin), _cerrado_hasta(ventana)